@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: api.py
+"""
+API JSON de vérification des références
+
+Application Bottle montée sous /api/ par app.py et gunicorn_app.py:
+
+    POST /api/references
+    GET /api/references/<id>
+
+Le document est envoyé en multipart/form-data (champ upload), directement dans le corps
+de la requête (avec ?filename=) ou le texte brut en JSON ({"text": "..."}) ou dans le champ text.
+Options (JSON, formulaire ou paramètres de l'URL): codes, pattern_format, past, future.
+
+Comme pour le formulaire du site, la vérification est exécutée hors de la requête
+par la file des analyses (jobs.py): la réponse est 202 {"id", "status", "url"},
+et GET /api/references/<id> renvoie {"id", "status", "references": nombre de références
+détectées, "progress", "total", "error", "results": [...]}.
+Avec ?format=ndjson ou l'en-tête Accept: application/x-ndjson, chaque résultat est envoyé
+sur une ligne dès que l'article est vérifié, pendant au plus JOB_STREAM_DURATION secondes:
+si l'analyse n'est pas terminée, la dernière ligne {"id", "status", "next"} donne l'adresse
+de la suite des résultats. Chaque résultat suit le schéma RESULT_FIELDS.
+
+La vérification d'un ensemble de documents (batch.py) est uniquement disponible en ligne de
+commande: elle occupe un pool de processus le temps de l'analyse du corpus.
+"""
+
+import datetime
+import json
+from bottle import Bottle, request, response
+from code_references import CODE_REFERENCE
+import jobs
+from jobs import QueueFullError, ensure_workers, get_job_queue, iter_job_events
+from parsing import DOCUMENT_ERRORS, check_document, get_doc_extension
+
+PATTERN_FORMATS = ("article_code", "code_article")
+NDJSON = "application/x-ndjson"
+# Schéma d'un résultat
+RESULT_FIELDS = (
+    "code",  # le code (version abbréviée) eg. CCIV
+    "code_name",  # le nom du code eg. Code civil
+    "article",  # le numéro de l'article normalisé eg. 1240
+    "occurrences",  # le nombre de références à l'article dans le document
+    "status_code",  # 204 pas de modification, 301 modifié, 302 bientôt abrogé, 404 introuvable, 408 délai dépassé
+    "status",  # le statut en toutes lettres
+    "id",  # l'identifiant Légifrance (LEGIARTI...) ou null
+    "url",  # l'adresse de l'article sur Légifrance
+    "text",  # le texte de l'article
+    "start_date",  # début de la version en vigueur (YYYY-MM-DD) ou null
+    "end_date",  # fin de la version en vigueur (YYYY-MM-DD) ou null
+)
+
+api = Bottle()
+
+
+class InputError(ValueError):
+    """Requête incorrecte: réponse HTTP 400"""
+
+
+def to_iso_date(date_str):
+    """Date 'dd/mm/YYYY' de request_api => 'YYYY-MM-DD' (None si absente)"""
+    if not date_str:
+        return None
+    return datetime.datetime.strptime(date_str, "%d/%m/%Y").date().isoformat()
+
+
+def format_result(reference, article):
+    """
+    Le résultat d'un article au format de l'API
+
+    Arguments
+    ---------
+    reference: list
+        la référence détectée [short_code, code_name, art_num]
+    article: dict
+        l'article vérifié par l'analyse (voir jobs.run_job)
+    Returns
+    -------
+    result: dict
+        les champs RESULT_FIELDS
+    """
+    return {
+        "code": reference[0],
+        "code_name": reference[1],
+        "article": reference[2],
+        "occurrences": article["occurrences"],
+        "status_code": article["status_code"],
+        "status": article["status"],
+        "id": article.get("id"),
+        "url": article["url"],
+        "text": article["texte"],
+        "start_date": to_iso_date(article["date_debut"]),
+        "end_date": to_iso_date(article["date_fin"]),
+    }
+
+
+def get_options(values):
+    """
+    Les options de la vérification
+
+    Arguments
+    ---------
+    values: dict
+        le corps JSON, le formulaire ou les paramètres de l'URL
+    Returns
+    -------
+    options: dict
+        selected_codes, pattern_format, past, future
+    Raises
+    ------
+    InputError:
+        option incorrecte
+    """
+    codes = values.get("codes") or None
+    if isinstance(codes, str):
+        codes = [code.strip() for code in codes.split(",") if code.strip()]
+    elif codes is not None and not (
+        isinstance(codes, list) and all(isinstance(code, str) for code in codes)
+    ):
+        raise InputError("codes: une liste de codes ou une chaîne eg. CCIV,CPEN")
+    unknown = [code for code in codes or [] if code not in CODE_REFERENCE]
+    if unknown:
+        raise InputError(f"Codes inconnus: {', '.join(unknown)}")
+    pattern_format = values.get("pattern_format") or "article_code"
+    if pattern_format not in PATTERN_FORMATS:
+        raise InputError(f"pattern_format: choisir entre {' ou '.join(PATTERN_FORMATS)}")
+    try:
+        past = int(values.get("past", 3))
+        future = int(values.get("future", 3))
+    except (TypeError, ValueError):
+        raise InputError("past et future doivent être des nombres d'années")
+    return {
+        "selected_codes": codes or None,
+        "pattern_format": pattern_format,
+        "past": past,
+        "future": future,
+    }
+
+
+def get_request_document():
+    """
+    Le document ou le texte envoyé, à placer dans la file des analyses
+
+    Returns
+    -------
+    document: bytes
+        le contenu du document, ou le texte encodé en UTF-8
+    filename: str
+        le nom du document (None pour un texte)
+    options: dict
+        les options de la vérification (voir get_options), text pour un texte
+    Raises
+    ------
+    InputError:
+        requête incorrecte, document illisible
+    """
+    content_type = request.content_type.split(";")[0].strip()
+    values = dict(request.query)
+    document = filename = text = None
+    if content_type == "application/json":
+        try:
+            body = request.json
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            raise InputError("Le corps de la requête doit être un objet JSON")
+        values.update(body)
+        text = body.get("text")
+    elif content_type in ("multipart/form-data", "application/x-www-form-urlencoded"):
+        values.update(request.forms)
+        upload = request.files.get("upload")
+        if upload is not None:
+            document, filename = upload.file, upload.filename
+        else:
+            text = request.forms.getunicode("text")
+    else:
+        # le document directement dans le corps de la requête
+        document, filename = request.body, request.query.get("filename")
+        if not filename:
+            raise InputError("Paramètre filename manquant")
+    options = get_options(values)
+    if text is not None:
+        if not isinstance(text, str):
+            raise InputError("text: le texte doit être une chaîne de caractères")
+        return text.encode("utf-8"), None, dict(options, text=True)
+    if document is None:
+        raise InputError("Envoyer un document (champ upload) ou un texte (champ text)")
+    try:
+        get_doc_extension(document, filename)
+    except ValueError as e:
+        raise InputError(str(e))
+    content = document.read()
+    try:
+        check_document(content, filename)
+    except DOCUMENT_ERRORS as e:
+        raise InputError(f"Document illisible: {str(e) or e.__class__.__name__}")
+    return content, filename, options
+
+
+def wants_ndjson():
+    return request.query.get("format") == "ndjson" or NDJSON in request.headers.get("Accept", "")
+
+
+def get_job_url(job_id):
+    return f"/api/references/{job_id}"
+
+
+def iter_ndjson(job_id, last_event_id=-1, queue=None, max_duration=None):
+    """
+    Un résultat JSON par ligne, au fil de l'analyse
+
+    Arguments
+    ---------
+    job_id: str
+        l'identifiant de l'analyse
+    last_event_id: int
+        le dernier évènement reçu par le client. Default to -1: tous les résultats
+    queue: JobQueue
+        la file des analyses. Default to get_job_queue()
+    max_duration: float
+        durée maximum du flux en secondes. Default to JOB_STREAM_DURATION
+    Yields
+    ------
+    line: str
+        chaque résultat; une erreur de l'analyse est la dernière ligne {"error"},
+        une analyse non terminée au bout de max_duration la ligne {"id", "status", "next"}
+    """
+    queue = queue or get_job_queue()
+    if max_duration is None:
+        max_duration = jobs.JOB_STREAM_DURATION
+    # pas de ligne vide pour garder la connexion: le flux est borné par max_duration
+    events = iter_job_events(
+        job_id, last_event_id, queue, keepalive=float("inf"), max_duration=max_duration
+    )
+    for event in events:
+        last_event_id = event["id"]
+        data = event["data"]
+        if event["event"] == "article":
+            line = format_result(data["reference"], data["article"])
+        elif event["event"] == "finished" and data["error"]:
+            line = {"error": data["error"]}
+        else:
+            continue
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+    status = queue.status(job_id)
+    if status in ("queued", "running"):
+        line = {
+            "id": job_id,
+            "status": status,
+            "next": f"{get_job_url(job_id)}?format=ndjson&last_event_id={last_event_id}",
+        }
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+
+
+@api.route("/references", method="POST")
+def references():
+    try:
+        document, filename, options = get_request_document()
+    except InputError as e:
+        response.status = 400
+        return {"error": str(e)}
+    try:
+        job_id = get_job_queue().submit(document, filename, options)
+    except QueueFullError:
+        response.status = 503
+        response.set_header("Retry-After", "30")
+        return {"error": "Trop d'analyses en attente, réessayez dans quelques instants"}
+    ensure_workers()
+    response.set_header("Location", get_job_url(job_id))
+    if wants_ndjson():
+        response.content_type = NDJSON
+        return iter_ndjson(job_id)
+    response.status = 202
+    return {"id": job_id, "status": "queued", "url": get_job_url(job_id)}
+
+
+@api.route("/references/<job_id>")
+def job_references(job_id):
+    queue = get_job_queue()
+    if queue.status(job_id) is None:
+        response.status = 404
+        return {"error": f"Analyse {job_id} inconnue"}
+    if wants_ndjson():
+        try:
+            last_event_id = int(request.query.get("last_event_id") or -1)
+        except ValueError:
+            response.status = 400
+            return {"error": "last_event_id incorrect"}
+        response.content_type = NDJSON
+        return iter_ndjson(job_id, last_event_id, queue)
+    job = queue.get(job_id)
+    nb_references = [
+        event["data"]["references"]
+        for event in queue.events(job_id)
+        if event["event"] == "references"
+    ]
+    return {
+        "id": job_id,
+        "status": job["status"],
+        "references": nb_references[0] if nb_references else None,
+        "progress": job["progress"],
+        "total": job["total"],
+        "error": job["error"],
+        "results": [format_result(r["reference"], r["article"]) for r in job["results"]],
+    }
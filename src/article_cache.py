@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: article_cache.py
+"""
+Module de cache des articles Légifrance
+
+- MemoryCache: cache LRU en mémoire, propre à chaque processus
+- SQLiteCache: cache sur disque partagé entre les workers gunicorn
+- get_cache/set_cache: le cache utilisé par request_api
+
+Chaque entrée est indexée par (code, numéro d'article, date de version),
+expire après `ttl` secondes et les entrées les moins récemment utilisées
+sont supprimées au delà de `max_size` entrées.
+
+Usage en ligne de commande (avec ARTICLE_CACHE=sqlite):
+
+    python article_cache.py stats
+    python article_cache.py purge [--expired]
+    python article_cache.py warm references.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Valeur renvoyée par get() quand la clé est absente ou expirée
+MISSING = object()
+
+ARTICLE_CACHE = os.getenv("ARTICLE_CACHE", "memory")
+ARTICLE_CACHE_PATH = os.getenv(
+    "ARTICLE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "article_cache.db"),
+)
+ARTICLE_CACHE_SIZE = int(os.getenv("ARTICLE_CACHE_SIZE", 10000))
+ARTICLE_CACHE_TTL = float(os.getenv("ARTICLE_CACHE_TTL", 24 * 3600))
+
+
+def make_key(*parts):
+    """
+    Construire la clé du cache
+
+    Arguments
+    ---------
+    *parts: str
+        les éléments de la clé eg. ("uid", "CCIV", "1240", "2022-11-24")
+    Returns
+    --------
+    key: str
+        la clé sous forme de chaîne
+    """
+    return "|".join(str(p) for p in parts)
+
+
+class MemoryCache:
+    """
+    Cache LRU en mémoire
+
+    Arguments
+    ---------
+    max_size: int
+        nombre maximum d'entrées
+    ttl: float
+        durée de vie d'une entrée en secondes
+    """
+
+    def __init__(self, max_size=ARTICLE_CACHE_SIZE, ttl=ARTICLE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def purge(self, expired_only=False):
+        with self._lock:
+            if not expired_only:
+                self._entries.clear()
+                return
+            now = time.time()
+            for key in [k for k, v in self._entries.items() if v[1] < now]:
+                del self._entries[key]
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SQLiteCache:
+    """
+    Cache sur disque dans une base SQLite, partagé entre les processus
+
+    Arguments
+    ---------
+    db_path: str
+        chemin de la base SQLite
+    max_size: int
+        nombre maximum d'entrées
+    ttl: float
+        durée de vie d'une entrée en secondes
+    """
+
+    def __init__(self, db_path=ARTICLE_CACHE_PATH, max_size=ARTICLE_CACHE_SIZE, ttl=ARTICLE_CACHE_TTL):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS article_cache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, last_access REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS article_cache_access "
+                "ON article_cache (last_access)"
+            )
+
+    def _connect(self):
+        # une connexion par thread et par processus (fork des workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM article_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < now:
+            self.misses += 1
+            return MISSING
+        with conn:
+            conn.execute(
+                "UPDATE article_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO article_cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            conn.execute(
+                "DELETE FROM article_cache WHERE key IN ("
+                "SELECT key FROM article_cache ORDER BY last_access DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def purge(self, expired_only=False):
+        conn = self._connect()
+        with conn:
+            if expired_only:
+                conn.execute(
+                    "DELETE FROM article_cache WHERE expires_at < ?", (time.time(),)
+                )
+            else:
+                conn.execute("DELETE FROM article_cache")
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM article_cache").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.db_path,
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class NoCache:
+    """
+    Cache désactivé: aucune entrée n'est conservée
+    """
+
+    hits = 0
+    misses = 0
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def purge(self, expired_only=False):
+        pass
+
+    def stats(self):
+        return {"backend": "none", "size": 0, "hits": 0, "misses": 0}
+
+
+CACHE_BACKENDS = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "none": NoCache,
+}
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """
+    Renvoie le cache configuré par la variable d'environnement ARTICLE_CACHE
+    (memory, sqlite ou none)
+
+    Returns
+    -------
+    cache: MemoryCache, SQLiteCache ou NoCache
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = CACHE_BACKENDS[ARTICLE_CACHE]()
+            except KeyError:
+                raise ValueError(
+                    f"Wrong cache backend `{ARTICLE_CACHE}`: choose between {', '.join(CACHE_BACKENDS)}"
+                )
+        return _CACHE
+
+
+def set_cache(cache):
+    """
+    Remplacer le cache utilisé par request_api
+
+    Arguments
+    ---------
+    cache: MemoryCache, SQLiteCache ou NoCache
+        le nouveau cache. None pour revenir à la configuration par défaut
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        _CACHE = cache
+
+
+def warm_cache(references_file, client_id, client_secret):
+    """
+    Pré-remplir le cache à partir d'un fichier CSV code,article
+
+    Arguments
+    ---------
+    references_file: str
+        chemin du fichier CSV (une référence par ligne: CCIV,1240)
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+    Returns
+    -------
+    count: int
+        nombre de références chargées
+    """
+    from request_api import get_article
+
+    count = 0
+    with open(references_file, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            get_article(row[0].strip(), row[1].strip(), client_id, client_secret)
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gestion du cache des articles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="afficher la taille du cache")
+    purge = subparsers.add_parser("purge", help="vider le cache")
+    purge.add_argument(
+        "--expired", action="store_true", help="supprimer seulement les entrées expirées"
+    )
+    warm = subparsers.add_parser("warm", help="pré-remplir le cache")
+    warm.add_argument("references", help="fichier CSV code,article")
+    args = parser.parse_args(argv)
+
+    cache = get_cache()
+    if args.command == "purge":
+        cache.purge(expired_only=args.expired)
+    elif args.command == "warm":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        count = warm_cache(args.references, os.getenv("API_KEY"), os.getenv("API_SECRET"))
+        print(f"{count} références chargées")
+    print(json.dumps(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
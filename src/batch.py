@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: batch.py
+"""
+Module de vérification d'un ensemble de documents
+
+Une archive zip ou un répertoire de documents (odt, docx, doc, pdf) est vérifié en une fois:
+
+- les documents sont lus et analysés en parallèle par un pool de processus (BATCH_WORKERS)
+- les références de tout le corpus sont dédoublonnées puis résolues une seule fois
+  (request_api.get_articles, recherches groupées par code)
+- le rapport donne les résultats de chaque document, le résultat de chaque article pour tout
+  le corpus avec les documents qui le citent, et le débit (documents par minute)
+
+Usage en ligne de commande:
+
+    python batch.py contrats.zip [--codes CCIV,CCONSO] [--workers 4] [--output rapport.json]
+    python batch.py repertoire/
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from api import format_result
+from document_cache import get_document_references
+from matching import get_unique_references
+from parsing import ACCEPTED_EXTENSIONS
+from request_api import get_articles
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1))
+# Taille maximum d'un document de l'archive en octets
+BATCH_MAX_DOCUMENT_SIZE = int(os.getenv("BATCH_MAX_DOCUMENT_SIZE", 50 * 1024 * 1024))
+
+
+def is_document(name):
+    """Le fichier est-il un document à vérifier (et pas un fichier caché ou de métadonnées) ?"""
+    basename = os.path.basename(name)
+    return (
+        not basename.startswith(".")
+        and "__MACOSX" not in name.split("/")
+        and basename.rsplit(".", 1)[-1].lower() in ACCEPTED_EXTENSIONS
+    )
+
+
+def iter_batch_documents(source):
+    """
+    Les documents d'une archive zip ou d'un répertoire
+
+    Arguments
+    ---------
+    source: str, bytes or file
+        chemin de l'archive ou du répertoire, ou contenu de l'archive
+    Yields
+    ------
+    name, document: tuple
+        le nom du document (chemin relatif) et son contenu (archive) ou son chemin (répertoire)
+    Raises
+    ------
+    ValueError:
+        la source n'est ni un répertoire ni une archive zip
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, source).replace(os.sep, "/")
+                if is_document(name):
+                    yield name, path
+        return
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(bytes(source))
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise ValueError("Le fichier n'est pas une archive zip")
+    with archive:
+        for member in archive.infolist():
+            if member.is_dir() or not is_document(member.filename):
+                continue
+            if member.file_size > BATCH_MAX_DOCUMENT_SIZE:
+                yield member.filename, None
+                continue
+            yield member.filename, archive.read(member)
+
+
+def extract_references(name, document, selected_codes=None, pattern_format="article_code"):
+    """
+    Les références détectées dans un document (exécuté dans un processus du pool)
+
+    Arguments
+    ---------
+    name: str
+        le nom du document
+    document: str or bytes
+        le chemin du document (il n'est pas supprimé) ou son contenu
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    Returns
+    -------
+    name, references, error: tuple
+        les références détectées [short_code, code_name, art_num]
+        et le message d'erreur si le document n'a pas pu être lu
+    """
+    try:
+        if document is None:
+            raise ValueError(f"Document trop volumineux (plus de {BATCH_MAX_DOCUMENT_SIZE} octets)")
+        if isinstance(document, (str, os.PathLike)):
+            with open(document, "rb") as f:
+                document = f.read()
+        references = get_document_references(
+            document, selected_codes, pattern_format, os.path.basename(name)
+        )
+    except Exception as e:
+        return name, [], str(e) or e.__class__.__name__
+    return name, references, None
+
+
+def iter_extracted_references(
+    documents, selected_codes=None, pattern_format="article_code", workers=BATCH_WORKERS
+):
+    """
+    Analyser les documents en parallèle
+
+    Au plus 2 documents par processus sont en attente: une grande archive n'est pas
+    chargée entièrement en mémoire. Sans processus disponibles (workers <= 1, processus
+    démon ou pool indisponible), les documents sont analysés dans le processus courant;
+    si le pool s'arrête en cours d'analyse, les documents en attente sont analysés à nouveau.
+
+    Arguments
+    ---------
+    documents: iterable
+        (name, document) comme renvoyés par iter_batch_documents
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    workers: int
+        nombre de processus
+    Yields
+    ------
+    name, references, error: tuple
+        pour chaque document, dans l'ordre où leur analyse se termine
+    """
+    documents = iter(documents)
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        # document de chaque analyse en attente: relancé si le pool s'arrête
+        pending = {}
+        unsubmitted = None
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for name, document in documents:
+                    unsubmitted = name, document
+                    future = executor.submit(
+                        extract_references, name, document, selected_codes, pattern_format
+                    )
+                    pending[future] = unsubmitted
+                    unsubmitted = None
+                    if len(pending) >= 2 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            result = future.result()
+                            del pending[future]
+                            yield result
+                for future in as_completed(list(pending)):
+                    result = future.result()
+                    del pending[future]
+                    yield result
+            return
+        except (BrokenProcessPool, OSError):
+            # pool indisponible (environnement sans fork, ressources, processus arrêté):
+            # les documents en attente puis les suivants sont analysés dans ce processus
+            pass
+        retried = list(pending.values()) + ([unsubmitted] if unsubmitted else [])
+        for name, document in retried:
+            yield extract_references(name, document, selected_codes, pattern_format)
+    for name, document in documents:
+        yield extract_references(name, document, selected_codes, pattern_format)
+
+
+def run_batch(
+    source,
+    selected_codes=None,
+    pattern_format="article_code",
+    past=3,
+    future=3,
+    workers=None,
+):
+    """
+    Vérifier tous les documents d'une archive zip ou d'un répertoire
+
+    Arguments
+    ---------
+    source: str, bytes or file
+        chemin de l'archive ou du répertoire, ou contenu de l'archive
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    past: int
+        nombre d'années dans le passé
+    future: int
+        nombre d'années dans le futur
+    workers: int
+        nombre de processus pour l'analyse des documents (BATCH_WORKERS par défaut)
+    Returns
+    -------
+    report: dict
+        {
+            "documents": [{"name", "references", "error", "results"}, ...] par nom de document,
+            "articles": résultat de chaque article pour tout le corpus (avec "documents": ses noms),
+            "stats": nombre de documents, de références, d'appels à Légifrance (et estimation
+                des appels économisés), durées et débit
+        }
+    """
+    load_dotenv()
+    if workers is None:
+        workers = BATCH_WORKERS
+    start = time.perf_counter()
+    extracted = sorted(
+        iter_extracted_references(
+            iter_batch_documents(source), selected_codes, pattern_format, workers
+        )
+    )
+    parse_seconds = time.perf_counter() - start
+    # une seule résolution par article pour tout le corpus
+    corpus_references = [ref for _, references, _ in extracted for ref in references]
+    unique_references, occurrences = get_unique_references(corpus_references)
+    articles, api_stats = get_articles(
+        [(ref[0], ref[2]) for ref in unique_references],
+        os.getenv("API_KEY"),
+        os.getenv("API_SECRET"),
+        past,
+        future,
+    )
+    citing = {}
+    documents = []
+    for name, references, error in extracted:
+        doc_references, doc_occurrences = get_unique_references(references)
+        results = []
+        for reference in doc_references:
+            key = (reference[0], reference[2])
+            citing.setdefault(key, []).append(name)
+            article = dict(articles[key], occurrences=doc_occurrences[key])
+            results.append(format_result(reference, article))
+        documents.append(
+            {"name": name, "references": len(references), "error": error, "results": results}
+        )
+    aggregate = []
+    for reference in unique_references:
+        key = (reference[0], reference[2])
+        result = format_result(reference, dict(articles[key], occurrences=occurrences[key]))
+        result["documents"] = citing[key]
+        aggregate.append(result)
+    seconds = time.perf_counter() - start
+    return {
+        "documents": documents,
+        "articles": aggregate,
+        "stats": {
+            "documents": len(documents),
+            "failed": len([doc for doc in documents if doc["error"]]),
+            "references": len(corpus_references),
+            "unique_references": len(unique_references),
+            "http_calls": api_stats.get("http_calls"),
+            "estimated_saved_calls": api_stats.get("estimated_saved_calls"),
+            "parse_seconds": round(parse_seconds, 3),
+            "seconds": round(seconds, 3),
+            "documents_per_minute": round(len(documents) * 60 / seconds, 1) if seconds else None,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérification d'un ensemble de documents")
+    parser.add_argument("source", help="archive zip ou répertoire de documents")
+    parser.add_argument("--codes", help="codes à détecter, séparés par des virgules eg. CCIV,CPEN")
+    parser.add_argument(
+        "--format", default="article_code", choices=["article_code", "code_article"]
+    )
+    parser.add_argument("--past", type=int, default=3, help="nombre d'années dans le passé")
+    parser.add_argument("--future", type=int, default=3, help="nombre d'années dans le futur")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--output", help="fichier JSON du rapport complet")
+    args = parser.parse_args()
+    report = run_batch(
+        args.source,
+        args.codes.split(",") if args.codes else None,
+        args.format,
+        args.past,
+        args.future,
+        args.workers,
+    )
+    for document in report["documents"]:
+        summary = document["error"] or (
+            f"{document['references']} références, {len(document['results'])} articles"
+        )
+        print(f"{document['name']}: {summary}")
+    for article in report["articles"]:
+        print(
+            f"{article['code']} {article['article']}: {article['status']} "
+            f"(x{article['occurrences']}, {len(article['documents'])} document(s))"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    stats = report["stats"]
+    print(
+        f"{stats['documents']} documents ({stats['failed']} en erreur), "
+        f"{stats['references']} références, {stats['unique_references']} articles distincts, "
+        f"{stats['seconds']} s: {stats['documents_per_minute']} documents/min"
+    )
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: bench_matching.py
+"""
+Micro-benchmark de la détection des articles
+
+Compare la détection avec la regex des codes recompilée à chaque appel
+(ancienne version) et avec la regex compilée en cache, sur un grand texte
+synthétique et sur une suite de paragraphes analysés séparément.
+
+    python src/benchmarks/bench_matching.py [nb_repetitions]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from code_references import _compile_selected_codes
+from matching import get_code_refs
+
+SAMPLE = (
+    "Comme on peut le voir dans les articles L22-7 et R314-7 du CSI, "
+    "l'article L124-1 du Code de l'environnement et art. L214-4 du CJA. "
+    "La responsabilité est fondée sur l'article 1240 du Code civil. "
+    "Le texte n'en dit pas plus sur ce point. "
+)
+
+
+def detect_uncached(texts, selected_codes=None):
+    """La détection telle qu'avant: la regex est compilée à chaque appel"""
+    for text in texts:
+        _compile_selected_codes.cache_clear()
+        re.purge()
+        list(get_code_refs(text, selected_codes))
+
+
+def detect_cached(texts, selected_codes=None):
+    for text in texts:
+        list(get_code_refs(text, selected_codes))
+
+
+def bench(repetitions=2000, number=5):
+    selections = [None, ["CCIV", "CSI", "CENV", "CJA"]]
+    documents = {
+        "document": [SAMPLE * repetitions],
+        "paragraphes": [SAMPLE] * repetitions,
+    }
+    print(f"texte: {len(SAMPLE) * repetitions} caractères")
+    for doc_name, texts in documents.items():
+        for selected_codes in selections:
+            timings = {}
+            for name, fn in [("uncached", detect_uncached), ("cached", detect_cached)]:
+                timings[name] = (
+                    timeit.timeit(lambda: fn(texts, selected_codes), number=number)
+                    / number
+                )
+                print(
+                    f"{name:>9} {doc_name} codes={selected_codes}: {timings[name] * 1000:.1f} ms"
+                )
+            print(
+                f"{'gain':>9} {doc_name}: {(1 - timings['cached'] / timings['uncached']) * 100:.0f}%"
+            )
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: bench_normalize.py
+"""
+Benchmark de la normalisation des espaces
+
+Compare le pic de mémoire (tracemalloc) et la durée de la normalisation
+du texte complet (" ".join des blocs puis une expression régulière sur tout le texte,
+l'ancienne version de parse_doc) et de la normalisation bloc par bloc (parsing.write_normalized)
+sur des documents synthétiques de taille croissante.
+
+    python src/benchmarks/bench_normalize.py [nombre de paragraphes ...]
+"""
+
+import io
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from parsing import write_normalized
+
+SIZES = (10_000, 100_000, 500_000)
+# l'expression régulière de l'ancienne version de parse_doc
+OLD_WHITESPACE_REGEX = re.compile(r"\s{2,}|\r{1,}|\n{1,}|\t{1,}|\xa0{1,}")
+PARAGRAPH = (
+    "Vu l'article 1240  du Code civil,\tet l'article L. 121-14\xa0du Code de la consommation ;\n"
+)
+
+
+def iter_blocks(nb_paragraphs, seed=0):
+    """Des paragraphes d'environ 90 caractères, avec des espaces à normaliser en début et fin"""
+    rng = random.Random(seed)
+    for _ in range(nb_paragraphs):
+        yield " " * rng.randint(0, 2) + PARAGRAPH.replace("1240", str(rng.randint(1, 2500)))
+
+
+def join_then_sub(blocks):
+    # ancienne version de parse_doc
+    return OLD_WHITESPACE_REGEX.sub(" ", " ".join(list(blocks)))
+
+
+def per_block(blocks):
+    output = io.StringIO()
+    write_normalized(blocks, output)
+    return output.getvalue()
+
+
+def measure(normalize, nb_paragraphs):
+    """Les blocs sont produits pendant la mesure, comme à la lecture d'un document.
+    La durée est mesurée sans tracemalloc, qui ralentit chaque allocation"""
+    start = time.perf_counter()
+    text = normalize(iter_blocks(nb_paragraphs))
+    duration = time.perf_counter() - start
+    del text
+    tracemalloc.start()
+    text = normalize(iter_blocks(nb_paragraphs))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return text, peak, duration
+
+
+def bench(sizes=SIZES):
+    for nb_paragraphs in sizes:
+        expected, peak, duration = measure(join_then_sub, nb_paragraphs)
+        print(
+            f"{nb_paragraphs} paragraphes, {len(expected) / 1024 / 1024:.1f} M caractères\n"
+            f"{'join + sub':>12}: pic {peak / 1024 / 1024:.1f} Mo, {duration * 1000:.0f} ms"
+        )
+        text, peak, duration = measure(per_block, nb_paragraphs)
+        assert text == expected
+        print(f"{'par bloc':>12}: pic {peak / 1024 / 1024:.1f} Mo, {duration * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    bench([int(size) for size in sys.argv[1:]] or SIZES)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: bench_odt.py
+"""
+Benchmark mémoire de la lecture des documents ODT
+
+Compare le pic de mémoire (tracemalloc) et la durée de la lecture avec odfpy
+(arbre complet du document) et de la lecture en flux de content.xml (iterparse).
+
+    python src/benchmarks/bench_odt.py [document.odt]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import parsing
+
+DOCUMENT = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "tests", "documents", "HDR_NETTER_V1_07.odt")
+)
+
+
+def bench(file_path=DOCUMENT):
+    print(f"{os.path.basename(file_path)}: {os.path.getsize(file_path) / 1024:.0f} ko")
+    for backend, parser in parsing.PARSER_BACKENDS["odt"].items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        nb_paragraphs = 0
+        nb_chars = 0
+        for paragraph in parser(file_path):
+            nb_paragraphs += 1
+            nb_chars += len(paragraph)
+        duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{backend:>10}: pic {peak / 1024 / 1024:.1f} Mo, {duration * 1000:.0f} ms, "
+            f"{nb_paragraphs} paragraphes, {nb_chars} caractères"
+        )
+
+
+if __name__ == "__main__":
+    bench(sys.argv[1] if len(sys.argv) > 1 else DOCUMENT)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: bench_parsers.py
+"""
+Comparaison des bibliothèques d'extraction du texte
+
+Pour chaque document de src/tests/documents et chaque bibliothèque de son format
+(parsing.PARSER_BACKENDS): durée d'extraction, débit et rappel des références.
+Le rappel est mesuré par rapport aux références détectées (moteur scan)
+dans la version ODT du même document.
+
+    python src/benchmarks/bench_parsers.py [nb_repetitions]
+"""
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import parsing
+from matching import get_code_refs
+
+DOCUMENTS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "tests", "documents")
+)
+
+
+def get_references(full_text, doc_name):
+    """Les références (code, article) détectées dans le texte"""
+    # newtest: Article xxx du Code yyy, testnew: Code yyy Article xxx
+    pattern_format = "code_article" if doc_name.startswith("testnew") else "article_code"
+    return {
+        (code, art_num)
+        for code, _, art_num in get_code_refs(full_text, None, pattern_format, "scan")
+    }
+
+
+def parse(file_path, backend):
+    doc_ext = parsing.get_doc_extension(file_path)
+    return parsing.WHITESPACE_REGEX.sub(
+        " ", " ".join(parsing.iter_doc_blocks(file_path, doc_ext, remove=False, backend=backend))
+    )
+
+
+def bench(repetitions=3):
+    expected = {}
+    for file_path in sorted(glob.glob(os.path.join(DOCUMENTS_DIR, "*.odt"))):
+        doc_name = os.path.basename(file_path).split(".")[0]
+        expected[doc_name] = get_references(parse(file_path, "odfpy"), doc_name)
+    print(f"{'document':<28} {'backend':<16} {'ms':>8} {'ko/s':>8} {'rappel':>7}")
+    for file_path in sorted(glob.glob(os.path.join(DOCUMENTS_DIR, "*.*"))):
+        doc_name, doc_ext = os.path.basename(file_path).split(".")
+        if doc_ext not in parsing.ACCEPTED_EXTENSIONS:
+            continue
+        size = os.path.getsize(file_path) / 1024
+        for backend in parsing.PARSER_BACKENDS[doc_ext]:
+            try:
+                start = time.perf_counter()
+                for _ in range(repetitions):
+                    full_text = parse(file_path, backend)
+                duration = (time.perf_counter() - start) / repetitions
+            except Exception as e:
+                print(f"{doc_name + '.' + doc_ext:<28} {backend:<16} erreur: {type(e).__name__}")
+                continue
+            recall = ""
+            if expected.get(doc_name):
+                found = get_references(full_text, doc_name)
+                recall = f"{len(found & expected[doc_name]) / len(expected[doc_name]):.0%}"
+            print(
+                f"{doc_name + '.' + doc_ext:<28} {backend:<16} {duration * 1000:>8.1f} "
+                f"{size / duration:>8.0f} {recall:>7}"
+            )
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
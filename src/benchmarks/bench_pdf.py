@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: bench_pdf.py
+"""
+Benchmark de l'extraction du texte des PDF
+
+Construit un PDF de plusieurs pages à partir des PDF de test
+puis compare l'extraction en série et avec plusieurs processus.
+
+    python src/benchmarks/bench_pdf.py [nb_pages] [workers ...]
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PyPDF2 import PdfReader, PdfWriter
+import parsing
+
+TEST_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+
+def build_pdf(file_path, nb_pages):
+    """Un PDF de nb_pages pages copiées des PDF de test"""
+    pages = [
+        page
+        for pdf in sorted(glob.glob(os.path.join(TEST_DIR, "*.pdf")))
+        for page in PdfReader(pdf).pages
+    ]
+    writer = PdfWriter()
+    for i in range(nb_pages):
+        writer.add_page(pages[i % len(pages)])
+    with open(file_path, "wb") as f:
+        writer.write(f)
+
+
+def bench(nb_pages=200, workers_list=(1, 2, 4)):
+    print(f"{os.cpu_count()} CPU, {nb_pages} pages")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.pdf")
+        build_pdf(file_path, nb_pages)
+        reference = None
+        for workers in workers_list:
+            start = time.perf_counter()
+            pages = list(parsing.iter_pdf_pages(file_path, workers))
+            duration = time.perf_counter() - start
+            if reference is None:
+                reference = duration
+            assert len(pages) == nb_pages
+            print(
+                f"workers={workers}: {duration * 1000:.0f} ms "
+                f"({nb_pages / duration:.0f} pages/s, x{reference / duration:.2f})"
+            )
+
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        [int(w) for w in sys.argv[2:]] or (1, 2, 4),
+    )
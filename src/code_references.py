@@ -4,9 +4,12 @@
 Code references module:
 
 - Build regex for codes
+- Get the compiled regex for a selection of codes (cached)
 - Get name and abbreviation for codes
 
 """
+import functools
+import re
 from typing import Any, Tuple, Union
 
 CODE_REGEX = {
@@ -181,3 +184,37 @@ def get_selected_codes_regex(selected_codes: list) -> str:
 
 
 
+
+
+def get_selected_codes_pattern(selected_codes: list = None) -> re.Pattern:
+    """
+    Renvoyer l'expression régulière compilée pour les codes sélectionnés.
+    La compilation n'est faite qu'une fois par ensemble de codes:
+    la même sélection, quel que soit son ordre, renvoie le même objet.
+
+    Arguments
+    ---------
+    selected_codes: array
+        [short_code, ...]. Default: None (no filter)
+
+    Returns
+    ----------
+    pattern: re.Pattern
+        the compiled regex (case insensitive)
+    """
+    if selected_codes is None:
+        return _compile_selected_codes(None)
+    return _compile_selected_codes(frozenset(selected_codes))
+
+
+CODE_ORDER = {code: i for i, code in enumerate(CODE_REGEX)}
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_selected_codes(selected_codes: frozenset) -> re.Pattern:
+    if selected_codes is not None:
+        # ordre canonique: celui de CODE_REGEX
+        selected_codes = sorted(
+            selected_codes, key=lambda c: (CODE_ORDER.get(c, len(CODE_ORDER)), c)
+        )
+    return re.compile(get_selected_codes_regex(selected_codes), re.I)
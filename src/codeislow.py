@@ -1,22 +1,216 @@
 #!/usr/bin/env python
+"""
+Vérification des références aux articles de code d'un document
 
+En ligne de commande (voir cli):
+
+    python codeislow.py contrat.docx "dossier/**/*.pdf" --codes CCIV,CCONSO --format ndjson
+"""
+
+import argparse
+import csv
+import glob
+import json
 import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from parsing import parse_doc
-from matching import get_matching_result_item, get_matching_results_dict
-from request_api import get_article
+from document_cache import get_document_references, get_incremental_references
+from matching import (
+    get_matching_result_item,
+    get_matching_results_dict,
+    get_unique_references,
+)
+from article_cache import CACHE_BACKENDS, set_cache
+from request_api import get_article, new_article, set_article_timeout
+from result_templates import end_results, start_results, stream_results
+
+# Nombre maximum de requêtes Légifrance simultanées
+MAX_WORKERS = int(os.getenv("API_MAX_WORKERS", 8))
+# Délai maximum (en secondes) pour résoudre un article
+ARTICLE_TIMEOUT = float(os.getenv("API_ARTICLE_TIMEOUT", 60))
+
+
+def resolve_articles(
+    references,
+    client_id,
+    client_secret,
+    past=3,
+    future=3,
+    max_workers=MAX_WORKERS,
+    timeout=ARTICLE_TIMEOUT,
+    timer=None,
+):
+    """
+    Résoudre les articles détectés de manière concurrente
+
+    Au plus `max_workers` articles sont demandés en même temps à Légifrance.
+    Les résultats sont renvoyés dans l'ordre du document: un article qui
+    dépasse le délai `timeout` est renvoyé avec le status 408
+    sans bloquer les suivants. Le délai court à partir du moment où la requête
+    commence: un article en attente d'un thread libre (occupé par une requête
+    abandonnée, jusqu'aux délais HTTP de request_api) n'est pas compté en retard.
+
+    Arguments
+    ----------
+    references: iterable
+        les références détectées [short_code, code, article_nb]
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+    past: int
+        Nombre d'années en arrière à surveiller
+    future: int
+        Nombre d'années en avant à surveiller
+    max_workers: int
+        Nombre maximum de requêtes simultanées
+    timeout: float
+        Délai maximum en secondes pour chaque article
+    timer: callable
+        reçoit la durée du calcul de validité de chaque article (voir get_article).
+        Default to None
+    Yields
+    ------
+    reference, article: tuple
+        la référence détectée et le dictionnaire de l'article
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = deque()
+    references = iter(references)
+
+    def submit(reference):
+        short_code, code, article_nb = reference
+        # début de la requête dans le thread
+        started = []
+
+        def run():
+            started.append(time.monotonic())
+            return get_article(
+                code,
+                article_nb,
+                client_id,
+                client_secret,
+                past_year_nb=past,
+                future_year_nb=future,
+                timer=timer,
+            )
+
+        in_flight.append((reference, executor.submit(run), started))
+
+    def wait_article(reference, future_article, started):
+        while True:
+            remaining = started[0] + timeout - time.monotonic() if started else timeout
+            try:
+                return future_article.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                if started and time.monotonic() >= started[0] + timeout:
+                    future_article.cancel()
+                    return set_article_timeout(new_article(reference[1], reference[2]))
+
+    try:
+        for reference in references:
+            submit(reference)
+            if len(in_flight) >= max_workers:
+                break
+        while in_flight:
+            reference, future_article, started = in_flight.popleft()
+            article = wait_article(reference, future_article, started)
+            next_reference = next(references, None)
+            if next_reference is not None:
+                submit(next_reference)
+            yield reference, article
+    finally:
+        for _, future_article, _ in in_flight:
+            future_article.cancel()
+        executor.shutdown(wait=False)
+
+
+def resolve_unique_articles(references, client_id, client_secret, past=3, future=3):
+    """
+    Résoudre une seule fois chaque référence distincte
+
+    Arguments
+    ----------
+    references: iterable
+        les références détectées [short_code, code, article_nb]
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+    past: int
+        Nombre d'années en arrière à surveiller
+    future: int
+        Nombre d'années en avant à surveiller
+    Yields
+    ------
+    reference, article: tuple
+        la première occurrence de la référence et l'article
+        avec son nombre d'occurrences dans le document
+    """
+    unique_references, occurrences = get_unique_references(references)
+    for reference, article in resolve_articles(
+        unique_references, client_id, client_secret, past, future
+    ):
+        article["occurrences"] = occurrences[(reference[0], reference[2])]
+        yield reference, article
+
+
+def resolve_references(references, client_id, client_secret, past=3, future=3):
+    """
+    Résoudre les références en ne demandant qu'une fois chaque article à Légifrance
+    puis en renvoyant le résultat pour chacune de ses occurrences
+
+    Arguments
+    ----------
+    references: iterable
+        les références détectées [short_code, code, article_nb]
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+    past: int
+        Nombre d'années en arrière à surveiller
+    future: int
+        Nombre d'années en avant à surveiller
+    Yields
+    ------
+    reference, article: tuple
+        chaque occurrence dans l'ordre du document et une copie de l'article
+    """
+    references = list(references)
+    resolved = {}
+    unique_results = resolve_unique_articles(
+        references, client_id, client_secret, past, future
+    )
+    for reference in references:
+        key = (reference[0], reference[2])
+        while key not in resolved:
+            unique_reference, article = next(unique_results)
+            resolved[(unique_reference[0], unique_reference[2])] = article
+        yield reference, dict(resolved[key])
 
 
 def main_result_sorted(
-    file_path, selected_codes=None, pattern_format="article_code", past=3, future=3
+    file_path,
+    selected_codes=None,
+    pattern_format="article_code",
+    past=3,
+    future=3,
+    filename=None,
 ):
     """
     Version initiale de présentation des résultats: un dictionnaire trié par code et ses articles associés
 
     Arguments
     ----------
-    file_path: str
-        nom du fichier chargé
+    file_path: str, bytes or file
+        nom du fichier chargé ou son contenu
     selected_codes: array
         liste des codes selectionnés
     pattern_format: str
@@ -25,9 +219,11 @@ def main_result_sorted(
         Nombre d'années en arrière à surveiller
     future: int
         Nombre d'années en avant à surveiller
+    filename: str
+        nom du document quand file_path est son contenu
     """
     # parse
-    full_text = parse_doc(file_path)
+    full_text = parse_doc(file_path, filename=filename)
     results_dict = get_matching_results_dict(full_text, selected_codes, pattern_format)
     if len(results_dict) == 0:
         raise ValueError("ERREUR: pas d'article detecté....")
@@ -36,15 +232,20 @@ def main_result_sorted(
 
 
 def main(
-    file_path, selected_codes=None, pattern_format="article_code", past=3, future=3
+    file_path,
+    selected_codes=None,
+    pattern_format="article_code",
+    past=3,
+    future=3,
+    filename=None,
 ):
     """
     Version 'brute' sans renvoi de HTML
 
     Arguments
     ----------
-    file_path: str
-        nom du fichier chargé
+    file_path: str, bytes or file
+        nom du fichier chargé ou son contenu
     selected_codes: array
         liste des codes selectionnés
     pattern_format: str
@@ -53,45 +254,106 @@ def main(
         Nombre d'années en arrière à surveiller
     future: int
         Nombre d'années en avant à surveiller
+    filename: str
+        nom du document quand file_path est son contenu
     """
     load_dotenv()
 
     client_id = os.getenv("API_KEY")
     client_secret = os.getenv("API_SECRET")
-    # parse
-    full_text = parse_doc(file_path)
+    # parse (ou références déjà connues pour ce document)
     # matching_results = yield from get_matching_result_item(full_text,selected_codes, pattern_format)
     results = []
-    for short_code, code, article_nb in get_matching_result_item(
-        full_text, selected_codes, pattern_format
+    references = get_document_references(
+        file_path, selected_codes, pattern_format, filename
+    )
+    # request and check validity
+    for _, article in resolve_references(
+        references, client_id, client_secret, past, future
     ):
-        # request and check validity
-        # article = get_article(code, article_nb, client_id, client_secret, past_year_nb=past, future_year_nb=future)
-        # print(article)
-        article = get_article(
-            code,
-            article_nb,
-            client_id,
-            client_secret,
-            past_year_nb=past,
-            future_year_nb=future,
-        )
         results.append(article)
         yield article
     if len(results) == 0:
         raise ValueError("ERROR: pas d'article detecté....")
 
 
+WRONG_ROW = """
+        <tr class="warning">
+            <th scope="row">ERROR</th>
+            <td>/td>
+            <td></td>
+            <td>Something went wrong</td>
+        <tr>
+        """
+
+
+def format_article_row(short_code, article):
+    """
+    Ligne HTML du résultat d'un article
+
+    Arguments
+    ---------
+    short_code: str
+        le code (version abbréviée)
+    article: dict
+        l'article renvoyé par resolve_unique_articles
+    Returns
+    -------
+    row: str
+        resultat sous forme de ligne d'une table HTML
+    """
+    return f"""
+            <tr>
+                <th scope="row"><a href='{article["url"]}'>{article["code"]} ({short_code}) - {article["article"]}</a> <span class="badge badge-light">x{article["occurrences"]}</span></th>
+                <td><span class="badge badge-pill badge-{article["color"]}">{article["status"]}</span></td>
+                <td>{article["texte"]}</td>
+                <td>{article["date_debut"]}-{article["date_fin"]}</td>
+            <tr>
+            """
+
+
+def format_changes_row(changes):
+    """
+    Ligne HTML des références ajoutées ou supprimées depuis la version précédente
+
+    Arguments
+    ---------
+    changes: dict
+        les changements renvoyés par get_incremental_references
+    Returns
+    -------
+    row: str
+        resultat sous forme de ligne d'une table HTML
+    """
+    added = ", ".join(f"{code} {num}" for code, num in changes["added"])
+    removed = ", ".join(f"{code} {num}" for code, num in changes["removed"])
+    return f"""
+            <tr class="info">
+                <th scope="row">Nouvelle version</th>
+                <td>{changes["changed"]}/{changes["paragraphs"]} paragraphe(s) modifié(s)</td>
+                <td>Ajouté(s): {added or "aucun"}<br>Supprimé(s): {removed or "aucun"}</td>
+                <td></td>
+            <tr>
+            """
+
+
 def load_result(
-    file_path, selected_codes=None, pattern_format="article_code", past=3, future=3
+    file_path,
+    selected_codes=None,
+    pattern_format="article_code",
+    past=3,
+    future=3,
+    filename=None,
+    incremental=False,
+    document_id=None,
 ):
     """
     Load result in HTML
 
     Arguments
     ---------
-    filepath: str
-        le chemin du fichier
+    filepath: str, bytes or file
+        le chemin du fichier ou son contenu
     selected_codes: array
         la liste des codes (version abbréviée) à détecter
     pattern_format: str
@@ -100,6 +362,13 @@ def load_result(
         nombre d'années dans le passé
     future: int
         nombre d'années dans le futur
+    filename: str
+        nom du document quand filepath est son contenu
+    incremental: bool
+        nouvelle version d'un document: seuls les paragraphes modifiés sont analysés
+        et les références ajoutées ou supprimées sont signalées
+    document_id: str
+        (incremental) l'identifiant du document propre à l'utilisateur (voir get_document_id)
     Yields
     ------
     html_results: str
@@ -108,41 +377,327 @@ def load_result(
     load_dotenv()
     client_id = os.getenv("API_KEY")
     client_secret = os.getenv("API_SECRET")
-    # parse
-    full_text = parse_doc(file_path)
-    _exhausted = object()
-    result_generator = get_matching_result_item(
-        full_text, selected_codes, pattern_format
-    )
-    if next(result_generator, _exhausted) is _exhausted:
-        wrong_row = f"""
-        <tr class="warning">
-            <th scope="row">ERROR</th>
-            <td>/td>
-            <td></td>
-            <td>Something went wrong</td>
-        <tr>
-        """
-        yield (wrong_row)
+    if incremental:
+        references, changes = get_incremental_references(
+            file_path, selected_codes, pattern_format, filename, document_id=document_id
+        )
+        if changes["previous"]:
+            yield format_changes_row(changes)
+    else:
+        # parse (ou références déjà connues pour ce document)
+        references = get_document_references(
+            file_path, selected_codes, pattern_format, filename
+        )
+    if len(references) == 0:
+        yield WRONG_ROW
     else:
-        for short_code, code, article_nb in get_matching_result_item(
-            full_text, selected_codes, pattern_format
+        # request and check validity
+        for (short_code, code, article_nb), article in resolve_unique_articles(
+            references, client_id, client_secret, past, future
         ):
-            # request and check validity
-            article = get_article(
-                code,
-                article_nb,
-                client_id,
-                client_secret,
-                past_year_nb=past,
-                future_year_nb=future,
-            )
-            row = f"""
-            <tr>
-                <th scope="row"><a href='{article["url"]}'>{article["code"]} ({short_code}) - {article["article"]}</a></th>
-                <td><span class="badge badge-pill badge-{article["color"]}">{article["status"]}</span></td>
-                <td>{article["texte"]}</td>
-                <td>{article["date_debut"]}-{article["date_fin"]}</td>
-            <tr>
-            """
-            yield (row)
+            yield format_article_row(short_code, article)
+
+
+def load_job_result(job):
+    """
+    Load the result of an analysis job in HTML
+
+    Arguments
+    ---------
+    job: dict
+        l'analyse renvoyée par jobs.JobQueue.get
+    Yields
+    ------
+    html_results: str
+        resultat sous forme de cellule d'une table HTML
+    """
+    if job["changes"] and job["changes"]["previous"]:
+        yield format_changes_row(job["changes"])
+    for result in job["results"]:
+        yield format_article_row(result["reference"][0], result["article"])
+    if job["status"] == "done" and job["total"] == 0:
+        yield WRONG_ROW
+
+
+def load_job_page(job):
+    """
+    La page de résultats d'une analyse (app.py et gunicorn_app.py)
+
+    Tant que l'analyse n'est pas terminée, la page reçoit la suite des résultats
+    par le flux d'évènements, à partir du dernier évènement affiché (job["last_event_id"]).
+
+    Arguments
+    ---------
+    job: dict
+        l'analyse renvoyée par jobs.JobQueue.get
+    Returns
+    -------
+    page: str
+        la page HTML
+    """
+    rows = [start_results, *load_job_result(job)]
+    if job["status"] in ("queued", "running"):
+        # la suite des résultats est reçue par le flux d'évènements de l'analyse
+        rows.append(
+            f"""
+        <div id="processing" class="alert alert-info" role="alert" data-events="/jobs/{job["id"]}/events?last_event_id={job["last_event_id"]}">
+            Traitement et détection des articles en cours...<br>
+            <span class="progress-text">{job["progress"]}/{job["total"] or "?"} article(s) vérifié(s)</span><br>
+            <noscript><a href="/results/{job["id"]}/">Actualiser</a></noscript>
+        </div>
+        """
+        )
+        rows.append(stream_results)
+    elif job["status"] == "failed":
+        rows.append(
+            f"""
+        <div class="alert alert-warning" role="alert">
+        <h2> Erreur</h2>
+        <p>Quelque chose s'est mal passé: <code>{job["error"]}</code>
+        <p> Contactez
+        <a href="#" class="alert-link">l'administrateur</a></p>
+        </div>
+        """
+        )
+    rows.append(end_results)
+    return "".join(rows)
+
+
+class Profile:
+    """
+    Durée cumulée de chaque étape (parse, match, resolve, validate) et nombre d'appels
+
+    add est passé comme timer à get_document_references et resolve_articles:
+    les étapes peuvent être mesurées depuis plusieurs threads (validate dans resolve_articles)
+    """
+
+    STAGES = ("parse", "match", "resolve", "validate")
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.calls = dict.fromkeys(self.STAGES, 0)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def report(self):
+        return "\n".join(
+            f"{stage:<9}{self.seconds[stage]:>9.3f} s {self.calls[stage]:>7} appels"
+            for stage in self.STAGES
+        )
+
+
+def iter_paths(patterns):
+    """
+    Les fichiers désignés par des chemins ou des motifs glob (** récursif)
+
+    Yields
+    ------
+    pattern, path: tuple
+        le motif et chaque fichier trouvé, path est None si aucun fichier ne correspond
+    """
+    for pattern in patterns:
+        paths = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        if not paths:
+            yield pattern, None
+        for path in paths:
+            yield pattern, path
+
+
+def iter_file_results(
+    path,
+    selected_codes=None,
+    pattern_format="article_code",
+    past=3,
+    future=3,
+    max_workers=MAX_WORKERS,
+    profile=None,
+):
+    """
+    Vérifier un fichier: un résultat par article dès qu'il est vérifié
+
+    Arguments
+    ---------
+    path: str
+        le chemin du document (il n'est pas supprimé)
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    past: int
+        Nombre d'années en arrière à surveiller
+    future: int
+        Nombre d'années en avant à surveiller
+    max_workers: int
+        Nombre maximum de requêtes simultanées
+    profile: Profile
+        mesure des étapes, None pour ne rien mesurer
+    Yields
+    ------
+    reference, article: tuple
+        chaque article distinct avec son nombre d'occurrences dans le document
+    """
+    profile = profile or Profile()
+    client_id = os.getenv("API_KEY")
+    client_secret = os.getenv("API_SECRET")
+    with open(path, "rb") as f:
+        content = f.read()
+    # même lecture (et même cache) que les analyses du serveur web; le contenu et non le chemin:
+    # get_document_references supprime les fichiers qu'il lit
+    references = get_document_references(
+        content,
+        selected_codes,
+        pattern_format,
+        os.path.basename(path),
+        timer=profile.add,
+        stream=True,
+    )
+    unique_references, occurrences = get_unique_references(references)
+    start = time.perf_counter()
+    try:
+        for reference, article in resolve_articles(
+            unique_references,
+            client_id,
+            client_secret,
+            past,
+            future,
+            max_workers,
+            timer=profile.add,
+        ):
+            article["occurrences"] = occurrences[(reference[0], reference[2])]
+            yield reference, article
+    finally:
+        profile.add("resolve", time.perf_counter() - start)
+
+
+class ResultWriter:
+    """
+    Écriture des résultats au fur et à mesure en CSV, JSON (tableau) ou NDJSON (un objet par ligne)
+    """
+
+    FORMATS = ("csv", "json", "ndjson")
+
+    def __init__(self, output, output_format, fields):
+        self.output = output
+        self.output_format = output_format
+        self.fields = fields
+        self.count = 0
+        if output_format == "csv":
+            self.csv_writer = csv.DictWriter(output, fieldnames=fields, extrasaction="ignore")
+            self.csv_writer.writeheader()
+        elif output_format == "json":
+            output.write("[")
+
+    def write(self, row):
+        if self.output_format == "csv":
+            self.csv_writer.writerow(row)
+        elif self.output_format == "json":
+            self.output.write(("," if self.count else "") + "\n" + json.dumps(row, ensure_ascii=False))
+        else:
+            self.output.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.count += 1
+        self.output.flush()
+
+    def close(self):
+        if self.output_format == "json":
+            self.output.write("\n]\n" if self.count else "]\n")
+        self.output.flush()
+
+
+def cli(argv=None, output=None):
+    """
+    Vérifier des documents en ligne de commande
+
+    Les résultats sont écrits dès que chaque article est vérifié, un résultat par article
+    et par fichier (colonnes file, les champs de api.RESULT_FIELDS et error).
+    Un fichier illisible donne une ligne d'erreur sans interrompre les suivants.
+
+    Arguments
+    ---------
+    argv: list
+        les arguments, sys.argv[1:] par défaut
+    output: file
+        la sortie quand --output n'est pas donné, sys.stdout par défaut
+    Returns
+    -------
+    exit_code: int
+        0 si tous les fichiers ont été vérifiés, 1 sinon
+    """
+    # import local: api importe codeislow
+    from api import RESULT_FIELDS, format_result
+
+    parser = argparse.ArgumentParser(
+        prog="codeislow", description="Vérification des références aux articles de code"
+    )
+    parser.add_argument("files", nargs="+", help="fichiers ou motifs glob eg. 'contrats/**/*.docx'")
+    parser.add_argument("--codes", help="codes à détecter, séparés par des virgules eg. CCIV,CPEN")
+    parser.add_argument(
+        "--pattern-format", default="article_code", choices=["article_code", "code_article"]
+    )
+    parser.add_argument("--past", type=int, default=3, help="nombre d'années dans le passé")
+    parser.add_argument("--future", type=int, default=3, help="nombre d'années dans le futur")
+    parser.add_argument(
+        "--workers", type=int, default=MAX_WORKERS, help="requêtes Légifrance simultanées"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["online", "offline"],
+        help="API Légifrance ou index local LEGI (API_BACKEND par défaut)",
+    )
+    parser.add_argument(
+        "--cache", choices=list(CACHE_BACKENDS), help="cache des articles (ARTICLE_CACHE par défaut)"
+    )
+    parser.add_argument("--format", default="csv", choices=ResultWriter.FORMATS)
+    parser.add_argument("--output", "-o", help="fichier de sortie, la sortie standard par défaut")
+    parser.add_argument(
+        "--profile", action="store_true", help="afficher la durée de chaque étape (stderr)"
+    )
+    args = parser.parse_args(argv)
+    load_dotenv()
+    if args.backend:
+        os.environ["API_BACKEND"] = args.backend
+    if args.cache:
+        set_cache(CACHE_BACKENDS[args.cache]())
+    selected_codes = args.codes.split(",") if args.codes else None
+    profile = Profile()
+    output_file = open(args.output, "w", newline="", encoding="utf-8") if args.output else None
+    writer = ResultWriter(
+        output_file or output or sys.stdout, args.format, ("file",) + RESULT_FIELDS + ("error",)
+    )
+    exit_code = 0
+    start = time.perf_counter()
+    try:
+        for pattern, path in iter_paths(args.files):
+            if path is None:
+                writer.write({"file": pattern, "error": "Aucun fichier"})
+                exit_code = 1
+                continue
+            try:
+                for reference, article in iter_file_results(
+                    path,
+                    selected_codes,
+                    args.pattern_format,
+                    args.past,
+                    args.future,
+                    args.workers,
+                    profile,
+                ):
+                    writer.write(dict(format_result(reference, article), file=path, error=None))
+            except Exception as e:
+                writer.write({"file": path, "error": str(e) or e.__class__.__name__})
+                exit_code = 1
+        writer.close()
+    finally:
+        if output_file is not None:
+            output_file.close()
+    if args.profile:
+        print(profile.report(), file=sys.stderr)
+        print(f"{'total':<9}{time.perf_counter() - start:>9.3f} s", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
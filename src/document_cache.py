@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: document_cache.py
+"""
+Module de cache des documents analysés
+
+Un document déposé plusieurs fois n'est analysé qu'une fois:
+le texte extrait et les références détectées sont conservés
+sous l'empreinte SHA-256 du contenu du fichier.
+
+- hash_document: l'empreinte du contenu
+- get_document_references: les références détectées, depuis le cache si possible,
+  au fil de la lecture du document (stream)
+- get_incremental_references: nouvelle version d'un document, seuls les paragraphes modifiés sont analysés
+- get_document_id: l'identifiant d'un document d'une version à l'autre, propre à son propriétaire
+
+Le texte est indexé par l'empreinte et la configuration de lecture (bibliothèque,
+PARSE_ALL_PARTS), les références aussi par les options de détection
+(codes sélectionnés, format, moteur).
+La validité des articles (past/future) est toujours recalculée.
+Même stockage que le cache des articles (memory, sqlite ou none):
+les entrées les moins récemment utilisées sont supprimées au delà de DOCUMENT_CACHE_SIZE.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from article_cache import CACHE_BACKENDS, MISSING, make_key
+import matching
+from matching import get_code_refs, get_matching_result_item, iter_code_refs
+import parsing
+from parsing import get_doc_extension, iter_doc_chunks, iter_doc_text, open_source, parse_doc
+
+DOCUMENT_CACHE = os.getenv("DOCUMENT_CACHE", "memory")
+DOCUMENT_CACHE_PATH = os.getenv(
+    "DOCUMENT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "document_cache.db"),
+)
+# un document occupe deux entrées: son texte et ses références
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", 64))
+DOCUMENT_CACHE_TTL = float(os.getenv("DOCUMENT_CACHE_TTL", 7 * 24 * 3600))
+# Moteur de la détection au fil de la lecture: seul scan donne
+# les mêmes références que sur le texte entier (voir matching.iter_code_refs)
+STREAM_ENGINE = "scan"
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_document_cache():
+    """
+    Renvoie le cache configuré par la variable d'environnement DOCUMENT_CACHE
+    (memory, sqlite ou none)
+
+    Returns
+    -------
+    cache: MemoryCache, SQLiteCache ou NoCache
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                backend = CACHE_BACKENDS[DOCUMENT_CACHE]
+            except KeyError:
+                raise ValueError(
+                    f"Wrong cache backend `{DOCUMENT_CACHE}`: choose between {', '.join(CACHE_BACKENDS)}"
+                )
+            if DOCUMENT_CACHE == "sqlite":
+                _CACHE = backend(DOCUMENT_CACHE_PATH, DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL)
+            elif DOCUMENT_CACHE == "memory":
+                _CACHE = backend(DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_TTL)
+            else:
+                _CACHE = backend()
+        return _CACHE
+
+
+def set_document_cache(cache):
+    """
+    Remplacer le cache des documents
+
+    Arguments
+    ---------
+    cache: MemoryCache, SQLiteCache ou NoCache
+        le nouveau cache. None pour revenir à la configuration par défaut
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        _CACHE = cache
+
+
+def hash_document(file_path, block_size=1 << 16):
+    """
+    Empreinte SHA-256 du contenu du document
+
+    Arguments
+    ---------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    block_size: int
+        taille des blocs lus
+    Returns
+    -------
+    digest: str
+        l'empreinte en hexadécimal
+    """
+    digest = hashlib.sha256()
+    with open_source(file_path) as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_parser_config(file_path, filename=None):
+    """
+    La configuration de lecture du document: la bibliothèque (PARSER_CONFIG)
+    et la lecture de toutes les parties (PARSE_ALL_PARTS) eg. 'pdf:pypdf2:body'
+
+    Raises
+    ------
+    ValueError:
+        Extension incorrecte
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    parts = "all" if parsing.PARSE_ALL_PARTS else "body"
+    return f"{doc_ext}:{parsing.PARSER_CONFIG[doc_ext]}:{parts}"
+
+
+def get_document_references(
+    file_path,
+    selected_codes=None,
+    pattern_format="article_code",
+    filename=None,
+    engine=None,
+    timer=None,
+    stream=False,
+):
+    """
+    Les références détectées dans le document, sans l'analyser à nouveau s'il est déjà connu
+
+    Comme parse_doc, le fichier est supprimé une fois lu quand file_path est un chemin.
+    Avec stream, la détection (moteur STREAM_ENGINE) commence dès la première page
+    ou le premier paragraphe lu, sans construire le texte complet du document.
+
+    Arguments
+    ---------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    filename: str
+        nom du document quand file_path est son contenu
+    engine: str
+        the matching engine: split or scan. Default to MATCHING_ENGINE,
+        always STREAM_ENGINE with stream
+    timer: callable
+        reçoit la durée de la lecture et de la détection quand le document
+        n'est pas dans le cache: timer("parse" ou "match", seconds)
+        (eg. codeislow.Profile.add). Default to None
+    stream: bool
+        détecter les références au fil de la lecture (voir parsing.iter_doc_text
+        et matching.iter_code_refs). Default to False
+    Returns
+    -------
+    references: list
+        les références détectées [short_code, code_name, art_num]
+    """
+    timer = timer or (lambda stage, seconds: None)
+    cache = get_document_cache()
+    parser_config = get_parser_config(file_path, filename)
+    digest = hash_document(file_path)
+    codes = ",".join(sorted(selected_codes)) if selected_codes else "*"
+    engine = STREAM_ENGINE if stream else engine or matching.MATCHING_ENGINE
+    references_key = make_key("references", digest, parser_config, codes, pattern_format, engine)
+    references = cache.get(references_key)
+    if references is MISSING:
+        text_key = make_key("text", digest, parser_config)
+        full_text = cache.get(text_key)
+        if full_text is MISSING and stream:
+            references = stream_references(
+                file_path, selected_codes, pattern_format, filename, timer
+            )
+        elif full_text is MISSING:
+            start = time.perf_counter()
+            full_text = parse_doc(file_path, filename=filename)
+            timer("parse", time.perf_counter() - start)
+            cache.set(text_key, full_text)
+        if references is MISSING:
+            start = time.perf_counter()
+            references = list(
+                get_matching_result_item(full_text, selected_codes, pattern_format, engine)
+            )
+            timer("match", time.perf_counter() - start)
+        cache.set(references_key, references)
+    if isinstance(file_path, (str, os.PathLike)) and os.path.exists(file_path):
+        os.remove(file_path)
+    return references
+
+
+def stream_references(file_path, selected_codes, pattern_format, filename, timer):
+    """
+    Détecter les références (moteur STREAM_ENGINE) au fil de la lecture du document
+
+    Returns
+    -------
+    references: list
+        les références détectées [short_code, code_name, art_num],
+        dans le même ordre que sur le texte entier
+    """
+    parse_time = 0
+
+    def timed_chunks():
+        nonlocal parse_time
+        chunks = iter_doc_text(file_path, filename=filename)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            parse_time += time.perf_counter() - start
+            if chunk is None:
+                return
+            yield chunk
+
+    start = time.perf_counter()
+    references = list(
+        iter_code_refs(
+            timed_chunks(), selected_codes, pattern_format, STREAM_ENGINE, separator=""
+        )
+    )
+    timer("parse", parse_time)
+    timer("match", time.perf_counter() - start - parse_time)
+    return references
+
+
+def fingerprint(paragraph):
+    """Empreinte d'un paragraphe normalisé"""
+    return hashlib.blake2b(paragraph.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_document_id(owner, filename):
+    """
+    L'identifiant d'un document d'une version à l'autre, propre à son propriétaire:
+    deux utilisateurs qui déposent un document du même nom ne partagent pas sa version précédente
+
+    Arguments
+    ---------
+    owner: str
+        l'utilisateur ou la session (eg. le jeton du navigateur)
+    filename: str
+        le nom du document
+    Returns
+    -------
+    document_id: str
+    Raises
+    ------
+    ValueError:
+        propriétaire absent
+    """
+    if not owner:
+        raise ValueError("Propriétaire du document absent")
+    name = os.path.basename(os.fspath(filename))
+    return hashlib.blake2b(f"{owner}\0{name}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_incremental_references(
+    file_path,
+    selected_codes=None,
+    pattern_format="article_code",
+    filename=None,
+    engine=None,
+    document_id=None,
+):
+    """
+    Les références détectées dans une nouvelle version d'un document
+
+    Chaque paragraphe (ou page) est identifié par son empreinte. Les empreintes
+    et les références de la version précédente du document sont conservées dans le cache:
+    seuls les paragraphes nouveaux ou modifiés sont analysés.
+    Une référence à cheval sur deux paragraphes n'est pas détectée dans ce mode.
+    Les articles déjà vérifiés sont ensuite repris du cache des articles.
+
+    Arguments
+    ---------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    selected_codes: array
+        liste des codes selectionnés
+    pattern_format: str
+        le format de notation des références: article_code ou code_article
+    filename: str
+        nom du document quand file_path est son contenu
+    engine: str
+        the matching engine: split or scan. Default to MATCHING_ENGINE
+    document_id: str
+        l'identifiant du document d'une version à l'autre, propre à l'utilisateur
+        ou à la session (voir get_document_id)
+    Returns
+    -------
+    references: list
+        les références détectées [short_code, code_name, art_num]
+    changes: dict
+        {
+            "previous": une version précédente était connue,
+            "paragraphs": nombre de paragraphes,
+            "changed": nombre de paragraphes analysés,
+            "added": références [short_code, art_num] absentes de la version précédente,
+            "removed": références de la version précédente qui ont disparu
+        }
+    Raises
+    ------
+    ValueError:
+        document_id absent: le nom du fichier seul ne distingue pas les utilisateurs
+    """
+    if not document_id:
+        raise ValueError("Identifiant du document absent (voir get_document_id)")
+    cache = get_document_cache()
+    codes = ",".join(sorted(selected_codes)) if selected_codes else "*"
+    engine = engine or matching.MATCHING_ENGINE
+    key = make_key("paragraphs", document_id, codes, pattern_format, engine)
+    previous = cache.get(key)
+    known = {} if previous is MISSING else previous
+    paragraphs = {}
+    references = []
+    nb_paragraphs = 0
+    for paragraph in iter_doc_chunks(file_path, filename=filename):
+        if paragraph.strip() == "":
+            continue
+        nb_paragraphs += 1
+        paragraph_id = fingerprint(paragraph)
+        if paragraph_id not in paragraphs:
+            paragraphs[paragraph_id] = known.get(paragraph_id)
+            if paragraphs[paragraph_id] is None:
+                paragraphs[paragraph_id] = list(
+                    get_code_refs(paragraph, selected_codes, pattern_format, engine)
+                )
+        references.extend(paragraphs[paragraph_id])
+    cache.set(key, paragraphs)
+    new_refs = {(ref[0], ref[2]) for ref in references}
+    old_refs = {(ref[0], ref[2]) for refs in known.values() for ref in refs}
+    changes = {
+        "previous": previous is not MISSING,
+        "paragraphs": nb_paragraphs,
+        "changed": len([p for p in paragraphs if p not in known]),
+        "added": [list(ref) for ref in sorted(new_refs - old_refs)],
+        "removed": [list(ref) for ref in sorted(old_refs - new_refs)],
+    }
+    return references, changes
@@ -6,18 +6,37 @@ Main Bottle app
 
 """
 import os
+import re
+import secrets
 from dotenv import load_dotenv
 from bottle_sslify import SSLify
 import bottle
-from bottle import Bottle, request
+from bottle import Bottle, redirect, request, response
 from jinja2 import Environment, FileSystemLoader
-from result_templates import start_results, end_results
 from code_references import CODE_REFERENCE, CODE_REGEX
-from codeislow import load_result
+from api import api
+from codeislow import load_job_page
+from document_cache import get_document_id
+from jobs import QueueFullError, ensure_workers, get_job_queue, iter_event_stream
 
 app = Bottle()
+# API JSON: POST /api/references
+app.mount("/api/", api)
 curr_dir = os.path.dirname(os.path.realpath(__file__))
 environment = Environment(loader=FileSystemLoader(os.path.join(curr_dir, "templates/")))
+# jeton du navigateur: les versions précédentes des documents lui sont propres
+CLIENT_COOKIE = "codeislow_client"
+
+
+def get_client_token():
+    """Le jeton du navigateur (cookie CLIENT_COOKIE), créé à son premier dépôt"""
+    token = request.get_cookie(CLIENT_COOKIE)
+    if not token or not re.fullmatch(r"[A-Za-z0-9_-]{43}", token):
+        token = secrets.token_urlsafe(32)
+        response.set_cookie(
+            CLIENT_COOKIE, token, path="/", max_age=365 * 24 * 3600, httponly=True
+        )
+    return token
 
 
 @app.route("/")
@@ -61,25 +80,15 @@ def codes():
 
 @app.route("/upload/", method="POST")
 def upload():
-    if not os.path.exists("tmp"):
-        os.makedirs("tmp")
     upload = request.files.get("upload")
     name, ext = os.path.splitext(upload.filename)
 
     if ext not in (".docx", ".odt", ".pdf", ".doc"):
+        response.status = 400
         return "Le format du fichier est incorrect"
-    file_path = os.path.join("tmp", upload.filename)
-    upload.save(file_path)
-    yield """
-    <div id="processing" class="alert alert-info" role="alert">
-        <button type="button" class="close" onclick="style.display = 'none'" data-dismiss="alert" aria-label="Close">
-            <span aria-hidden="true">&times;</span>
-        </button>
-        Traitement et détection des articles en cours...<br>Veuillez patientez...
-    </div>
-    """
     past = int(request.forms.get("user_past"))
     future = int(request.forms.get("user_future"))
+    incremental = request.forms.get("incremental") is not None
     selected_codes = [
         short_name
         for short_name in CODE_REFERENCE.keys()
@@ -87,25 +96,63 @@ def upload():
     ]
     if len(selected_codes) == 0:
         selected_codes = None
-    
-    yield start_results
-
+    options = {
+        "selected_codes": selected_codes,
+        "pattern_format": "article_code",
+        "past": past,
+        "future": future,
+        "incremental": incremental,
+        "document_id": get_document_id(get_client_token(), upload.filename) if incremental else None,
+    }
+    try:
+        # l'analyse est exécutée par les processus de vérification (jobs.py)
+        job_id = get_job_queue().submit(upload.file.read(), upload.filename, options)
+    except QueueFullError:
+        response.status = 503
+        response.set_header("Retry-After", "30")
+        return {"error": "Trop d'analyses en attente, réessayez dans quelques instants"}
+    ensure_workers()
+    if "text/html" in request.headers.get("Accept", ""):
+        redirect(f"/results/{job_id}/", 303)
+    response.status = 202
+    response.set_header("Location", f"/jobs/{job_id}")
+    return {"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job_queue().get(job_id, int(request.query.get("start") or 0))
+    if job is None:
+        response.status = 404
+        return {"error": f"Analyse {job_id} inconnue"}
+    return job
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    if get_job_queue().status(job_id) is None:
+        response.status = 404
+        return {"error": f"Analyse {job_id} inconnue"}
+    # Last-Event-ID: envoyé par le navigateur quand il se reconnecte
+    last_event_id = request.headers.get("Last-Event-ID") or request.query.get("last_event_id")
     try:
-        for row in load_result(file_path, None, "article_code", past, future):
-            yield row
-    except Exception as e:
-        row = f"""
-        <div class="alert alert-warning" role="alert">
-        <h2> Erreur</h2>
-        <p>Quelque chose s'est mal passé: <code>{e}</code>
-        <p> Contactez
-        <a href="#" class="alert-link">l'administrateur</a></p>
-        </div>
-        """
-        yield row
-    
-
-    yield end_results
+        last_event_id = int(last_event_id or -1)
+    except ValueError:
+        response.status = 400
+        return {"error": f"Last-Event-ID incorrect: {last_event_id}"}
+    response.content_type = "text/event-stream"
+    response.set_header("Cache-Control", "no-cache")
+    response.set_header("X-Accel-Buffering", "no")
+    return iter_event_stream(job_id, last_event_id, with_html=True)
+
+
+@app.route("/results/<job_id>/")
+def job_results(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        response.status = 404
+        return "Analyse inconnue"
+    return load_job_page(job)
 
 if __name__ == "__main__":
     load_dotenv()
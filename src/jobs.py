@@ -0,0 +1,782 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: jobs.py
+"""
+Module de file d'attente des analyses de documents
+
+L'analyse d'un document (lecture, détection et vérification de chaque article
+auprès de Légifrance) peut durer plusieurs minutes: elle est exécutée hors de la requête HTTP
+par des processus dédiés. La file est une base SQLite partagée entre les processus,
+sans autre service à installer.
+
+- JobQueue: la file des analyses (queued, running, done, failed) et leurs évènements
+- run_job: exécute une analyse et enregistre chaque article vérifié au fil de l'eau
+- start_workers/ensure_workers: les processus qui dépilent la file
+- iter_job_events: les évènements d'une analyse au fil de l'analyse
+- iter_event_stream: les évènements d'une analyse au format Server-Sent Events
+
+Au delà de JOB_QUEUE_SIZE analyses en attente, les nouvelles demandes sont refusées
+(QueueFullError) pour que le client réessaie plus tard.
+Une analyse restée "running" plus de JOB_TIMEOUT secondes (processus arrêté)
+est remise dans la file, au plus JOB_MAX_ATTEMPTS fois: un document qui arrête
+ou bloque son processus finit en échec. Les écritures d'un processus dont l'analyse
+a été reprise par un autre sont ignorées (voir JobQueue.claim).
+
+Usage en ligne de commande (processus de vérification séparés du serveur web):
+
+    python jobs.py work [--workers 4]
+    python jobs.py purge
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (serveur de développement): pas de verrou entre les processus du serveur web
+    fcntl = None
+from codeislow import WRONG_ROW, format_article_row, format_changes_row, resolve_unique_articles
+from document_cache import get_document_references, get_incremental_references
+from matching import get_matching_result_item, get_unique_references
+from parsing import WHITESPACE_REGEX
+
+JOBS_PATH = os.getenv(
+    "JOBS_PATH",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "jobs.db"),
+)
+# Nombre de processus lancés par le serveur web (0: processus lancés à part avec `python jobs.py work`)
+# Un seul des processus du serveur web (gunicorn --workers N) les lance, voir ensure_workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Nombre maximum d'analyses en attente
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 32))
+# Durée maximum d'une analyse en secondes
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 30 * 60))
+# Nombre maximum d'exécutions d'une analyse (reprises après JOB_TIMEOUT comprises)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Durée de conservation des analyses terminées en secondes
+JOB_TTL = float(os.getenv("JOB_TTL", 24 * 3600))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+# Durée maximum d'un flux d'évènements en secondes: le navigateur se reconnecte ensuite
+# avec Last-Event-ID. Inférieure au timeout des workers synchrones de gunicorn (30 s)
+JOB_STREAM_DURATION = float(os.getenv("JOB_STREAM_DURATION", 20))
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+_WORKERS = []
+_WORKERS_LOCK = threading.Lock()
+# (fichier verrouillé, pid): le processus du serveur web qui lance les processus de vérification
+_WORKERS_OWNER = None
+
+
+class QueueFullError(Exception):
+    """Trop d'analyses en attente: la demande doit être renouvelée plus tard"""
+
+
+class JobQueue:
+    """
+    File des analyses dans une base SQLite, partagée entre les processus
+
+    Arguments
+    ---------
+    db_path: str
+        chemin de la base SQLite
+    max_queued: int
+        nombre maximum d'analyses en attente
+    timeout: float
+        durée au delà de laquelle une analyse en cours est remise dans la file
+    max_attempts: int
+        nombre maximum d'exécutions d'une analyse, au delà elle est en échec
+    """
+
+    def __init__(
+        self,
+        db_path=JOBS_PATH,
+        max_queued=JOB_QUEUE_SIZE,
+        timeout=JOB_TIMEOUT,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    ):
+        self.db_path = db_path
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._connect() as conn:
+            # attempts: nombre d'exécutions, il identifie aussi l'exécution en cours
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job ("
+                "id TEXT PRIMARY KEY, status TEXT, filename TEXT, options TEXT, "
+                "document BLOB, progress INTEGER, total INTEGER, changes TEXT, "
+                "error TEXT, created_at REAL, updated_at REAL, nb_events INTEGER, "
+                "attempts INTEGER DEFAULT 0)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(job)")]
+            if "attempts" not in columns:
+                # base créée par une version précédente
+                conn.execute("ALTER TABLE job ADD COLUMN attempts INTEGER DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS job_status ON job (status, created_at)")
+            # started, references, article (un par article vérifié), finished
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_event ("
+                "job_id TEXT, position INTEGER, event TEXT, value TEXT, "
+                "PRIMARY KEY (job_id, position))"
+            )
+
+    def _connect(self):
+        # une connexion par thread et par processus (fork des workers)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _add_event(self, conn, job_id, event, data):
+        # dans la transaction en cours: les évènements d'une analyse sont numérotés à partir de 0,
+        # sans réutiliser les numéros d'une analyse interrompue puis reprise
+        conn.execute(
+            "INSERT INTO job_event SELECT id, nb_events, ?, ? FROM job WHERE id = ?",
+            (event, json.dumps(data, default=str), job_id),
+        )
+        conn.execute("UPDATE job SET nb_events = nb_events + 1 WHERE id = ?", (job_id,))
+
+    def submit(self, document, filename, options=None):
+        """
+        Ajouter une analyse à la file
+
+        Arguments
+        ---------
+        document: bytes
+            le contenu du document (ou le texte encodé en UTF-8, avec l'option text)
+        filename: str
+            le nom du document (None pour un texte)
+        options: dict
+            les arguments de l'analyse: selected_codes, pattern_format, past, future,
+            incremental et document_id (voir document_cache.get_document_id),
+            text (le document est un texte brut, envoyé à l'API JSON)
+        Returns
+        -------
+        job_id: str
+            l'identifiant de l'analyse
+        Raises
+        ------
+        QueueFullError:
+            plus de max_queued analyses sont en attente
+        """
+        conn = self._connect()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM job WHERE status = 'queued'"
+            ).fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} analyses en attente")
+            conn.execute(
+                "INSERT INTO job VALUES (?, 'queued', ?, ?, ?, 0, NULL, NULL, NULL, ?, ?, 0, 0)",
+                (job_id, filename, json.dumps(options or {}), bytes(document), now, now),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return job_id
+
+    def claim(self):
+        """
+        Prendre la plus ancienne analyse en attente
+        (ou une analyse en cours depuis plus de timeout secondes)
+
+        Une analyse en cours depuis plus de timeout secondes qui a déjà été exécutée
+        max_attempts fois est en échec. L'exécution est identifiée par son numéro
+        (attempt): les écritures d'une exécution précédente, dont le processus serait
+        toujours en vie, sont ignorées par start, add_result et finish.
+
+        Returns
+        -------
+        job: dict
+            {"id", "filename", "options", "document", "attempt"} ou None si la file est vide
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale = conn.execute(
+                "SELECT id FROM job WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (now - self.timeout, self.max_attempts),
+            ).fetchall()
+            for job_id, in stale:
+                self._finish(conn, job_id, f"Analyse interrompue {self.max_attempts} fois", now)
+            row = conn.execute(
+                "SELECT id, filename, options, document, attempts FROM job "
+                "WHERE status = 'queued' OR (status = 'running' AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - self.timeout,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE job SET status = 'running', progress = 0, attempts = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (row[4] + 1, now, row[0]),
+                )
+                conn.execute("DELETE FROM job_event WHERE job_id = ?", (row[0],))
+                self._add_event(conn, row[0], "started", {"filename": row[1]})
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "filename": row[1],
+            "options": json.loads(row[2]),
+            "document": row[3],
+            "attempt": row[4] + 1,
+        }
+
+    def _is_current(self, conn, job_id, attempt):
+        # dans la transaction en cours: l'exécution attempt est toujours celle de l'analyse
+        if attempt is None:
+            return True
+        row = conn.execute("SELECT status, attempts FROM job WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row == ("running", attempt)
+
+    def start(self, job_id, nb_references, total, changes=None, attempt=None):
+        """Document analysé: nombre de références détectées, d'articles à vérifier
+        (et changements depuis la version précédente).
+        Renvoie False si l'exécution attempt a été remplacée (voir claim)"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._is_current(conn, job_id, attempt):
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "UPDATE job SET total = ?, changes = ?, updated_at = ? WHERE id = ?",
+                (total, json.dumps(changes), time.time(), job_id),
+            )
+            self._add_event(
+                conn,
+                job_id,
+                "references",
+                {"references": nb_references, "total": total, "changes": changes},
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def add_result(self, job_id, result, attempt=None):
+        """Enregistrer le résultat d'un article et l'avancement de l'analyse.
+        Renvoie False si l'exécution attempt a été remplacée (voir claim)"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._is_current(conn, job_id, attempt):
+                conn.execute("ROLLBACK")
+                return False
+            position, total = conn.execute(
+                "SELECT progress, total FROM job WHERE id = ?", (job_id,)
+            ).fetchone()
+            self._add_event(
+                conn, job_id, "article", {"position": position, "total": total, **result}
+            )
+            conn.execute(
+                "UPDATE job SET progress = ?, updated_at = ? WHERE id = ?",
+                (position + 1, time.time(), job_id),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def finish(self, job_id, error=None, attempt=None):
+        """Analyse terminée (ou en échec avec le message error): le document est supprimé.
+        Renvoie False si l'exécution attempt a été remplacée (voir claim)"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not self._is_current(conn, job_id, attempt):
+                conn.execute("ROLLBACK")
+                return False
+            self._finish(conn, job_id, error, time.time())
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def _finish(self, conn, job_id, error, now):
+        # dans la transaction en cours
+        status = "failed" if error else "done"
+        conn.execute(
+            "UPDATE job SET status = ?, error = ?, document = NULL, updated_at = ? WHERE id = ?",
+            (status, error, now, job_id),
+        )
+        progress, total = conn.execute(
+            "SELECT progress, total FROM job WHERE id = ?", (job_id,)
+        ).fetchone()
+        self._add_event(
+            conn,
+            job_id,
+            "finished",
+            {"status": status, "error": error, "progress": progress, "total": total},
+        )
+
+    def events(self, job_id, after=-1):
+        """
+        Les évènements d'une analyse, dans l'ordre
+
+        Arguments
+        ---------
+        job_id: str
+            l'identifiant de l'analyse
+        after: int
+            ne renvoyer que les évènements suivant celui-ci (Last-Event-ID)
+        Returns
+        -------
+        events: list
+            [{"id", "event", "data"}, ...]
+            event: started, references, article ou finished
+        """
+        rows = self._connect().execute(
+            "SELECT position, event, value FROM job_event "
+            "WHERE job_id = ? AND position > ? ORDER BY position",
+            (job_id, after),
+        ).fetchall()
+        return [
+            {"id": position, "event": event, "data": json.loads(value)}
+            for position, event, value in rows
+        ]
+
+    def status(self, job_id):
+        """Le statut d'une analyse (queued, running, done, failed) ou None si elle n'existe pas"""
+        row = self._connect().execute("SELECT status FROM job WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, job_id, start=0):
+        """
+        L'état d'une analyse
+
+        L'analyse et ses résultats sont lus dans la même transaction: last_event_id
+        est le dernier évènement pris en compte dans les résultats renvoyés.
+
+        Arguments
+        ---------
+        job_id: str
+            l'identifiant de l'analyse
+        start: int
+            ne renvoyer que les résultats à partir de cette position
+        Returns
+        -------
+        job: dict
+            {"id", "status", "filename", "progress", "total", "changes", "error",
+            "created_at", "updated_at", "last_event_id", "results"}
+            ou None si l'analyse n'existe pas
+        """
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT id, status, filename, progress, total, changes, error, created_at, "
+                "updated_at, nb_events FROM job WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            results = conn.execute(
+                "SELECT value FROM job_event WHERE job_id = ? AND event = 'article' "
+                "ORDER BY position LIMIT -1 OFFSET ?",
+                (job_id, start),
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "filename": row[2],
+            "progress": row[3],
+            "total": row[4],
+            "changes": json.loads(row[5]) if row[5] else None,
+            "error": row[6],
+            "created_at": row[7],
+            "updated_at": row[8],
+            "last_event_id": row[9] - 1,
+            "results": [json.loads(value) for value, in results],
+        }
+
+    def purge(self, ttl=JOB_TTL):
+        """Supprimer les analyses terminées depuis plus de ttl secondes"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM job_event WHERE job_id IN "
+                "(SELECT id FROM job WHERE status IN ('done', 'failed') AND updated_at < ?)",
+                (time.time() - ttl,),
+            )
+            conn.execute(
+                "DELETE FROM job WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - ttl,),
+            )
+
+    def stats(self):
+        counts = dict(
+            self._connect().execute("SELECT status, COUNT(*) FROM job GROUP BY status").fetchall()
+        )
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+
+def get_job_queue():
+    """
+    Renvoie la file des analyses configurée par JOBS_PATH, JOB_QUEUE_SIZE, JOB_TIMEOUT
+    et JOB_MAX_ATTEMPTS
+
+    Returns
+    -------
+    queue: JobQueue
+    """
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = JobQueue(JOBS_PATH, JOB_QUEUE_SIZE, JOB_TIMEOUT, JOB_MAX_ATTEMPTS)
+        return _QUEUE
+
+
+def set_job_queue(queue):
+    """
+    Remplacer la file des analyses
+
+    Arguments
+    ---------
+    queue: JobQueue
+        la nouvelle file. None pour revenir à la configuration par défaut
+    """
+    global _QUEUE
+    with _QUEUE_LOCK:
+        _QUEUE = queue
+
+
+def format_event(event):
+    """Un évènement au format Server-Sent Events"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+def iter_job_events(
+    job_id,
+    last_event_id=-1,
+    queue=None,
+    poll_interval=JOB_POLL_INTERVAL,
+    keepalive=15,
+    max_duration=JOB_STREAM_DURATION,
+):
+    """
+    Les évènements d'une analyse au fil de l'analyse
+
+    Le flux se termine après l'évènement finished, ou au bout de max_duration secondes:
+    un worker gunicorn synchrone n'est pas occupé pendant toute l'analyse,
+    le client se reconnecte avec le dernier évènement reçu.
+
+    Arguments
+    ---------
+    job_id: str
+        l'identifiant de l'analyse
+    last_event_id: int
+        le dernier évènement reçu par le client. Default to -1: tous les évènements
+    queue: JobQueue
+        la file des analyses. Default to get_job_queue()
+    poll_interval: float
+        attente en secondes entre deux lectures de la file
+    keepalive: float
+        durée en secondes sans évènement après laquelle None est renvoyé
+    max_duration: float
+        durée maximum du flux en secondes
+    Yields
+    ------
+    event: dict
+        {"id", "event", "data"} (voir JobQueue.events) ou None pour garder la connexion ouverte
+    """
+    queue = queue or get_job_queue()
+    sent_at = time.time()
+    deadline = time.monotonic() + max_duration
+    while True:
+        # statut lu avant les évènements: une analyse terminée a déjà son évènement finished
+        finished = queue.status(job_id) in (None, "done", "failed")
+        events = queue.events(job_id, last_event_id)
+        for event in events:
+            yield event
+            last_event_id = event["id"]
+            if event["event"] == "finished":
+                return
+        if events:
+            sent_at = time.time()
+            continue
+        # analyse terminée avant la reconnexion, ou supprimée
+        if finished or time.monotonic() >= deadline:
+            return
+        if time.time() - sent_at > keepalive:
+            yield None
+            sent_at = time.time()
+        time.sleep(poll_interval)
+
+
+def iter_event_stream(
+    job_id,
+    last_event_id=-1,
+    queue=None,
+    with_html=False,
+    poll_interval=JOB_POLL_INTERVAL,
+    keepalive=15,
+    max_duration=JOB_STREAM_DURATION,
+):
+    """
+    Les évènements d'une analyse au format Server-Sent Events, au fil de l'analyse
+
+    Un client qui se reconnecte avec l'en-tête Last-Event-ID reçoit les évènements suivants,
+    sans relancer l'analyse: EventSource se reconnecte de lui-même à la fin du flux
+    (voir iter_job_events).
+
+    Arguments
+    ---------
+    job_id: str
+        l'identifiant de l'analyse
+    last_event_id: int
+        le dernier évènement reçu par le client. Default to -1: tous les évènements
+    queue: JobQueue
+        la file des analyses. Default to get_job_queue()
+    with_html: bool
+        ajouter aux évènements la ligne HTML du résultat (champ html)
+    poll_interval: float
+        attente en secondes entre deux lectures de la file
+    keepalive: float
+        durée en secondes après laquelle un commentaire est envoyé pour garder la connexion ouverte
+    max_duration: float
+        durée maximum du flux en secondes
+    Yields
+    ------
+    message: str
+        chaque évènement (started, references, article, finished) au format text/event-stream
+    """
+    # délai de reconnexion du navigateur en millisecondes
+    yield "retry: 2000\n\n"
+    for event in iter_job_events(
+        job_id, last_event_id, queue, poll_interval, keepalive, max_duration
+    ):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        if with_html:
+            add_event_html(event)
+        yield format_event(event)
+
+
+def add_event_html(event):
+    """La ligne HTML à ajouter à la table des résultats pour cet évènement"""
+    data = event["data"]
+    if event["event"] == "article":
+        data["html"] = format_article_row(data["reference"][0], data["article"])
+    elif event["event"] == "references" and data["changes"] and data["changes"]["previous"]:
+        data["html"] = format_changes_row(data["changes"])
+    elif event["event"] == "finished" and data["status"] == "done" and data["total"] == 0:
+        data["html"] = WRONG_ROW
+
+
+def run_job(queue, job):
+    """
+    Analyser un document: détection des références puis vérification de chaque article,
+    dont le résultat est enregistré dès qu'il est connu
+
+    Arguments
+    ---------
+    queue: JobQueue
+        la file des analyses
+    job: dict
+        l'analyse renvoyée par JobQueue.claim
+    """
+    load_dotenv()
+    client_id = os.getenv("API_KEY")
+    client_secret = os.getenv("API_SECRET")
+    options = job["options"]
+    selected_codes = options.get("selected_codes")
+    pattern_format = options.get("pattern_format", "article_code")
+    # écritures ignorées si l'analyse a été reprise par un autre processus
+    attempt = job.get("attempt")
+    try:
+        changes = None
+        if options.get("text"):
+            references = list(
+                get_matching_result_item(
+                    WHITESPACE_REGEX.sub(" ", bytes(job["document"]).decode("utf-8")),
+                    selected_codes,
+                    pattern_format,
+                )
+            )
+        elif options.get("incremental"):
+            references, changes = get_incremental_references(
+                job["document"],
+                selected_codes,
+                pattern_format,
+                job["filename"],
+                document_id=options.get("document_id"),
+            )
+        else:
+            references = get_document_references(
+                job["document"], selected_codes, pattern_format, job["filename"], stream=True
+            )
+        unique_references, _ = get_unique_references(references)
+        if not queue.start(
+            job["id"], len(references), len(unique_references), changes, attempt=attempt
+        ):
+            return
+        for reference, article in resolve_unique_articles(
+            references,
+            client_id,
+            client_secret,
+            options.get("past", 3),
+            options.get("future", 3),
+        ):
+            result = {"reference": reference, "article": article}
+            if not queue.add_result(job["id"], result, attempt=attempt):
+                return
+    except Exception as e:
+        queue.finish(job["id"], error=str(e) or e.__class__.__name__, attempt=attempt)
+    else:
+        queue.finish(job["id"], attempt=attempt)
+
+
+def work(db_path=JOBS_PATH, stop=None, poll_interval=JOB_POLL_INTERVAL):
+    """
+    Boucle d'un processus de vérification: dépiler et exécuter les analyses
+
+    Arguments
+    ---------
+    db_path: str
+        chemin de la base SQLite de la file
+    stop: multiprocessing.Event
+        arrêter la boucle quand il est positionné. Default to None: sans fin
+    poll_interval: float
+        attente en secondes quand la file est vide
+    """
+    queue = JobQueue(db_path)
+    purged_at = 0
+    while stop is None or not stop.is_set():
+        job = queue.claim()
+        if job is None:
+            # file vide: suppression des anciennes analyses au plus une fois par minute
+            if time.time() - purged_at > 60:
+                queue.purge()
+                purged_at = time.time()
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+def start_workers(nb_workers=JOB_WORKERS, db_path=JOBS_PATH):
+    """
+    Lancer les processus de vérification
+
+    Arguments
+    ---------
+    nb_workers: int
+        nombre de processus
+    db_path: str
+        chemin de la base SQLite de la file
+    Returns
+    -------
+    workers: list
+        les processus lancés et l'évènement qui les arrête [(process, stop), ...]
+    """
+    workers = []
+    for _ in range(nb_workers):
+        stop = multiprocessing.Event()
+        process = multiprocessing.Process(target=work, args=(db_path, stop), daemon=True)
+        process.start()
+        workers.append((process, stop))
+    return workers
+
+
+def stop_workers(workers, timeout=10):
+    """Arrêter les processus lancés par start_workers après l'analyse en cours"""
+    for _, stop in workers:
+        stop.set()
+    for process, _ in workers:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+
+
+def acquire_workers_lock(db_path=JOBS_PATH):
+    """
+    Verrou (fichier db_path.workers) du processus qui lance les processus de vérification,
+    conservé jusqu'à la fin du processus et de ses processus de vérification
+
+    Returns
+    -------
+    acquired: bool
+        True si le processus courant détient le verrou
+    """
+    global _WORKERS_OWNER
+    if _WORKERS_OWNER is not None and _WORKERS_OWNER[1] == os.getpid():
+        return True
+    if fcntl is None:
+        return True
+    lock_file = open(db_path + ".workers", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # processus de vérification lancés par un autre processus du serveur web
+        lock_file.close()
+        return False
+    _WORKERS_OWNER = (lock_file, os.getpid())
+    return True
+
+
+def ensure_workers(db_path=JOBS_PATH):
+    """
+    Lancer les JOB_WORKERS processus de vérification, une seule fois pour tous
+    les processus du serveur web: seul celui qui obtient le verrou (acquire_workers_lock)
+    les lance, et les relance s'ils s'arrêtent
+
+    Returns
+    -------
+    workers: list
+        les processus lancés par le processus courant [(process, stop), ...]
+    """
+    with _WORKERS_LOCK:
+        if JOB_WORKERS <= 0 or not acquire_workers_lock(db_path):
+            return []
+        _WORKERS[:] = [(p, s) for p, s in _WORKERS if p.is_alive()]
+        if len(_WORKERS) < JOB_WORKERS:
+            _WORKERS.extend(start_workers(JOB_WORKERS - len(_WORKERS), db_path))
+        return list(_WORKERS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="File des analyses de documents")
+    parser.add_argument("command", choices=["work", "purge", "stats"])
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    parser.add_argument("--db", default=JOBS_PATH, help="base SQLite")
+    args = parser.parse_args()
+    if args.command == "work":
+        workers = start_workers(args.workers, args.db)
+        try:
+            for process, _ in workers:
+                process.join()
+        except KeyboardInterrupt:
+            stop_workers(workers)
+    elif args.command == "purge":
+        JobQueue(args.db).purge()
+    else:
+        print(JobQueue(args.db).stats())
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: legi_index.py
+"""
+Module d'index local de la base LEGI
+
+Permet de vérifier les articles sans appeler l'API Légifrance,
+à partir de l'export XML de la base LEGI publié par la DILA
+(https://echanges.dila.gouv.fr/OPENDATA/LEGI/)
+
+- build_index: importe une archive (ou un répertoire) dans une base SQLite
+- get_article_versions: toutes les versions d'un article (index ouvert en lecture seule)
+- get_article_content: la version en vigueur à une date, au format de request_api
+
+Usage en ligne de commande:
+
+    python legi_index.py Freemium_legi_global.tar.gz --db legi.db
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import tarfile
+import threading
+import urllib.request
+import xml.etree.ElementTree as ET
+from code_references import CODE_REFERENCE
+from check_validity import convert_datetime_to_epoch
+
+LEGI_INDEX_PATH = os.getenv(
+    "LEGI_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "legi.db"),
+)
+
+# nom du code en minuscules -> version courte
+CODE_TITLES = {v.lower(): k for k, v in CODE_REFERENCE.items()}
+
+
+def connect_index(db_path=LEGI_INDEX_PATH):
+    """
+    Ouvrir (et créer si besoin) l'index SQLite
+
+    Arguments
+    ---------
+    db_path: str
+        chemin de la base SQLite
+    Returns
+    -------
+    conn: sqlite3.Connection
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS article ("
+        "id TEXT PRIMARY KEY, code TEXT, num TEXT, etat TEXT, "
+        "date_debut TEXT, date_fin TEXT, texte TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS article_code_num ON article (code, num)")
+    return conn
+
+
+_LOCAL = threading.local()
+
+
+def open_index(db_path=LEGI_INDEX_PATH):
+    """
+    Connexion en lecture seule à un index existant,
+    réutilisée par le thread (une connexion par thread et par processus)
+
+    Arguments
+    ---------
+    db_path: str
+        chemin de la base SQLite
+    Returns
+    -------
+    conn: sqlite3.Connection
+    Raises
+    ------
+    FileNotFoundError:
+        l'index n'existe pas (voir LEGI_INDEX_PATH et build_index)
+    """
+    connections = getattr(_LOCAL, "connections", None)
+    if connections is None or _LOCAL.pid != os.getpid():
+        connections = _LOCAL.connections = {}
+        _LOCAL.pid = os.getpid()
+    conn = connections.get(db_path)
+    if conn is None:
+        if not os.path.isfile(db_path):
+            raise FileNotFoundError(
+                f"Index LEGI introuvable: {db_path} (voir LEGI_INDEX_PATH et legi_index.py)"
+            )
+        uri = "file:" + urllib.request.pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+        conn = connections[db_path] = sqlite3.connect(uri, uri=True)
+    return conn
+
+
+def normalize_num(num):
+    """Numéro d'article sans espace ni point eg. 'L. 121-14' => 'L121-14'"""
+    return "".join(c for c in num if c not in (" ", ".", "\xa0"))
+
+
+def parse_article_xml(xml_file):
+    """
+    Lire un fichier article de la base LEGI
+
+    Arguments
+    ---------
+    xml_file: file
+        le fichier XML <ARTICLE>
+    Returns
+    -------
+    row: tuple
+        (id, code, num, etat, date_debut, date_fin, texte)
+        ou None si l'article n'appartient pas à un code supporté
+    """
+    root = ET.parse(xml_file).getroot()
+    if root.tag != "ARTICLE":
+        return None
+    title = root.find("CONTEXTE/TEXTE/TITRE_TXT")
+    if title is None:
+        return None
+    code = CODE_TITLES.get((title.get("c_titre_court") or "").lower())
+    if code is None:
+        code = CODE_TITLES.get("".join(title.itertext()).strip().lower())
+    num = root.findtext("META/META_SPEC/META_ARTICLE/NUM")
+    if code is None or not num:
+        return None
+    contenu = root.find("BLOC_TEXTUEL/CONTENU")
+    texte = "" if contenu is None else " ".join("".join(contenu.itertext()).split())
+    return (
+        root.findtext("META/META_COMMUN/ID"),
+        code,
+        normalize_num(num),
+        root.findtext("META/META_SPEC/META_ARTICLE/ETAT"),
+        root.findtext("META/META_SPEC/META_ARTICLE/DATE_DEBUT"),
+        root.findtext("META/META_SPEC/META_ARTICLE/DATE_FIN"),
+        texte,
+    )
+
+
+def iter_article_files(source):
+    """
+    Parcourir les fichiers articles d'une archive LEGI (lue en flux) ou d'un répertoire
+
+    Arguments
+    ---------
+    source: str
+        chemin de l'archive tar(.gz) ou du répertoire décompressé
+    Yields
+    ------
+    xml_file: file
+        chaque fichier XML situé dans un répertoire article/
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            if "article" not in root.split(os.sep):
+                continue
+            for name in files:
+                if name.endswith(".xml"):
+                    with open(os.path.join(root, name), "rb") as f:
+                        yield f
+        return
+    with tarfile.open(source, "r|*") as tar:
+        for member in tar:
+            if (
+                member.isfile()
+                and member.name.endswith(".xml")
+                and "/article/" in f"/{member.name}"
+            ):
+                yield tar.extractfile(member)
+
+
+def build_index(source, db_path=LEGI_INDEX_PATH, batch_size=1000):
+    """
+    Importer les articles des codes supportés dans l'index
+
+    Arguments
+    ---------
+    source: str
+        chemin de l'archive tar(.gz) ou du répertoire décompressé
+    db_path: str
+        chemin de la base SQLite
+    batch_size: int
+        nombre d'articles insérés par transaction
+    Returns
+    -------
+    count: int
+        nombre d'articles importés
+    """
+    conn = connect_index(db_path)
+    count = 0
+    batch = []
+    with conn:
+        for xml_file in iter_article_files(source):
+            row = parse_article_xml(xml_file)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO article VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+                )
+                count += len(batch)
+                batch = []
+        conn.executemany(
+            "INSERT OR REPLACE INTO article VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+        )
+        count += len(batch)
+    conn.close()
+    return count
+
+
+def get_article_versions(short_code_name, article_number, db_path=LEGI_INDEX_PATH):
+    """
+    Toutes les versions d'un article, de la plus ancienne à la plus récente
+
+    Arguments
+    ---------
+    short_code_name: str
+        Nom du code (version courte)
+    article_number: str
+        Numéro de l'article normalisé eg. L121-14
+    db_path: str
+        chemin de la base SQLite
+    Returns
+    -------
+    versions: list
+        [(id, etat, date_debut, date_fin, texte), ...]
+    Raises
+    ------
+    FileNotFoundError:
+        l'index n'existe pas
+    """
+    return open_index(db_path).execute(
+        "SELECT id, etat, date_debut, date_fin, texte FROM article "
+        "WHERE code = ? AND num = ? ORDER BY date_debut",
+        (short_code_name, article_number),
+    ).fetchall()
+
+
+def to_epoch(date_str):
+    """Date LEGI 'YYYY-MM-DD' => epoch en millisecondes comme l'API"""
+    return int(
+        convert_datetime_to_epoch(datetime.datetime.strptime(date_str, "%Y-%m-%d"))
+    )
+
+
+def get_article_content(short_code_name, article_number, db_path=LEGI_INDEX_PATH, date=None):
+    """
+    Contenu de la version de l'article en vigueur à une date,
+    au format de request_api.get_article_content
+
+    Arguments
+    ---------
+    short_code_name: str
+        Nom du code (version courte)
+    article_number: str
+        Numéro de l'article normalisé eg. L121-14
+    db_path: str
+        chemin de la base SQLite
+    date: datetime.date
+        date de version. Default to today
+    Returns
+    -------
+    article_content: dict
+        le contenu de l'article ou None si aucune version n'est en vigueur
+    """
+    versions = get_article_versions(short_code_name, article_number, db_path)
+    day = (date or datetime.date.today()).isoformat()
+    in_force = [v for v in versions if v[2] <= day < v[3]]
+    if len(in_force) == 0:
+        return None
+    article_id, etat, date_debut, date_fin, texte = in_force[-1]
+    return {
+        "url": f"https://www.legifrance.gouv.fr/codes/article_lc/{article_id}",
+        "id": article_id,
+        "num": article_number,
+        "texte": texte,
+        "etat": etat,
+        "dateDebut": to_epoch(date_debut),
+        "dateFin": to_epoch(date_fin),
+        "articleVersions": [
+            {
+                "id": v[0],
+                "etat": v[1],
+                "dateDebut": to_epoch(v[2]),
+                "dateFin": to_epoch(v[3]),
+            }
+            for v in versions
+        ],
+        "nb_versions": len(versions),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import de la base LEGI")
+    parser.add_argument("source", help="archive tar(.gz) ou répertoire LEGI")
+    parser.add_argument("--db", default=LEGI_INDEX_PATH, help="base SQLite")
+    args = parser.parse_args()
+    print(f"{build_index(args.source, args.db)} articles importés dans {args.db}")
@@ -5,19 +5,43 @@ The matching module
 
 Ce module permet la detection des articles du code de droit français
 
+Deux moteurs de détection sont disponibles (paramètre engine ou variable MATCHING_ENGINE):
+- split: découpage du texte par code puis par mention d'article (par défaut)
+- scan: lecture du texte en une seule passe (scan_code_refs)
+
 """
 from logs import logger
+import bisect
+import os
 import re
 import itertools
 from code_references import (
-    get_selected_codes_regex,
+    get_selected_codes_pattern,
     get_code_full_name_from_short_code,
-    CODE_REFERENCE
+    CODE_REFERENCE,
+    CODE_REGEX,
 )
 
 ARTICLE_REGEX = re.compile(r"(?P<art>(Articles?|Art\.))", re.I)
 #ARTICLE_NUM = r"(?P<ref>(L|A|R|D)?\.?\s?\d{1,5}(-\d{1,5})?(-\d{1,5})?(-\d{1,5})?(-\d{1,5})?.*?(\d{1,5})?)"
 
+# Regex unique du moteur scan: un code, une mention d'article ou un numéro d'article
+SCAN_REGEX = re.compile(
+    r"(?<!\w)(?:{codes})|(?P<art>\bArticles?\b|\bArt\.)|(?P<num>(?:(?P<letter>(?-i:[LARD]))\.?\s{{0,2}})?(?P<digits>\d{{1,5}}(?:\s?-\s?\d{{1,5}})*)(?:,?\s(?:al\.?|alinéa)\s?(?P<alinea>\d{{1,3}}))?)".format(
+        codes="|".join(CODE_REGEX.values())
+    ),
+    re.I,
+)
+# Ce qui peut séparer deux numéros d'une même mention: ", " " et " ...
+SCAN_SEPARATOR_REGEX = re.compile(r"[\s,;.]*(?:(?:et|ou)[\s,;.]+)?", re.I)
+# Distance maximale (en caractères) entre un code et la mention d'article qui s'y rapporte
+SCAN_MAX_GAP = 30
+
+MATCHING_ENGINE = os.getenv("MATCHING_ENGINE", "split")
+# Texte (en caractères) conservé d'un morceau à l'autre par iter_code_refs
+# pour détecter les références à cheval sur deux pages ou paragraphes
+MATCHING_OVERLAP = int(os.getenv("MATCHING_OVERLAP", 500))
+
 
         
 #@logger
@@ -67,25 +91,104 @@ def normalize_references(ref):
 
     return normalized_refs
 
-def get_code_refs(full_text, selected_codes=None, pattern_format="article_code"):
-    # Force to detect every code in case an unselected code is present
-    # but maintaining the option to build the regex with only selected codes
-    code_regex = re.compile(get_selected_codes_regex(selected_codes), re.I)
+def get_code_refs(
+    full_text,
+    selected_codes=None,
+    pattern_format="article_code",
+    engine=None,
+    with_spans=False,
+    block_starts=None,
+):
+    """
+    Détecter les articles des codes dans le texte
+
+    Arguments
+    ----------
+    full_text: str
+        a string of the full document normalized
+    selected_codes: array
+        a list of selected codes in short format. Default is None (no filter)
+    pattern_format: str
+        a string representing the pattern format article_code or code_article. Defaut to article_code
+    engine: str
+        the matching engine: split or scan. Default to MATCHING_ENGINE
+    with_spans: bool
+        add the position of the article number in full_text. Default to False
+    block_starts: list
+        the offset of each page or paragraph as returned by parse_doc(with_blocks=True).
+        If set, add the spans and the index of the page or paragraph. Default to None
+
+    Yields
+    --------
+    code_ref: list
+        [short_code, code_name, art_num]
+        or [short_code, code_name, art_num, start, end] with spans
+        or [short_code, code_name, art_num, start, end, block_index] with block_starts
+    """
     if pattern_format not in ["article_code", "code_article"]:
         raise ValueError(
             "Wrong pattern name: choose between 'article_code' or 'code_article'"
         )
+    engine = engine or MATCHING_ENGINE
+    if engine == "scan":
+        code_refs = scan_code_refs(full_text, selected_codes, pattern_format)
+    elif engine == "split":
+        code_refs = split_code_refs(full_text, selected_codes, pattern_format)
+    else:
+        raise ValueError("Wrong engine name: choose between 'split' or 'scan'")
+    for code, art_num, start, end in code_refs:
+        code_ref = [code, get_code_full_name_from_short_code(code), art_num]
+        if with_spans or block_starts is not None:
+            code_ref.extend([start, end])
+        if block_starts is not None:
+            code_ref.append(get_block_index(block_starts, start))
+        yield code_ref
+
+
+def get_block_index(block_starts, offset):
+    """
+    Numéro de la page ou du paragraphe contenant une position du texte
+
+    Arguments
+    ----------
+    block_starts: list
+        the offset of each page or paragraph as returned by parse_doc(with_blocks=True)
+    offset: int
+        a position in full_text
+
+    Returns
+    ----------
+    index: int
+        the index of the page or paragraph (starting at 0)
+    """
+    return max(bisect.bisect_right(block_starts, offset) - 1, 0)
+
+
+def split_code_refs(full_text, selected_codes=None, pattern_format="article_code"):
+    """
+    Moteur split: découper le texte par code puis par mention d'article
+
+    Yields
+    --------
+    code_ref: tuple
+        (short_code, art_num, start, end) start and end being the position of the article number in full_text
+    """
+    # Force to detect every code in case an unselected code is present
+    # but maintaining the option to build the regex with only selected codes
+    code_regex = get_selected_codes_pattern(selected_codes)
     # Then filter codes  
     if selected_codes is None:
         selected_codes = CODE_REFERENCE.keys()
-    #split text by code occurences
-    split_text = [n for n in re.split(code_regex, full_text) if n is not None and n != ' ']
+    #split text by code occurences (same chunks as code_regex.split, with their position)
+    split_text = [
+        (n, start) for n, start in split_with_offsets(code_regex, full_text) if n != ' '
+    ]
     #remove subsequents mentions produced by split
-    remove_subs_dups = [g for g, _ in itertools.groupby(split_text)]
+    remove_subs_dups = [next(g) for _, g in itertools.groupby(split_text, key=lambda c: c[0])]
     codes_found = []
     refs_found = []
-    for chunk in remove_subs_dups:
-        m = re.match(code_regex, chunk) 
+    for chunk, chunk_start in remove_subs_dups:
+        m = code_regex.match(chunk)
         if m is not None:
             needle = m.groupdict()
             qualified_needle = [
@@ -95,30 +198,262 @@ def get_code_refs(full_text, selected_codes=None, pattern_format="article_code")
             codes_found.append(code_short)
         else:
             
-            refs = re.split(ARTICLE_REGEX, chunk)
+            refs = ARTICLE_REGEX.split(chunk)
             if len(refs) > 4:
                 #print(f"WARNING: Multiple mentions of articles: {refs}")
-                refs_found.append(refs[-1])
-                
-            else:
-                refs_found.append(refs[-1])
+                pass
+            refs_found.append((refs[-1], chunk_start + len(chunk) - len(refs[-1])))
     if len(refs_found) > len(codes_found):
         if pattern_format == "code_article":
             codes_found.insert(0,"")
         else:
             codes_found.append("")
         
-    for code, ref in zip(codes_found, refs_found):
+    for code, (ref, ref_start) in zip(codes_found, refs_found):
         if code != "" and ref != "":
             if code in selected_codes:
-                code_name = get_code_full_name_from_short_code(code)
-                for art_num in normalize_references(ref):
-                    yield [code, code_name, art_num]
-                
+                for art_num, start, end in get_reference_spans(ref, ref_start):
+                    yield (code, art_num, start, end)
+
+
+def split_with_offsets(pattern, full_text):
+    """
+    Equivalent de pattern.split(full_text) qui renvoie aussi la position de chaque morceau
+
+    Yields
+    --------
+    chunk: tuple
+        (chunk, start) pour chaque morceau non nul
+    """
+    last_end = 0
+    for m in pattern.finditer(full_text):
+        yield (full_text[last_end:m.start()], last_end)
+        for i in range(1, len(m.groups()) + 1):
+            if m.group(i) is not None:
+                yield (m.group(i), m.start(i))
+        last_end = m.end()
+    yield (full_text[last_end:], last_end)
+
+
+def get_reference_spans(ref, offset=0):
+    """
+    Normaliser les numéros d'article d'une mention comme normalize_references
+    en conservant leur position
+
+    Arguments
+    ----------
+    ref: str
+        the text following an article mention
+    offset: int
+        the position of ref in full_text
+
+    Yields
+    --------
+    reference: tuple
+        (art_num, start, end)
+    """
+    start = 0
+    for sep in re.finditer(r"\set\s|,\s|\sdu", ref + " du"):
+        piece = ref[start:sep.start()]
+        for art_num in normalize_references(piece):
+            digits = [i for i, c in enumerate(piece) if c.isdigit()]
+            piece_start = digits[0] if digits else 0
+            if art_num[0] in ["L", "A", "R", "D"]:
+                piece_start = piece.find(art_num[0])
+            piece_end = digits[-1] + 1 if digits else len(piece)
+            yield (art_num, offset + start + piece_start, offset + start + piece_end)
+        start = sep.end()
+        
+
+def scan_code_refs(full_text, selected_codes=None, pattern_format="article_code"):
+    """
+    Moteur scan: détecter les articles en une seule lecture du texte
+
+    Le texte est parcouru une fois avec SCAN_REGEX. Une mention d'article
+    (Art., article, articles) ouvre une liste de numéros séparés par des virgules ou "et".
+    La liste se rattache au code qui la suit (article_code)
+    ou au code qui la précède (code_article) à moins de SCAN_MAX_GAP caractères.
+    Tous les codes sont reconnus, puis filtrés selon la sélection,
+    afin qu'un code non sélectionné ne capture pas les articles d'un autre.
+
+    Arguments
+    ----------
+    full_text: str
+        a string of the full document normalized
+    selected_codes: array
+        a list of selected codes in short format. Default is None (no filter)
+    pattern_format: str
+        a string representing the pattern format article_code or code_article. Defaut to article_code
+
+    Yields
+    --------
+    code_ref: tuple
+        (short_code, art_num, start, end) start and end being the position of the article number in full_text
+    """
+    if pattern_format not in ["article_code", "code_article"]:
+        raise ValueError(
+            "Wrong pattern name: choose between 'article_code' or 'code_article'"
+        )
+    if selected_codes is None:
+        selected_codes = CODE_REFERENCE.keys()
+    article_code = pattern_format == "article_code"
+    # numéros en attente de leur code (article_code)
+    pending, pending_end = [], 0
+    # code de la mention en cours (code_article)
+    group_code = None
+    in_group = False
+    last_kind, last_code, last_end = None, None, 0
+    for m in SCAN_REGEX.finditer(full_text):
+        kind = m.lastgroup
+        if kind == "art":
+            pending = []
+            in_group = True
+            group_code = None
+            if not article_code and last_code is not None:
+                if m.start() - last_code[1] <= SCAN_MAX_GAP:
+                    group_code = last_code[0]
+        elif kind == "num":
+            is_separated = SCAN_SEPARATOR_REGEX.fullmatch(full_text, last_end, m.start())
+            if is_separated and article_code and last_kind == "code":
+                # suite d'une énumération: "L. 611-2 C. com., L. 132-1 C. com."
+                pending = []
+                in_group = True
+            if not (in_group and is_separated):
+                in_group = False
+                last_kind = kind
+                continue
+            art_num = "".join([m.group("letter") or "", m.group("digits").replace(" ", "")])
+            if m.group("alinea"):
+                art_num = "-".join([art_num, m.group("alinea")])
+            if article_code:
+                pending.append((art_num, m.start(), m.end()))
+                pending_end = m.end()
+            elif group_code is not None and group_code in selected_codes:
+                yield (group_code, art_num, m.start(), m.end())
+        else:
+            code, kind = kind, "code"
+            if article_code:
+                if pending and m.start() - pending_end <= SCAN_MAX_GAP:
+                    if code in selected_codes:
+                        for art_num, start, end in pending:
+                            yield (code, art_num, start, end)
+                pending = []
+            in_group = False
+            last_code = (code, m.end())
+        last_kind, last_end = kind, m.end()
+
+
+def iter_code_refs(
+    chunks,
+    selected_codes=None,
+    pattern_format="article_code",
+    engine=None,
+    with_spans=False,
+    with_blocks=False,
+    overlap=MATCHING_OVERLAP,
+    separator=" ",
+):
+    """
+    Détecter les articles au fil de la lecture du document
+
+    Les morceaux (pages ou paragraphes, voir parsing.iter_doc_chunks) sont mis bout à bout
+    séparés par un espace (aucun pour parsing.iter_doc_text). Une fenêtre glissante conserve les `overlap` derniers caractères
+    et le contexte qui les précède: une référence est renvoyée dès qu'elle commence
+    à plus de `overlap` caractères de la fin du texte lu,
+    les autres attendent le morceau suivant.
+    Le moteur scan donne les mêmes résultats que sur le texte entier
+    tant qu'une mention d'article ne dépasse pas `overlap` caractères.
+
+    Arguments
+    ----------
+    chunks: iterable
+        the normalized text of each page or paragraph
+    selected_codes: array
+        a list of selected codes in short format. Default is None (no filter)
+    pattern_format: str
+        a string representing the pattern format article_code or code_article. Defaut to article_code
+    engine: str
+        the matching engine: split or scan. Default to MATCHING_ENGINE
+    with_spans: bool
+        add the position of the article number in the concatenated text. Default to False
+    with_blocks: bool
+        add the spans and the index of the chunk the article number belongs to. Default to False
+    overlap: int
+        the number of characters kept between two chunks. Default to MATCHING_OVERLAP
+    separator: str
+        the text put between two chunks. Default to a space
+
+    Yields
+    --------
+    code_ref: list
+        [short_code, code_name, art_num] (+ [start, end] with spans, + [block_index] with blocks)
+    """
+    # window: le texte en cours d'analyse, qui commence à window_start dans le texte complet
+    window, window_start = "", 0
+    # les références qui commencent avant emitted_upto ont déjà été renvoyées
+    emitted_upto = 0
+    block_starts = []
+    chunks = iter(chunks)
+    chunk = next(chunks, None)
+    while chunk is not None:
+        if block_starts:
+            window += separator
+        block_starts.append(window_start + len(window))
+        window += chunk
+        chunk = next(chunks, None)
+        text_end = window_start + len(window)
+        safe_end = text_end if chunk is None else text_end - overlap
+        if safe_end <= emitted_upto:
+            continue
+        for code_ref in get_code_refs(
+            window, selected_codes, pattern_format, engine, with_spans=True
+        ):
+            start, end = code_ref[3] + window_start, code_ref[4] + window_start
+            if not emitted_upto <= start < safe_end:
+                continue
+            if with_spans or with_blocks:
+                code_ref[3:5] = [start, end]
+            else:
+                del code_ref[3:]
+            if with_blocks:
+                code_ref.append(get_block_index(block_starts, start))
+            yield code_ref
+        emitted_upto = safe_end
+        # conserver le contexte d'une mention commencée avant emitted_upto
+        cut = max(emitted_upto - overlap - window_start, 0)
+        window, window_start = window[cut:], window_start + cut
+
+
+def get_unique_references(references):
+    """
+    Dédoublonner les références détectées
+
+    Arguments
+    ----------
+    references: iterable
+        les références détectées [short_code, code_name, art_num]
+
+    Returns
+    ----------
+    unique_references: list
+        les références uniques dans l'ordre de leur première occurrence
+    occurrences: dict
+        le nombre d'occurrences de chaque référence {(short_code, art_num): nb}
+    """
+    unique_references = []
+    occurrences = {}
+    for reference in references:
+        key = (reference[0], reference[2])
+        if key not in occurrences:
+            occurrences[key] = 0
+            unique_references.append(reference)
+        occurrences[key] += 1
+    return unique_references, occurrences
+
 
 #@logger
 def get_matching_results_dict(
-    full_text, selected_codes=None, pattern_format="article_code"
+    full_text, selected_codes=None, pattern_format="article_code", engine=None
 ):
     """
     Une fonction qui renvoie un dictionnaire de resultats:
@@ -142,7 +477,7 @@ def get_matching_results_dict(
     # normalisation
     
     for code_refs in get_code_refs(
-        full_text, selected_codes, pattern_format
+        full_text, selected_codes, pattern_format, engine
     ):
         short_code, code_name, ref = code_refs
         if short_code not in code_found:
@@ -155,7 +490,12 @@ def get_matching_results_dict(
 
 #@logger
 def get_matching_result_item(
-    full_text, selected_codes=None, pattern_format="article_code"
+    full_text,
+    selected_codes=None,
+    pattern_format="article_code",
+    engine=None,
+    with_spans=False,
+    block_starts=None,
 ):
     """
     Renvoie les références des articles détectés dans le texte
@@ -168,6 +508,12 @@ def get_matching_result_item(
         a list of selected codes in short format for filtering article detection. Default is an empty list (which stands for no filter)
     pattern_format: str
     a string representing the pattern format article_code or code_article. Defaut to article_code
+    engine: str
+        the matching engine: split or scan. Default to MATCHING_ENGINE
+    with_spans: bool
+        add the start and end of the article number in full_text. Default to False
+    block_starts: list
+        the offset of each page or paragraph to add its index. Default to None
 
     Yields
     --------
@@ -175,6 +521,8 @@ def get_matching_result_item(
 
     article_number:str
     """
-    yield from get_code_refs(full_text,selected_codes, pattern_format)
+    yield from get_code_refs(
+        full_text, selected_codes, pattern_format, engine, with_spans, block_starts
+    )
         
     
\ No newline at end of file
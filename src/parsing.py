@@ -6,69 +6,953 @@ Parsing file module:
 
 Load document with the accepted extensions and transform into list of text
 
+Chaque format peut être lu par plusieurs bibliothèques (PARSER_BACKENDS),
+choisies avec les variables PDF_PARSER, ODT_PARSER, DOCX_PARSER et DOC_PARSER
+
 """
 
+import contextlib
+import io
+import multiprocessing
 import os
 import re
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from logs import logger
 import docx
 from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
 from odf import text, teletype
 from odf.opendocument import load
+import word_doc
 
 
 ACCEPTED_EXTENSIONS = ("odt", "pdf", "docx", "doc")
 
 
-def parse_doc(file_path: str) -> list:
+# Nombre de processus pour extraire le texte des PDF (1: extraction en série)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+# En dessous de ce nombre de pages, l'extraction reste en série
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 20))
+# Nombre de pages confiées à un processus à la fois
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+
+# Bibliothèque utilisée pour chaque format (voir PARSER_BACKENDS)
+PARSER_CONFIG = {
+    "pdf": os.getenv("PDF_PARSER", "pypdf2"),
+    "odt": os.getenv("ODT_PARSER", "iterparse"),
+    "docx": os.getenv("DOCX_PARSER", "python-docx"),
+    "doc": os.getenv("DOC_PARSER", "ole"),
+}
+
+# Espaces de noms du format OpenDocument
+ODF_TEXT = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+ODF_OFFICE = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+ODT_PARAGRAPHS = (f"{{{ODF_TEXT}}}p", f"{{{ODF_TEXT}}}h")
+# notes et commentaires: leurs paragraphes sont renvoyés à part
+ODT_INSERTS = (f"{{{ODF_TEXT}}}note", f"{{{ODF_OFFICE}}}annotation")
+
+# Lire aussi les tableaux, notes, commentaires, en-têtes et pieds de page (odt, docx)
+PARSE_ALL_PARTS = os.getenv("PARSE_ALL_PARTS", "false").lower() in ("1", "true", "yes")
+# Origine des paragraphes renvoyés par iter_doc_parts
+PART_ORIGINS = ("body", "table", "footnote", "endnote", "comment", "header", "footer")
+ODF_TABLE = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+ODF_STYLE = "urn:oasis:names:tc:opendocument:xmlns:style:1.0"
+ODT_ORIGINS = {
+    f"{{{ODF_TEXT}}}note": "note",
+    f"{{{ODF_OFFICE}}}annotation": "comment",
+    f"{{{ODF_TABLE}}}table-cell": "table",
+    f"{{{ODF_STYLE}}}header": "header",
+    f"{{{ODF_STYLE}}}header-left": "header",
+    f"{{{ODF_STYLE}}}header-first": "header",
+    f"{{{ODF_STYLE}}}footer": "footer",
+    f"{{{ODF_STYLE}}}footer-left": "footer",
+    f"{{{ODF_STYLE}}}footer-first": "footer",
+}
+# Espace de noms WordprocessingML (DOCX)
+OOXML = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+# Word enregistre chaque zone de texte deux fois (mc:AlternateContent):
+# dans mc:Choice (DrawingML) et dans mc:Fallback (VML), qui n'est pas lu
+MARKUP_COMPATIBILITY = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+DOCX_SKIPPED = (f"{{{MARKUP_COMPATIBILITY}}}Fallback",)
+DOCX_ORIGINS = {
+    f"{{{OOXML}}}footnote": "footnote",
+    f"{{{OOXML}}}endnote": "endnote",
+    f"{{{OOXML}}}comment": "comment",
+    f"{{{OOXML}}}hdr": "header",
+    f"{{{OOXML}}}ftr": "footer",
+    f"{{{OOXML}}}tc": "table",
+}
+
+# Espaces, retours à la ligne et tabulations réduits à un seul espace
+# (une suite de 2 espaces ou plus, ou un seul \r, \n, \t ou espace insécable)
+# Erreurs des bibliothèques pour un document corrompu ou tronqué (voir check_document)
+DOCUMENT_ERRORS = (zipfile.BadZipFile, KeyError, PyPdfError, ValueError)
+# La partie principale des archives ODT et DOCX
+ZIP_MAIN_PARTS = {"odt": "content.xml", "docx": "word/document.xml"}
+
+WHITESPACE_REGEX = re.compile(r"\s{2,}|[\r\n\t\xa0]")
+
+
+def get_doc_extension(file_path: str, filename: str = None) -> str:
     """
-    Parcourir le document pour en extraire le texte
+    Vérifier l'extension du document
     Arguments
     ----------
-    file_path: str
-        absolute filepath of the document
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    filename: str
+        the name of the document when file_path is its content. Default to None
     Returns
     ----------
-    full_text: array
-        a list of sentences.
+    doc_ext: str
+        the extension of the document
     Raises
     ----------
-    Exception:
+    ValueError:
         Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
-    FileNotFoundError:
-        File has not been found. File_path must be incorrect
     """
-
-    doc_name, doc_ext = file_path.split("/")[-1].split(".")
+    if filename is None:
+        if isinstance(file_path, (str, os.PathLike)):
+            filename = os.fspath(file_path)
+        else:
+            filename = getattr(file_path, "name", None) or ""
+    doc_ext = str(filename).split("/")[-1].rsplit(".", 1)[-1]
     if doc_ext not in ACCEPTED_EXTENSIONS:
         raise ValueError(
             "Extension incorrecte: les fichiers acceptés terminent par *.odt, *.docx, *.doc,  *.pdf"
         )
+    return doc_ext
 
-    full_text = []
-    if doc_ext == "pdf":
+
+@contextlib.contextmanager
+def open_source(file_path):
+    """
+    Ouvrir le document à lire: un chemin, son contenu (bytes, memoryview)
+    ou un fichier binaire déjà ouvert (le corps d'une requête), qui n'est pas fermé
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    f: file
+        a binary file positioned at the start of the document
+    """
+    if isinstance(file_path, (str, os.PathLike)):
         with open(file_path, "rb") as f:
-            reader = PdfReader(f)
+            yield f
+    elif isinstance(file_path, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(file_path)
+    else:
+        if file_path.seekable():
+            file_path.seek(0)
+        yield file_path
 
-            for i in range(len(reader.pages)):
-                page = reader.pages[i]
-                full_text.extend((page.extract_text()).split("\n"))
 
-    elif doc_ext == "odt":
-        with open(file_path, "rb") as f:
-            document = load(f)
-            paragraphs = document.getElementsByType(text.P)
-            for i in range(len(paragraphs)):
-                full_text.append((teletype.extractText(paragraphs[i])))
+@contextlib.contextmanager
+def spooled_path(file_path, suffix=""):
+    """
+    Un chemin lisible par d'autres processus: le chemin lui-même
+    ou un fichier temporaire contenant le document, supprimé ensuite
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    suffix: str
+        the extension of the temporary file
+    Yields
+    ----------
+    path: str
+    """
+    if isinstance(file_path, (str, os.PathLike)):
+        yield file_path
+        return
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        with open_source(file_path) as f:
+            shutil.copyfileobj(f, tmp)
+    try:
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> list:
+    """
+    Extraire le texte d'une tranche de pages d'un PDF (exécuté dans un processus)
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    start: int
+        index of the first page
+    stop: int
+        index after the last page
+    Returns
+    ----------
+    pages: list
+        the text of each page, lines joined by a space
+    """
+    with open_source(file_path) as f:
+        reader = PdfReader(f)
+        return [
+            " ".join((reader.pages[i].extract_text()).split("\n"))
+            for i in range(start, stop)
+        ]
+
+
+def iter_pdf_pages(file_path: str, workers: int = PDF_WORKERS):
+    """
+    Extraire le texte d'un PDF page par page,
+    en répartissant les pages entre plusieurs processus pour les longs documents
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    workers: int
+        nombre de processus. Default to PDF_WORKERS
+    Yields
+    ----------
+    page: str
+        the text of each page in the order of the document
+    """
+    with open_source(file_path) as f:
+        nb_pages = len(PdfReader(f).pages)
+    # Un processus daemon (jobs.start_workers) ne peut pas créer de processus
+    if (
+        workers <= 1
+        or nb_pages < PDF_PARALLEL_MIN_PAGES
+        or multiprocessing.current_process().daemon
+    ):
+        yield from extract_pdf_pages(file_path, 0, nb_pages)
+        return
+    # les processus relisent le fichier: un contenu en mémoire est d'abord
+    # écrit dans un fichier temporaire
+    with spooled_path(file_path, ".pdf") as path:
+        yield from iter_pdf_pages_parallel(path, nb_pages, workers)
+
+
+def iter_pdf_pages_parallel(file_path: str, nb_pages: int, workers: int):
+    """
+    Extraire le texte des pages d'un PDF avec un pool de processus
+    Arguments
+    ----------
+    file_path: str
+        absolute filepath of the document
+    nb_pages: int
+        le nombre de pages du document
+    workers: int
+        nombre de processus
+    Yields
+    ----------
+    page: str
+        the text of each page in the order of the document
+    """
+    ranges = [
+        (start, min(start + PDF_PAGES_PER_TASK, nb_pages))
+        for start in range(0, nb_pages, PDF_PAGES_PER_TASK)
+    ]
+    done = 0
+    futures = []
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+    try:
+        futures = [
+            executor.submit(extract_pdf_pages, file_path, start, stop)
+            for start, stop in ranges
+        ]
+        # les tranches sont renvoyées dans l'ordre du document
+        for future in futures:
+            pages = future.result()
+            yield from pages
+            done += len(pages)
+    except (BrokenProcessPool, OSError):
+        # processus indisponibles: terminer en série
+        yield from extract_pdf_pages(file_path, done, nb_pages)
+    finally:
+        # shutdown(cancel_futures=True) n'existe qu'à partir de Python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def iter_pdfminer_pages(file_path: str, layout: bool = False):
+    """
+    Extraire le texte d'un PDF page par page avec pdfminer.six
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    layout: bool
+        analyser la mise en page (plus lent). Default to False:
+        le texte est renvoyé dans l'ordre du flux du PDF
+    Yields
+    ----------
+    page: str
+        the text of each page
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    resources = PDFResourceManager(caching=True)
+    with open_source(file_path) as f:
+        for page in PDFPage.get_pages(f):
+            output = io.StringIO()
+            device = TextConverter(
+                resources, output, laparams=LAParams() if layout else None
+            )
+            PDFPageInterpreter(resources, device).process_page(page)
+            device.close()
+            yield " ".join(output.getvalue().split("\n"))
+
+
+def iter_pdfminer_layout_pages(file_path: str):
+    """Extraire le texte d'un PDF avec l'analyse de mise en page de pdfminer.six"""
+    return iter_pdfminer_pages(file_path, layout=True)
+
+
+def iter_odt_paragraphs(file_path: str):
+    """
+    Extraire le texte d'un document ODT paragraphe par paragraphe avec odfpy
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: str
+        the text of each paragraph
+    """
+    with open_source(file_path) as f:
+        document = load(f)
+        paragraphs = document.getElementsByType(text.P)
+        for i in range(len(paragraphs)):
+            yield teletype.extractText(paragraphs[i])
+
+
+def get_odt_text(element) -> str:
+    """
+    Texte d'un paragraphe ODT (spans, liens, espaces, tabulations et sauts de ligne)
+    sans le texte de ses notes et commentaires
+    """
+    parts = [element.text or ""]
+    for child in element:
+        tag = child.tag
+        if tag == f"{{{ODF_TEXT}}}s":
+            parts.append(" " * int(child.get(f"{{{ODF_TEXT}}}c", 1)))
+        elif tag == f"{{{ODF_TEXT}}}tab":
+            parts.append("\t")
+        elif tag == f"{{{ODF_TEXT}}}line-break":
+            parts.append("\n")
+        elif tag not in ODT_INSERTS:
+            parts.append(get_odt_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def iter_xml_paragraphs(xml_file, paragraph_tags, get_text, get_origin, skipped_tags=()):
+    """
+    Lire les paragraphes d'un fichier XML en flux (iterparse)
+
+    Chaque paragraphe est retiré de l'arbre dès que son texte est renvoyé:
+    la mémoire utilisée ne dépend pas de la taille du document.
+    Les paragraphes imbriqués (notes, commentaires, zones de texte)
+    sont renvoyés avant celui qui les contient.
+    Arguments
+    ----------
+    xml_file: file
+        the XML file
+    paragraph_tags: tuple
+        the tags of the paragraph elements
+    get_text: function
+        element => text of the paragraph
+    get_origin: function
+        list of the open elements => origin of the paragraph
+    skipped_tags: tuple
+        the tags of the elements whose paragraphs are not read
+    Yields
+    ----------
+    paragraph: tuple
+        (origin, text)
+    """
+    # les éléments ouverts, le nombre de paragraphes et d'éléments ignorés ouverts
+    stack = []
+    depth = 0
+    skipped = 0
+    for event, element in ET.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            if element.tag in paragraph_tags:
+                depth += 1
+            elif element.tag in skipped_tags:
+                skipped += 1
+            continue
+        stack.pop()
+        if element.tag in skipped_tags:
+            skipped -= 1
+        if element.tag in paragraph_tags:
+            depth -= 1
+            if not skipped:
+                yield (get_origin(stack), get_text(element))
+        if depth == 0 and stack:
+            # l'élément a été lu: le retirer de l'arbre pour libérer la mémoire
+            stack[-1].remove(element)
+        elif element.tag in paragraph_tags:
+            # paragraphe imbriqué: son texte est déjà renvoyé
+            element.clear()
+
+
+def get_odt_origin(stack) -> str:
+    """Origine d'un paragraphe ODT: body, table, footnote, endnote, comment, header ou footer"""
+    for element in reversed(stack):
+        origin = ODT_ORIGINS.get(element.tag)
+        if origin == "note":
+            return element.get(f"{{{ODF_TEXT}}}note-class", "footnote")
+        if origin is not None:
+            return origin
+    return "body"
+
+
+def iter_odt_parts(file_path: str):
+    """
+    Extraire tout le texte d'un document ODT en flux:
+    corps, tableaux, notes, commentaires (content.xml), en-têtes et pieds de page (styles.xml)
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: tuple
+        (origin, text) origin being one of PART_ORIGINS
+    """
+    with open_source(file_path) as f, zipfile.ZipFile(f) as archive:
+        for member in ("content.xml", "styles.xml"):
+            if member not in archive.namelist():
+                continue
+            with archive.open(member) as xml_file:
+                for origin, paragraph in iter_xml_paragraphs(
+                    xml_file, ODT_PARAGRAPHS, get_odt_text, get_odt_origin
+                ):
+                    # styles.xml: seuls les en-têtes et pieds de page contiennent du texte
+                    if member == "content.xml" or origin in ("header", "footer"):
+                        yield (origin, paragraph)
+
+
+def iter_odt_stream_paragraphs(file_path: str):
+    """
+    Extraire le texte d'un document ODT paragraphe par paragraphe
+    en lisant content.xml en flux (iterparse), sans construire l'arbre du document
+
+    Les titres sont renvoyés comme des paragraphes,
+    les paragraphes des notes de bas de page et des commentaires
+    juste avant celui qui les contient.
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: str
+        the text of each paragraph
+    """
+    with open_source(file_path) as f, zipfile.ZipFile(f) as archive:
+        with archive.open("content.xml") as content:
+            for _, paragraph in iter_xml_paragraphs(
+                content, ODT_PARAGRAPHS, get_odt_text, get_odt_origin
+            ):
+                yield paragraph
+
+
+def get_docx_text(element) -> str:
+    """
+    Texte d'un paragraphe DOCX (runs, liens, tabulations et sauts de ligne)
+    sans le texte des zones de texte qu'il contient ni les codes des champs
+    """
+    parts = []
+    for child in element:
+        tag = child.tag
+        if tag == f"{{{OOXML}}}t":
+            parts.append(child.text or "")
+        elif tag == f"{{{OOXML}}}tab":
+            parts.append("\t")
+        elif tag in (f"{{{OOXML}}}br", f"{{{OOXML}}}cr"):
+            parts.append("\n")
+        elif tag == f"{{{OOXML}}}noBreakHyphen":
+            parts.append("-")
+        elif tag != f"{{{OOXML}}}txbxContent":
+            parts.append(get_docx_text(child))
+    return "".join(parts)
+
+
+def get_docx_origin(stack) -> str:
+    """Origine d'un paragraphe DOCX: body, table, footnote, endnote, comment, header ou footer"""
+    for element in reversed(stack):
+        origin = DOCX_ORIGINS.get(element.tag)
+        if origin is not None:
+            return origin
+    return "body"
+
+
+def iter_docx_parts(file_path: str):
+    """
+    Extraire tout le texte d'un document DOCX en flux, directement depuis l'archive:
+    corps et tableaux (document.xml), notes de bas de page et de fin,
+    commentaires, en-têtes et pieds de page
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: tuple
+        (origin, text) origin being one of PART_ORIGINS
+    """
+    with open_source(file_path) as f, zipfile.ZipFile(f) as archive:
+        names = archive.namelist()
+        members = ["word/document.xml", "word/footnotes.xml", "word/endnotes.xml", "word/comments.xml"]
+        members += sorted(n for n in names if re.fullmatch(r"word/(header|footer)\d*\.xml", n))
+        for member in members:
+            if member not in names:
+                continue
+            with archive.open(member) as xml_file:
+                for origin, paragraph in iter_xml_paragraphs(
+                    xml_file, (f"{{{OOXML}}}p",), get_docx_text, get_docx_origin, DOCX_SKIPPED
+                ):
+                    yield (origin, paragraph)
+
+
+def iter_docx_paragraphs(file_path: str):
+    """
+    Extraire le texte d'un document DOCX paragraphe par paragraphe avec python-docx
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: str
+        the text of each paragraph
+    """
+    with open_source(file_path) as f:
+        document = docx.Document(f)
+        paragraphs = document.paragraphs
+        for i in range(len(paragraphs)):
+            yield paragraphs[i].text
+
+
+def iter_word_paragraphs(file_path: str):
+    """
+    Extraire le texte d'un document Word 97-2003 (conteneur OLE2) paragraphe par paragraphe,
+    ou d'un document DOCX enregistré avec l'extension .doc
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    Yields
+    ----------
+    paragraph: str
+        the text of each paragraph
+    """
+    with open_source(file_path) as f:
+        data = f.read()
+    if data[: len(word_doc.OLE_SIGNATURE)] == word_doc.OLE_SIGNATURE:
+        yield from word_doc.iter_doc_paragraphs(data)
     else:
-        # if doc_ext in ["docx", "doc"]:
-        with open(file_path, "rb") as f:
-            document = docx.Document(f)
-            paragraphs = document.paragraphs
-            for i in range(len(paragraphs)):
-                full_text.append((paragraphs[i].text))
-    os.remove(file_path)
-    full_text = re.sub(
-        r"\s{2,}|\r{1,}|\n{1,}|\t{1,}|\xa0{1,}", " ", " ".join(full_text)
+        yield from iter_docx_paragraphs(data)
+
+
+# Les bibliothèques disponibles pour chaque format:
+# une fonction file_path => texte de chaque page ou paragraphe
+PARSER_BACKENDS = {
+    "pdf": {
+        "pypdf2": iter_pdf_pages,
+        "pdfminer": iter_pdfminer_pages,
+        "pdfminer-layout": iter_pdfminer_layout_pages,
+    },
+    "odt": {"iterparse": iter_odt_stream_paragraphs, "odfpy": iter_odt_paragraphs},
+    "docx": {"python-docx": iter_docx_paragraphs},
+    "doc": {"ole": iter_word_paragraphs, "python-docx": iter_docx_paragraphs},
+}
+
+
+def get_parser_backend(doc_ext: str, backend: str = None):
+    """
+    Renvoie la fonction d'extraction du texte pour un format
+    Arguments
+    ----------
+    doc_ext: str
+        the extension of the document
+    backend: str
+        le nom de la bibliothèque. Default to PARSER_CONFIG[doc_ext]
+    Returns
+    ----------
+    parser: function
+        file_path => generator of the text of each page or paragraph
+    Raises
+    ----------
+    ValueError:
+        Bibliothèque inconnue pour ce format
+    """
+    backend = backend or PARSER_CONFIG[doc_ext]
+    try:
+        return PARSER_BACKENDS[doc_ext][backend]
+    except KeyError:
+        raise ValueError(
+            f"Wrong parser backend `{backend}` for {doc_ext}: choose between {', '.join(PARSER_BACKENDS[doc_ext])}"
+        )
+
+
+def iter_raw_parts(file_path: str, doc_ext: str, backend: str = None):
+    """
+    Tout le texte du document avec son origine:
+    corps, tableaux, notes, commentaires, en-têtes et pieds de page pour les formats ODT et DOCX,
+    le corps seulement pour les formats PDF et Word 97-2003
+    Yields
+    ----------
+    block: tuple
+        (origin, raw text of each paragraph or page)
+    """
+    if doc_ext == "odt":
+        yield from iter_odt_parts(file_path)
+    elif doc_ext in ("docx", "doc") and is_zip_source(file_path):
+        yield from iter_docx_parts(file_path)
+    else:
+        for block in get_parser_backend(doc_ext, backend)(file_path):
+            yield ("body", block)
+
+
+def check_document(file_path, filename: str = None):
+    """
+    Vérifier que le document peut être ouvert, sans en extraire le texte:
+    archive ODT ou DOCX et sa partie principale, table des pages d'un PDF,
+    table des pièces d'un document Word 97-2003
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    filename: str
+        the name of the document when file_path is its content. Default to None
+    Raises
+    ----------
+    ValueError:
+        Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
+    DOCUMENT_ERRORS:
+        le document est corrompu ou tronqué
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    with open_source(file_path) as f:
+        if doc_ext == "pdf":
+            len(PdfReader(f).pages)
+            return
+        if doc_ext == "doc":
+            data = f.read()
+            if data[: len(word_doc.OLE_SIGNATURE)] == word_doc.OLE_SIGNATURE:
+                next(word_doc.iter_doc_pieces(data), None)
+                return
+            # document DOCX enregistré avec l'extension .doc
+            f, doc_ext = io.BytesIO(data), "docx"
+        with zipfile.ZipFile(f) as archive:
+            archive.getinfo(ZIP_MAIN_PARTS[doc_ext])
+
+
+def is_zip_source(file_path) -> bool:
+    """Le document est-il une archive zip (ODT, DOCX) ?"""
+    with open_source(file_path) as f:
+        return zipfile.is_zipfile(f)
+
+
+def iter_tagged_blocks(
+    file_path: str, doc_ext: str, remove: bool = True, backend: str = None, all_parts: bool = False
+):
+    """
+    Lire le document page par page (pdf) ou paragraphe par paragraphe (odt, docx)
+    en indiquant l'origine de chaque bloc (voir PART_ORIGINS)
+    Yields
+    ----------
+    block: tuple
+        (origin, raw text of each page or paragraph)
+    """
+    try:
+        if all_parts:
+            yield from iter_raw_parts(file_path, doc_ext, backend)
+        else:
+            for block in get_parser_backend(doc_ext, backend)(file_path):
+                yield ("body", block)
+    finally:
+        if remove and isinstance(file_path, (str, os.PathLike)) and os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def iter_doc_blocks(
+    file_path: str, doc_ext: str, remove: bool = True, backend: str = None, all_parts: bool = False
+):
+    """
+    Lire le document page par page (pdf) ou paragraphe par paragraphe (odt, docx)
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    doc_ext: str
+        the extension of the document
+    remove: bool
+        supprimer le fichier une fois lu (chemin seulement). Default to True
+    backend: str
+        le nom de la bibliothèque. Default to PARSER_CONFIG[doc_ext]
+    all_parts: bool
+        lire aussi les tableaux, notes, commentaires, en-têtes et pieds de page (odt, docx).
+        Default to False
+    Yields
+    ----------
+    block: str
+        the raw text of each page or paragraph
+    """
+    for _, block in iter_tagged_blocks(file_path, doc_ext, remove, backend, all_parts):
+        yield block
+
+
+def iter_doc_parts(
+    file_path: str, remove: bool = True, backend: str = None, filename: str = None
+):
+    """
+    Parcourir tout le document au fil de la lecture, directement depuis l'archive ODT ou DOCX:
+    corps, tableaux, notes de bas de page et de fin, commentaires, en-têtes et pieds de page
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    remove: bool
+        supprimer le fichier une fois lu (chemin seulement). Default to True
+    backend: str
+        la bibliothèque utilisée pour les PDF et les documents Word 97-2003
+        (dont seul le corps est lu). Default to PARSER_CONFIG[doc_ext]
+    filename: str
+        the name of the document when file_path is its content. Default to None
+    Returns
+    ----------
+    parts: generator
+        (origin, normalized text) for each paragraph, origin being one of PART_ORIGINS
+    Raises
+    ----------
+    ValueError:
+        Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    get_parser_backend(doc_ext, backend)
+    return (
+        (origin, WHITESPACE_REGEX.sub(" ", block))
+        for origin, block in iter_tagged_blocks(file_path, doc_ext, remove, backend, True)
+    )
+
+
+def iter_doc_chunks(
+    file_path: str,
+    remove: bool = True,
+    backend: str = None,
+    all_parts: bool = PARSE_ALL_PARTS,
+    filename: str = None,
+):
+    """
+    Parcourir le document au fil de la lecture:
+    le texte normalisé de chaque page (pdf) ou paragraphe (odt, docx)
+    est renvoyé dès qu'il est extrait (voir matching.iter_code_refs)
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    remove: bool
+        supprimer le fichier une fois lu (chemin seulement). Default to True
+    backend: str
+        le nom de la bibliothèque. Default to PARSER_CONFIG[doc_ext]
+    all_parts: bool
+        lire aussi les tableaux, notes, commentaires, en-têtes et pieds de page (odt, docx).
+        Default to PARSE_ALL_PARTS
+    filename: str
+        the name of the document when file_path is its content. Default to None
+    Returns
+    ----------
+    chunks: generator
+        the normalized text of each page or paragraph
+    Raises
+    ----------
+    ValueError:
+        Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    get_parser_backend(doc_ext, backend)
+    return (
+        WHITESPACE_REGEX.sub(" ", block)
+        for block in iter_doc_blocks(file_path, doc_ext, remove, backend, all_parts)
+    )
+
+
+def iter_doc_text(
+    file_path: str,
+    remove: bool = True,
+    backend: str = None,
+    all_parts: bool = PARSE_ALL_PARTS,
+    filename: str = None,
+):
+    """
+    Parcourir le texte de parse_doc au fil de la lecture: mis bout à bout sans séparateur,
+    les morceaux (un par page ou paragraphe) donnent exactement le texte de parse_doc,
+    à la différence de iter_doc_chunks dont chaque bloc est normalisé séparément
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    remove: bool
+        supprimer le fichier une fois lu (chemin seulement). Default to True
+    backend: str
+        le nom de la bibliothèque. Default to PARSER_CONFIG[doc_ext]
+    all_parts: bool
+        lire aussi les tableaux, notes, commentaires, en-têtes et pieds de page (odt, docx).
+        Default to PARSE_ALL_PARTS
+    filename: str
+        the name of the document when file_path is its content. Default to None
+    Returns
+    ----------
+    chunks: generator
+        the normalized text of each page or paragraph, with the whitespace before it
+    Raises
+    ----------
+    ValueError:
+        Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    get_parser_backend(doc_ext, backend)
+    return (
+        run + (content or "")
+        for run, content in iter_normalized(
+            iter_doc_blocks(file_path, doc_ext, remove, backend, all_parts)
+        )
+    )
+
+
+def normalize_whitespace_run(run: str) -> str:
+    """Une suite d'espaces complète: comme WHITESPACE_REGEX, un seul espace sauf pour un espace isolé"""
+    if len(run) == 1:
+        return WHITESPACE_REGEX.sub(" ", run)
+    return " " if run else ""
+
+
+def write_normalized(blocks, output, separator: str = " ") -> list:
+    """
+    Écrire le texte normalisé des blocs au fil de la lecture,
+    sans construire le texte complet avant sa normalisation
+
+    Le texte écrit est identique à WHITESPACE_REGEX.sub(" ", separator.join(blocks)):
+    les espaces en fin de bloc sont conservés jusqu'au bloc suivant
+    pour être réduits avec le séparateur et les espaces en début de ce bloc.
+    Arguments
+    ----------
+    blocks: iterable
+        the raw text of each page or paragraph
+    output: io.StringIO or list
+        le tampon où le texte normalisé est écrit (méthode write ou append)
+    separator: str
+        le séparateur des blocs. Default to a space
+    Returns
+    ----------
+    block_starts: list
+        the offset of the first character of each block in the normalized text
+        (for an empty block, the end of the text before it)
+    """
+    write = getattr(output, "write", None) or output.append
+    block_starts = []
+    length = 0
+    for run, content in iter_normalized(blocks, separator):
+        write(run)
+        length += len(run)
+        if content is None:
+            break
+        block_starts.append(length)
+        write(content)
+        length += len(content)
+    return block_starts
+
+
+def iter_normalized(blocks, separator: str = " "):
+    """
+    Normaliser les blocs au fil de la lecture (voir write_normalized)
+
+    Arguments
+    ----------
+    blocks: iterable
+        the raw text of each page or paragraph
+    separator: str
+        le séparateur des blocs. Default to a space
+    Yields
+    ----------
+    run, content: tuple
+        pour chaque bloc, les espaces qui le précèdent (séparateur compris) et son texte normalisé,
+        puis les espaces de fin du document avec None
+    """
+    # espaces en attente: seuls les deux premiers comptent
+    pending = ""
+    for i, block in enumerate(blocks):
+        if i > 0:
+            pending = (pending + separator)[:2]
+        lead = len(block) - len(block.lstrip())
+        if lead == len(block):
+            pending = (pending + block)[:2]
+            yield "", ""
+            continue
+        trail = len(block.rstrip())
+        run = normalize_whitespace_run((pending + block[:lead])[:2])
+        yield run, WHITESPACE_REGEX.sub(" ", block[lead:trail])
+        pending = block[trail:][:2]
+    yield normalize_whitespace_run(pending), None
+
+
+def parse_doc(
+    file_path: str,
+    with_blocks: bool = False,
+    backend: str = None,
+    all_parts: bool = PARSE_ALL_PARTS,
+    filename: str = None,
+):
+    """
+    Parcourir le document pour en extraire le texte
+    Arguments
+    ----------
+    file_path: str, bytes or file
+        absolute filepath of the document or its content
+    with_blocks: bool
+        renvoyer aussi la position de chaque page (pdf) ou paragraphe (odt, docx)
+        dans le texte. Default to False
+    backend: str
+        le nom de la bibliothèque. Default to PARSER_CONFIG[doc_ext]
+    all_parts: bool
+        lire aussi les tableaux, notes, commentaires, en-têtes et pieds de page (odt, docx).
+        Default to PARSE_ALL_PARTS
+    filename: str
+        the name of the document when file_path is its content. Default to None
+    Returns
+    ----------
+    full_text: str
+        the normalized text of the document
+    block_starts: list
+        (with_blocks) the offset of each page or paragraph in full_text
+    Raises
+    ----------
+    Exception:
+        Extension incorrecte. Les types de fichiers supportés sont odt, doc, docx, pdf
+    FileNotFoundError:
+        File has not been found. File_path must be incorrect
+    """
+    doc_ext = get_doc_extension(file_path, filename)
+    # une entrée par page (pdf) ou par paragraphe (odt, docx), normalisée dès sa lecture
+    output = io.StringIO()
+    block_starts = write_normalized(
+        iter_doc_blocks(file_path, doc_ext, backend=backend, all_parts=all_parts), output
     )
-    return full_text
+    full_text = output.getvalue()
+    if not with_blocks:
+        return full_text
+    return full_text, block_starts
@@ -3,35 +3,255 @@
 """
 Module pour requeter l'API
 
-- authentification
+- session HTTP partagée (pool de connexions persistantes)
+- authentification (jeton mis en cache pour tout le processus)
+- cache des identifiants et contenus d'articles (voir article_cache)
 - get_article_id
 - get_article_content
 - get_article: module complet avec le status de l'article
+  (API Légifrance ou index local LEGI selon API_BACKEND, voir legi_index)
+- get_articles: résolution groupée de nombreuses références
 """
 
+import contextlib
+import os
 import requests
+import threading
 import time
-from code_references import get_code_full_name_from_short_code
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from article_cache import get_cache, make_key, MISSING
+import legi_index
+from code_references import get_code_full_name_from_short_code, get_long_and_short_code
 from check_validity import (
     convert_epoch_to_datetime,
     convert_datetime_to_str,
     get_validity_status,
 )
 
-API_ROOT_URL = "https://sandbox-api.piste.gouv.fr/dila/legifrance-beta/lf-engine-app/"
+API_ROOT_URL = os.getenv(
+    "API_ROOT_URL",
+    "https://sandbox-api.piste.gouv.fr/dila/legifrance-beta/lf-engine-app/",
+)
 # API_ROOT_URL =  "https://api.piste.gouv.fr/dila/legifrance-beta/lf-engine-app/",
 
 
-def get_legifrance_auth(client_id, client_secret):
+TOKEN_URL = os.getenv(
+    "API_TOKEN_URL", "https://sandbox-oauth.piste.gouv.fr/api/oauth/token"
+)
+# TOKEN_URL = "https://sandbox-oauth.aife.economie.gouv.fr/api/oauth/token"
+
+# Taille du pool de connexions et délais (connexion, lecture) en secondes
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", 10))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 5))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", 30))
+
+_SESSION = None
+_SESSION_PID = None
+_SESSION_LOCK = threading.Lock()
+_TRANSPORT = None
+# Nombre de requêtes HTTP envoyées par le processus
+_API_CALLS = 0
+_API_CALLS_LOCK = threading.Lock()
+
+# Nombre de numéros d'articles par recherche groupée et par page de résultats
+BATCH_SIZE = int(os.getenv("API_BATCH_SIZE", 20))
+BATCH_PAGE_SIZE = 100
+
+# Le jeton est renouvelé un peu avant son expiration
+TOKEN_EXPIRY_MARGIN = 60
+
+# (client_id, client_secret) -> (authorization_header, expires_at)
+_TOKEN_CACHE = {}
+# "Bearer ..." -> (client_id, client_secret): jeton en cours et précédent de chaque clé,
+# pour renouveler le jeton refusé par Légifrance (401, voir api_post)
+_TOKEN_KEYS = {}
+_TOKEN_LOCK = threading.Lock()
+
+
+def get_session():
+    """
+    Get the HTTP session shared by every API call of the process
+
+    The session keeps its connections alive in a pool of API_POOL_SIZE
+    connections. It is rebuilt in a forked child (eg. gunicorn workers)
+    so that sockets are never shared between processes.
+
+    Returns
+    --------
+    session: requests.Session
+        the session of the current process
+    """
+    global _SESSION, _SESSION_PID
+    pid = os.getpid()
+    with _SESSION_LOCK:
+        if _SESSION is None or _SESSION_PID != pid:
+            session = requests.Session()
+            adapter = _TRANSPORT
+            if adapter is None:
+                adapter = HTTPAdapter(
+                    pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE
+                )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSION, _SESSION_PID = session, pid
+        return _SESSION
+
+
+def set_transport(adapter=None):
+    """
+    Replace the transport adapter of the shared session
+
+    Arguments
+    ---------
+    adapter: requests.adapters.BaseAdapter
+        the adapter to mount for http:// and https://
+        (eg. a stub for tests). Default to None: the pooled HTTPAdapter
+    """
+    global _TRANSPORT
+    close_session()
+    _TRANSPORT = adapter
+
+
+def close_session():
+    """
+    Close the shared session and its pooled connections
+    """
+    global _SESSION, _SESSION_PID
+    with _SESSION_LOCK:
+        if _SESSION is not None and _SESSION_PID == os.getpid():
+            _SESSION.close()
+        _SESSION, _SESSION_PID = None, None
+
+
+_LOCAL = threading.local()
+
+
+class ApiCallCounter:
+    """
+    Nombre de requêtes HTTP envoyées par les threads où le compteur est actif
+    (voir active): les requêtes des autres threads du processus ne sont pas comptées
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.calls += 1
+
+    @contextlib.contextmanager
+    def active(self):
+        """Compter les requêtes envoyées par le thread courant"""
+        counters = getattr(_LOCAL, "counters", None)
+        if counters is None:
+            counters = _LOCAL.counters = []
+        counters.append(self)
+        try:
+            yield self
+        finally:
+            counters.remove(self)
+
+
+def api_post(url, **kwargs):
+    """
+    POST through the shared session with the configured timeouts
+
+    A request refused with a 401 is sent once more with a new token
+    (see refresh_legifrance_auth).
+
+    Arguments
+    ---------
+    url: str
+        the requested url
+    **kwargs:
+        the arguments of requests.Session.post
+
+    Returns
+    --------
+    response: requests.Response
+    """
+    global _API_CALLS
+    kwargs.setdefault("timeout", (API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    for attempt in range(2):
+        with _API_CALLS_LOCK:
+            _API_CALLS += 1
+        for counter in getattr(_LOCAL, "counters", ()):
+            counter.add()
+        response = get_session().post(url, **kwargs)
+        if response.status_code != 401 or attempt > 0 or not kwargs.get("headers"):
+            return response
+        # jeton révoqué avant son expiration (ou horloges décalées): renouvelé une fois
+        headers = refresh_legifrance_auth(kwargs["headers"])
+        if headers is None:
+            return response
+        # le nouveau jeton sert aussi aux requêtes suivantes de l'appelant
+        kwargs["headers"].update(headers)
+    return response
+
+
+def get_api_calls():
+    """
+    Number of HTTP requests sent by the process since it started
+    """
+    return _API_CALLS
+
+
+def request_legifrance_token(client_id, client_secret):
+    """
+    Request a new OAUTH token from PISTE authentication server
+
+    Arguments
+    ---------
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+
+    Returns
+    ---------
+    token: dict
+        the raw json response with access_token and expires_in
+
+    Raise
+    ------
+    Exception:
+        Invalid credentials. Request to authentication server failed with 400 or 401 error
+    """
+    res = api_post(
+        TOKEN_URL,
+        data={
+            "grant_type": "client_credentials",
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "scope": "openid",
+        },
+    )
+
+    if res.status_code in [400, 401]:
+        # return HTTPError(res.status_code, "Unauthorized: invalid credentials")
+        raise Exception(f"HTTP Error code: {res.status_code}: Invalid credentials")
+    return res.json()
+
+
+def get_legifrance_auth(client_id, client_secret, force_refresh=False):
     """
     Get authorization token from LEGIFRANCE API
 
+    The token is shared by every thread of the process: it is requested once,
+    then reused until `expires_in` minus TOKEN_EXPIRY_MARGIN seconds
+    or until the API refuses it (see refresh_legifrance_auth).
+    Only one thread refreshes the token at a time, the others wait for it.
+
     Arguments
     ---------
     client_id: str
         OAUTH CLIENT key provided by API
     client_secret: str
         OAUTH SECRET key provided by API
+    force_refresh: bool
+        ignore the cached token and request a new one. Default to False
 
     Returns
     ---------
@@ -45,40 +265,88 @@ def get_legifrance_auth(client_id, client_secret):
     Exception:
         Invalid credentials. Request to authentication server failed with 400 or 401 error
     """
-
-    TOKEN_URL = "https://sandbox-oauth.piste.gouv.fr/api/oauth/token"
-    # TOKEN_URL = "https://sandbox-oauth.aife.economie.gouv.fr/api/oauth/token"
-
     if client_id is None or client_secret is None:
         # return HTTPError(401, "No credential have been set")
         raise ValueError(
             "No credential: client_id or/and client_secret are not set."
             + "\nPlease register your API at https://developer.aife.economie.gouv.fr/"
         )
-    session = requests.Session()
-    with session as s:
-        res = s.post(
-            TOKEN_URL,
-            data={
-                "grant_type": "client_credentials",
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "scope": "openid",
-            },
-        )
+    key = (client_id, client_secret)
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CACHE.get(key)
+        if not force_refresh and cached is not None and cached[1] > time.monotonic():
+            return dict(cached[0])
+        return dict(_request_cached_token(key))
+
 
-        if res.status_code in [400, 401]:
-            # return HTTPError(res.status_code, "Unauthorized: invalid credentials")
-            raise Exception(f"HTTP Error code: {res.status_code}: Invalid credentials")
-        token = res.json()
+def _request_cached_token(key):
+    # avec _TOKEN_LOCK: un seul thread demande un nouveau jeton
+    token = request_legifrance_token(*key)
     access_token = token["access_token"]
-    return {"Authorization": f"Bearer {access_token}"}
+    expires_in = int(token.get("expires_in", 3600))
+    headers = {"Authorization": f"Bearer {access_token}"}
+    expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+    previous = _TOKEN_CACHE.get(key)
+    for authorization in [a for a, k in _TOKEN_KEYS.items() if k == key]:
+        if previous is None or authorization != previous[0]["Authorization"]:
+            del _TOKEN_KEYS[authorization]
+    _TOKEN_KEYS[headers["Authorization"]] = key
+    _TOKEN_CACHE[key] = (headers, expires_at)
+    return headers
+
+
+def refresh_legifrance_auth(headers):
+    """
+    Replace a token refused by the API (401) before its computed expiry
+
+    The refused token is forgotten and a new one is requested once:
+    the other threads that were refused the same token get the new one.
+
+    Arguments
+    ---------
+    headers: dict
+        the authorization header sent with the refused request
+
+    Returns
+    ---------
+    authorization_header: dict
+        the new header, or None if the token was not issued by get_legifrance_auth
+    """
+    authorization = headers.get("Authorization")
+    with _TOKEN_LOCK:
+        key = _TOKEN_KEYS.get(authorization)
+        if key is None:
+            return None
+        cached = _TOKEN_CACHE.get(key)
+        if (
+            cached is not None
+            and cached[0]["Authorization"] != authorization
+            and cached[1] > time.monotonic()
+        ):
+            # déjà renouvelé par un autre thread
+            return dict(cached[0])
+        try:
+            return dict(_request_cached_token(key))
+        except Exception:
+            # le jeton refusé n'est plus servi par get_legifrance_auth
+            _TOKEN_CACHE.pop(key, None)
+            raise
+
+
+def clear_legifrance_auth():
+    """
+    Forget every cached token (eg. after a credential rotation)
+    """
+    with _TOKEN_LOCK:
+        _TOKEN_CACHE.clear()
+        _TOKEN_KEYS.clear()
 
 
 def get_article_uid(short_code_name, article_number, headers):
     """
     GET the article uid given by [Legifrance API]
     (https://developer.aife.economie.gouv.fr/index.php?option=com_apiportal&view=apitester&usage=api&apitab=tests&apiName=L%C3%A9gifrance+Beta&apiId=426cf3c0-1c6d-46ba-a8b0-f79289086ed5&managerId=2&type=rest&apiVersion=1.6.2.5&Itemid=402&swaggerVersion=2.0&lang=fr)
+    The uid is cached by (code, article_number, today's date), see article_cache.
 
     Arguments
     ---------
@@ -101,9 +369,35 @@ def get_article_uid(short_code_name, article_number, headers):
     long_code = get_code_full_name_from_short_code(short_code_name)
     if long_code is None:
         raise ValueError(f"`{short_code_name}` not found in the supported Code List")
+    cache = get_cache()
+    key = make_key("uid", long_code, article_number, time.strftime("%Y-%m-%d"))
+    article_uid = cache.get(key)
+    if article_uid is MISSING:
+        article_uid = search_article_uid(long_code, article_number, headers)
+        cache.set(key, article_uid)
+    return article_uid
 
-    session = requests.Session()
 
+def search_article_uid(long_code, article_number, headers):
+    """
+    POST /search: search the uid of the article in force today (no cache)
+
+    Arguments
+    ---------
+    long_code: str
+        Nom du code de droit français (version longue)
+    article_number: str
+        Référence de l'article mentionné (version normalisée eg. L25-67)
+
+    Returns
+    --------
+    article_uid: str
+        Identifiant unique de l'article dans Legifrance LEGIART000xxxx or None
+    Raises
+    ------
+    Exception:
+        La requete a échoué response.status_code [400-500]
+    """
     today_epoch = int(time.time()) * 1000
     data = {
         "recherche": {
@@ -132,16 +426,13 @@ def get_article_uid(short_code_name, article_number, headers):
         },
         "fond": "CODE_DATE",
     }
-    with session as s:
-        response = s.post(
-            "/".join([API_ROOT_URL, "search"]), headers=headers, json=data
-        )
-        if response.status_code > 399:
-            # print(response)
-            # return None
-            raise Exception(f"Error {response.status_code}: {response.reason}")
+    response = api_post("/".join([API_ROOT_URL, "search"]), headers=headers, json=data)
+    if response.status_code > 399:
+        # print(response)
+        # return None
+        raise Exception(f"Error {response.status_code}: {response.reason}")
 
-        article_informations = response.json()
+    article_informations = response.json()
     if not article_informations["results"]:
         return None
 
@@ -161,6 +452,7 @@ def get_article_content(article_id, headers):
     GET article_content from LEGIFRANCE API using
     POST /consult/getArticle
     https://developer.aife.economie.gouv.fr/index.php?option=com_apiportal&view=apitester&usage=api&apitab=tests&apiName=L%C3%A9gifrance+Beta&apiId=426cf3c0-1c6d-46ba-a8b0-f79289086ed5&managerId=2&type=rest&apiVersion=1.6.2.5&Itemid=402&swaggerVersion=2.0&lang=fr
+    The content is cached by (article_id, today's date), see article_cache.
 
     Arguments
     ----------
@@ -175,19 +467,43 @@ def get_article_content(article_id, headers):
     Exception
         response.status_code [400-500]
     """
-    data = {"id": article_id}
-    session = requests.Session()
-    with session as s:
+    cache = get_cache()
+    key = make_key("content", article_id, time.strftime("%Y-%m-%d"))
+    article = cache.get(key)
+    if article is MISSING:
+        article = fetch_article_content(article_id, headers)
+        if article is not None:
+            cache.set(key, article)
+    return article
 
-        response = s.post(
-            "/".join([API_ROOT_URL, "consult", "getArticle"]),
-            headers=headers,
-            json=data,
-        )
 
-        if response.status_code > 399:
-            raise Exception(f"Error {response.status_code}: {response.reason}")
-        article_content = response.json()
+def fetch_article_content(article_id, headers):
+    """
+    POST /consult/getArticle: get article_content from LEGIFRANCE API (no cache)
+
+    Arguments
+    ----------
+    article_id: str
+        article uid eg. LEGIARTI000006307920
+    Returns
+    -------
+    article_content: dict
+        a dictionnary with the full content of article
+    Raise
+    -------
+    Exception
+        response.status_code [400-500]
+    """
+    data = {"id": article_id}
+    response = api_post(
+        "/".join([API_ROOT_URL, "consult", "getArticle"]),
+        headers=headers,
+        json=data,
+    )
+
+    if response.status_code > 399:
+        raise Exception(f"Error {response.status_code}: {response.reason}")
+    article_content = response.json()
     try:
         raw_article = article_content["article"]
         # FEATURE récupérer tous les titres et sections d'un article
@@ -233,20 +549,47 @@ def get_article_content_by_id_and_article_nb(article_id, article_num, headers):
 
     data = {"id": article_id, "num": article_num}
 
-    session = requests.Session()
-    with session as s:
-
-        response = s.post(
-            "/".join([API_ROOT_URL, "consult", "getArticleWithIdandNum"]),
-            headers=headers,
-            json=data,
-        )
-        if response.status_code > 399:
-            raise Exception(f"Error {response.status_code}: {response.reason}")
-        article_content = response.json()
+    response = api_post(
+        "/".join([API_ROOT_URL, "consult", "getArticleWithIdandNum"]),
+        headers=headers,
+        json=data,
+    )
+    if response.status_code > 399:
+        raise Exception(f"Error {response.status_code}: {response.reason}")
+    article_content = response.json()
     return article_content["article"]
 
 
+def new_article(short_code_name, article_number):
+    """
+    Construire le dictionnaire de résultat d'un article non encore résolu
+
+    Arguments
+    ---------
+    short_code_name: str
+        Nom du code (version courte ou longue)
+    article_number: str
+        Numéro de l'article de loi normalisé
+    Returns
+    --------
+    article: dict
+        le dictionnaire avec les valeurs par défaut
+    """
+    return {
+        "code": short_code_name,
+        "code_full_name": get_code_full_name_from_short_code(short_code_name),
+        "article": article_number,
+        "status_code": 200,
+        "status": "OK",
+        "color": "secondary",
+        "url": "",
+        "texte": "",
+        "date_debut": "",
+        "date_fin": "",
+        "id": None,
+    }
+
+
 def set_article_not_found(article):
     article["color"] = "dark"
     article["status_code"] = 404
@@ -255,6 +598,108 @@ def set_article_not_found(article):
     return article
 
 
+def set_article_timeout(article):
+    article["color"] = "dark"
+    article["status_code"] = 408
+    article["status"] = "Délai dépassé"
+    article["texte"] = ""
+    return article
+
+
+def get_backend():
+    """
+    Backend de résolution des articles défini par API_BACKEND:
+    online (API Légifrance, par défaut) ou offline (index local LEGI)
+    """
+    backend = os.getenv("API_BACKEND", "online")
+    if backend not in ("online", "offline"):
+        raise ValueError(
+            f"Wrong backend `{backend}`: choose between 'online' or 'offline'"
+        )
+    return backend
+
+
+def set_article_content(
+    article, article_content, past_year_nb=3, future_year_nb=3, timer=None
+):
+    """
+    Compléter l'article avec son contenu et son status de validité
+
+    Arguments
+    ---------
+    article: dict
+        le dictionnaire de résultat (voir new_article)
+    article_content: dict
+        le contenu de l'article (voir get_article_content)
+    past_year_nb: int
+        Nombre d'années en arrière à surveiller
+    future_year_nb: int
+        Nombre d'années en avant à surveiller
+    timer: callable
+        reçoit la durée du calcul de validité: timer("validate", seconds)
+        (eg. codeislow.Profile.add). Default to None
+    Returns
+    --------
+    article: dict
+        le dictionnaire de résultat complété
+    """
+    article["texte"] = article_content["texte"]
+    article["url"] = article_content["url"]
+    article["start_date"] = convert_epoch_to_datetime(article_content["dateDebut"])
+    article["end_date"] = convert_epoch_to_datetime(article_content["dateFin"])
+    start = time.perf_counter()
+    article["status_code"], article["status"], article["color"] = get_validity_status(
+        article["start_date"], article["end_date"], past_year_nb, future_year_nb
+    )
+    if timer is not None:
+        timer("validate", time.perf_counter() - start)
+    article["date_debut"] = convert_datetime_to_str(article["start_date"]).split(" ")[0]
+    article["date_fin"] = convert_datetime_to_str(article["end_date"]).split(" ")[0]
+    del article["start_date"]
+    del article["end_date"]
+    return article
+
+
+def get_offline_article(
+    short_code_name, article_number, past_year_nb=3, future_year_nb=3, timer=None
+):
+    """
+    Accéder aux informations simplifiée de l'article depuis l'index local LEGI
+    sans aucun appel réseau
+
+    Arguments
+    ---------
+    short_code_name: str
+        Nom du code de loi française (version courte ou longue)
+    article_number: str
+        Numéro de l'article de loi normalisé
+        ex. R25-67 L214 ou 2667-1-1
+    timer: callable
+        reçoit la durée du calcul de validité (voir set_article_content). Default to None
+    Returns
+    --------
+    article: dict
+        le même dictionnaire que get_article
+    """
+    article = new_article(short_code_name, article_number)
+    short_code = get_long_and_short_code(short_code_name)[1]
+    index_path = os.getenv("LEGI_INDEX_PATH", legi_index.LEGI_INDEX_PATH)
+    article_content = legi_index.get_article_content(
+        short_code, article_number, index_path
+    )
+    if article_content is None:
+        # test with less info
+        article_number_tmp = article_number.split("-")[0]
+        if article_number_tmp != article_number:
+            article_content = legi_index.get_article_content(
+                short_code, article_number_tmp, index_path
+            )
+    if article_content is None:
+        return set_article_not_found(article)
+    article["id"] = article_content["id"]
+    return set_article_content(article, article_content, past_year_nb, future_year_nb, timer)
+
+
 def get_article(
     short_code_name,
     article_number,
@@ -262,6 +707,7 @@ def get_article(
     client_secret,
     past_year_nb=3,
     future_year_nb=3,
+    timer=None,
 ):
     """
     Accéder aux informations simplifiée de l'article
@@ -273,29 +719,21 @@ def get_article(
     article_number: str
         Numéro de l'article de loi normalisé
         ex. R25-67 L214 ou 2667-1-1
+    timer: callable
+        reçoit la durée du calcul de validité (voir set_article_content). Default to None
     Returns
     --------
     article: str
         Un dictionnaire json avec code (version courte), article (numéro), status, status_code, color, url, text, id, start_date, end_date, date_debut, date_fin
     """
+    if get_backend() == "offline":
+        return get_offline_article(
+            short_code_name, article_number, past_year_nb, future_year_nb, timer
+        )
 
-    article = {
-        "code": short_code_name,
-        "code_full_name": get_code_full_name_from_short_code(short_code_name),
-        "article": article_number,
-        "status_code": 200,
-        "status": "OK",
-        "color": "secondary",
-        "url": "",
-        "texte": "",
-        "date_debut": "",
-        "date_fin": "",
-        "id": get_article_uid(
-            short_code_name,
-            article_number,
-            headers=get_legifrance_auth(client_id, client_secret),
-        ),
-    }
+    headers = get_legifrance_auth(client_id, client_secret)
+    article = new_article(short_code_name, article_number)
+    article["id"] = get_article_uid(short_code_name, article_number, headers=headers)
     if article["id"] is None:
         # test with less info
         article_number_tmp = article_number.split("-")[0]
@@ -303,7 +741,7 @@ def get_article(
             article["id"] = get_article_uid(
                 short_code_name,
                 article_number_tmp,
-                headers=get_legifrance_auth(client_id, client_secret),
+                headers=headers,
             )
             if article["id"] is None:
                 return set_article_not_found(article)
@@ -311,18 +749,203 @@ def get_article(
         else:
             return set_article_not_found(article)
 
-    article_content = get_article_content(
-        article["id"], headers=get_legifrance_auth(client_id, client_secret)
-    )
-    article["texte"] = article_content["texte"]
-    article["url"] = article_content["url"]
-    article["start_date"] = convert_epoch_to_datetime(article_content["dateDebut"])
-    article["end_date"] = convert_epoch_to_datetime(article_content["dateFin"])
-    article["status_code"], article["status"], article["color"] = get_validity_status(
-        article["start_date"], article["end_date"], past_year_nb, future_year_nb
+    article_content = get_article_content(article["id"], headers=headers)
+    return set_article_content(article, article_content, past_year_nb, future_year_nb, timer)
+
+
+def search_articles_uid(long_code, article_numbers, headers):
+    """
+    POST /search: search the uids of several articles of a same code
+    in one combined search (one NUM_ARTICLE criterion per article), page by page
+
+    Arguments
+    ---------
+    long_code: str
+        Nom du code de droit français (version longue)
+    article_numbers: list
+        Références des articles (version normalisée eg. L25-67)
+
+    Returns
+    --------
+    article_uids: dict
+        {article_number: article_uid} for the articles found
+    Raises
+    ------
+    Exception:
+        La requete a échoué response.status_code [400-500]
+    """
+    today_epoch = int(time.time()) * 1000
+    wanted = {legi_index.normalize_num(n): n for n in article_numbers}
+    article_uids = {}
+    page_number = 1
+    while True:
+        data = {
+            "recherche": {
+                "champs": [
+                    {
+                        "typeChamp": "NUM_ARTICLE",
+                        "criteres": [
+                            {
+                                "typeRecherche": "EXACTE",
+                                "valeur": article_number,
+                                "operateur": "OU",
+                            }
+                            for article_number in article_numbers
+                        ],
+                        "operateur": "OU",
+                    }
+                ],
+                "filtres": [
+                    {"facette": "NOM_CODE", "valeurs": [long_code]},
+                    {"facette": "DATE_VERSION", "singleDate": today_epoch},
+                ],
+                "pageNumber": page_number,
+                "pageSize": BATCH_PAGE_SIZE,
+                "operateur": "ET",
+                "sort": "PERTINENCE",
+                "typePagination": "ARTICLE",
+            },
+            "fond": "CODE_DATE",
+        }
+        response = api_post(
+            "/".join([API_ROOT_URL, "search"]), headers=headers, json=data
+        )
+        if response.status_code > 399:
+            raise Exception(f"Error {response.status_code}: {response.reason}")
+        article_informations = response.json()
+        results = article_informations.get("results") or []
+        for result in results:
+            for section in result.get("sections", []):
+                for extract in section.get("extracts", []):
+                    num = legi_index.normalize_num(extract.get("num") or "")
+                    if num in wanted and wanted[num] not in article_uids:
+                        article_uids[wanted[num]] = extract["id"]
+        total = article_informations.get("totalResultNumber", 0)
+        if (
+            len(results) < BATCH_PAGE_SIZE
+            or page_number * BATCH_PAGE_SIZE >= total
+            or len(article_uids) == len(wanted)
+        ):
+            return article_uids
+        page_number += 1
+
+
+def get_articles(
+    references,
+    client_id,
+    client_secret,
+    past_year_nb=3,
+    future_year_nb=3,
+    max_workers=API_POOL_SIZE,
+):
+    """
+    Résoudre de nombreuses références en groupant les recherches par code
+
+    Les identifiants sont recherchés par lots de BATCH_SIZE articles d'un même code,
+    puis les contenus sont demandés en parallèle. Si une recherche groupée échoue
+    ou ne trouve pas un article, celui-ci est résolu individuellement avec get_article.
+
+    Arguments
+    ---------
+    references: iterable
+        les références (code, article_number) à résoudre
+    client_id: str
+        OAUTH CLIENT key provided by API
+    client_secret: str
+        OAUTH SECRET key provided by API
+    past_year_nb: int
+        Nombre d'années en arrière à surveiller
+    future_year_nb: int
+        Nombre d'années en avant à surveiller
+    max_workers: int
+        Nombre maximum de requêtes simultanées
+    Returns
+    --------
+    articles: dict
+        {(code, article_number): article} avec le même article que get_article
+    stats: dict
+        nombre de références, de requêtes HTTP envoyées (http_calls) et estimation
+        des requêtes économisées par rapport à une résolution article par article
+        (estimated_saved_calls)
+    """
+    references = list(dict.fromkeys(tuple(reference) for reference in references))
+    articles = {}
+    if get_backend() == "offline":
+        for code, article_number in references:
+            articles[(code, article_number)] = get_offline_article(
+                code, article_number, past_year_nb, future_year_nb
+            )
+        stats = {"references": len(references), "http_calls": 0, "estimated_saved_calls": 0}
+        return articles, stats
+
+    headers = get_legifrance_auth(client_id, client_secret)
+    # requêtes de cette résolution seulement (pas celles des autres threads du processus)
+    counter = ApiCallCounter()
+    cache = get_cache()
+    today = time.strftime("%Y-%m-%d")
+    by_code = {}
+    uids = {}
+    for code, article_number in references:
+        long_code = get_code_full_name_from_short_code(code)
+        if long_code is None:
+            raise ValueError(f"`{code}` not found in the supported Code List")
+        article_uid = cache.get(make_key("uid", long_code, article_number, today))
+        if article_uid is MISSING:
+            by_code.setdefault(long_code, []).append((code, article_number))
+        elif article_uid is not None:
+            uids[(code, article_number)] = article_uid
+    searched = {reference for code_refs in by_code.values() for reference in code_refs}
+    fallback = [
+        reference for reference in references if reference not in uids and reference not in searched
+    ]
+    with counter.active():
+        for long_code, code_refs in by_code.items():
+            for i in range(0, len(code_refs), BATCH_SIZE):
+                batch = code_refs[i : i + BATCH_SIZE]
+                try:
+                    found = search_articles_uid(
+                        long_code, [article_number for _, article_number in batch], headers
+                    )
+                except Exception:
+                    fallback.extend(batch)
+                    continue
+                for code, article_number in batch:
+                    if article_number in found:
+                        uids[(code, article_number)] = found[article_number]
+                        cache.set(
+                            make_key("uid", long_code, article_number, today),
+                            found[article_number],
+                        )
+                    else:
+                        fallback.append((code, article_number))
+
+    def resolve(reference):
+        code, article_number = reference
+        with counter.active():
+            if reference not in uids:
+                return get_article(
+                    code, article_number, client_id, client_secret, past_year_nb, future_year_nb
+                )
+            article = new_article(code, article_number)
+            article["id"] = uids[reference]
+            article_content = get_article_content(article["id"], headers=headers)
+        return set_article_content(article, article_content, past_year_nb, future_year_nb)
+
+    to_resolve = list(uids) + fallback
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for reference, article in zip(to_resolve, executor.map(resolve, to_resolve)):
+            articles[reference] = article
+
+    http_calls = counter.calls
+    # estimation sans regroupement: une recherche par article (deux si le numéro est réduit)
+    # puis une requête pour le contenu de chaque article trouvé
+    expected_calls = sum(
+        (2 if article["id"] is not None else 1 + ("-" in article_number))
+        for (code, article_number), article in articles.items()
     )
-    article["date_debut"] = convert_datetime_to_str(article["start_date"]).split(" ")[0]
-    article["date_fin"] = convert_datetime_to_str(article["end_date"]).split(" ")[0]
-    del article["start_date"]
-    del article["end_date"]
-    return article
+    stats = {
+        "references": len(references),
+        "http_calls": http_calls,
+        "estimated_saved_calls": max(expected_calls - http_calls, 0),
+    }
+    return {reference: articles[reference] for reference in references}, stats
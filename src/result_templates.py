@@ -79,3 +79,48 @@ end_results = """</tbody>
   
 </body>
 </html>"""
+
+# Suivi d'une analyse en cours (jobs.iter_event_stream): les résultats sont ajoutés à la table
+# au fil des évènements. L'adresse du flux est dans l'attribut data-events de #processing
+stream_results = """<script>
+(function () {
+    var processing = document.getElementById("processing");
+    if (!processing || !window.EventSource) {
+        return;
+    }
+    var rows = document.querySelector("table tbody");
+    var progress = processing.querySelector(".progress-text");
+    var source = new EventSource(processing.getAttribute("data-events"));
+    function add_row(data) {
+        if (data.html) {
+            rows.insertAdjacentHTML("beforeend", data.html);
+        }
+    }
+    source.addEventListener("started", function () {
+        // analyse reprise après l'arrêt d'un processus: les résultats précédents sont remplacés
+        rows.innerHTML = "";
+    });
+    source.addEventListener("references", function (e) {
+        var data = JSON.parse(e.data);
+        add_row(data);
+        progress.textContent = data.references + " référence(s) détectée(s), 0/" + data.total + " article(s) vérifié(s)";
+    });
+    source.addEventListener("article", function (e) {
+        var data = JSON.parse(e.data);
+        add_row(data);
+        progress.textContent = (data.position + 1) + "/" + data.total + " article(s) vérifié(s)";
+    });
+    source.addEventListener("finished", function (e) {
+        var data = JSON.parse(e.data);
+        source.close();
+        add_row(data);
+        if (data.status === "failed") {
+            processing.className = "alert alert-warning";
+            progress.textContent = "Quelque chose s'est mal passé: " + data.error;
+        } else {
+            processing.style.display = "none";
+        }
+    });
+})();
+</script>
+"""
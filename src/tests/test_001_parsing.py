@@ -1,10 +1,30 @@
 #!/usr/bin/env python
 
+import io
 import os
 import shutil
 import pytest
 from .context import parsing
-from parsing import ACCEPTED_EXTENSIONS, parse_doc
+from matching import get_matching_result_item
+from parsing import (
+    ACCEPTED_EXTENSIONS,
+    parse_doc,
+    iter_doc_chunks,
+    iter_doc_text,
+    check_document,
+    DOCUMENT_ERRORS,
+    iter_pdf_pages,
+    get_parser_backend,
+    iter_odt_paragraphs,
+    iter_odt_stream_paragraphs,
+    iter_docx_paragraphs,
+    iter_doc_parts,
+    write_normalized,
+    WHITESPACE_REGEX,
+)
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from PyPDF2 import PdfReader, PdfWriter
 
 
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -100,4 +120,348 @@ class TestFileParsing:
         doc_name, doc_ext = abspath.split("/")[-1].split(".")
         assert doc_ext == "odt", doc_ext
         assert full_text.lower().count("art") > 1, full_text.count("art")
-        assert full_text.lower().count("code") > 1, full_text.count("code")
\ No newline at end of file
+        assert full_text.lower().count("code") > 1, full_text.count("code")
+
+
+class TestDocChunks:
+    def test_wrong_extension(self):
+        with pytest.raises(ValueError):
+            iter_doc_chunks("document.rtf")
+
+    def test_pdf_pages(self):
+        file_path = "newtest.pdf"
+        abspath = archive_test_file(file_path)
+        chunks = iter_doc_chunks(abspath, remove=False)
+        first = next(chunks)
+        assert "Code" in first
+        pages = [first] + list(chunks)
+        assert os.path.exists(abspath)
+        full_text = parse_doc(abspath)
+        assert not os.path.exists(abspath)
+        assert " ".join(pages) == full_text
+
+    @pytest.mark.parametrize("file_path", ["newtest.pdf", "testnew.odt", "newtest.docx"])
+    def test_text_chunks(self, file_path):
+        with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+            content = f.read()
+        chunks = list(iter_doc_text(content, filename=file_path))
+        assert len(chunks) > 1
+        assert "".join(chunks) == parse_doc(content, filename=file_path)
+
+    def test_check_document(self):
+        for file_path in ["newtest.pdf", "newtest.odt", "newtest.docx", "newtest.doc"]:
+            with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+                check_document(f.read(), file_path)
+        with pytest.raises(ValueError):
+            check_document(b"", "document.rtf")
+        # une archive zip sans la partie principale du format
+        with open(os.path.join(TEST_DIR, "newtest.docx"), "rb") as f:
+            with pytest.raises(DOCUMENT_ERRORS):
+                check_document(f.read(), "newtest.odt")
+        with pytest.raises(DOCUMENT_ERRORS):
+            check_document(b"not a pdf", "newtest.pdf")
+
+    def test_paragraphs_removed(self):
+        file_path = "testnew.odt"
+        abspath = archive_test_file(file_path)
+        paragraphs = list(iter_doc_chunks(abspath))
+        assert not os.path.exists(abspath)
+        assert len(paragraphs) > 1
+        assert all("  " not in p and "\n" not in p for p in paragraphs)
+
+
+@pytest.fixture
+def long_pdf(tmp_path):
+    """un PDF de 12 pages alternant newtest.pdf et testnew.pdf"""
+    writer = PdfWriter()
+    for i in range(6):
+        for file_path in ["newtest.pdf", "testnew.pdf"]:
+            writer.add_page(PdfReader(os.path.join(TEST_DIR, file_path)).pages[0])
+    file_path = str(tmp_path / "long.pdf")
+    with open(file_path, "wb") as f:
+        writer.write(f)
+    return file_path
+
+
+class TestParallelPdf:
+    def test_small_document_serial(self, long_pdf, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError("no process pool for small documents")
+
+        monkeypatch.setattr(parsing, "ProcessPoolExecutor", fail)
+        assert len(list(iter_pdf_pages(long_pdf, workers=4))) == 12
+
+    def test_parallel_order(self, long_pdf, monkeypatch):
+        monkeypatch.setattr(parsing, "PDF_PARALLEL_MIN_PAGES", 2)
+        monkeypatch.setattr(parsing, "PDF_PAGES_PER_TASK", 5)
+        serial = list(iter_pdf_pages(long_pdf, workers=1))
+        assert list(iter_pdf_pages(long_pdf, workers=2)) == serial
+        assert serial[0] != serial[1] and serial[0] == serial[2]
+
+    def test_parallel_content(self, long_pdf, monkeypatch):
+        monkeypatch.setattr(parsing, "PDF_PARALLEL_MIN_PAGES", 2)
+        paths = []
+        iter_parallel = parsing.iter_pdf_pages_parallel
+
+        def spy(file_path, nb_pages, workers):
+            paths.append(file_path)
+            yield from iter_parallel(file_path, nb_pages, workers)
+
+        monkeypatch.setattr(parsing, "iter_pdf_pages_parallel", spy)
+        with open(long_pdf, "rb") as f:
+            content = f.read()
+        serial = list(iter_pdf_pages(long_pdf, workers=1))
+        assert list(iter_pdf_pages(content, workers=2)) == serial
+        with open(long_pdf, "rb") as f:
+            assert list(iter_pdf_pages(f, workers=2)) == serial
+        # le contenu est écrit dans un fichier temporaire, supprimé ensuite
+        assert len(paths) == 2 and long_pdf not in paths
+        assert not any(os.path.exists(path) for path in paths)
+
+    def test_broken_pool_fallback(self, long_pdf, monkeypatch):
+        class BrokenExecutor:
+            def __init__(self, max_workers):
+                pass
+
+            def submit(self, *args):
+                raise BrokenProcessPool("no fork")
+
+            def shutdown(self, wait=True):
+                pass
+
+        monkeypatch.setattr(parsing, "PDF_PARALLEL_MIN_PAGES", 2)
+        monkeypatch.setattr(parsing, "ProcessPoolExecutor", BrokenExecutor)
+        assert list(iter_pdf_pages(long_pdf, workers=2)) == list(
+            iter_pdf_pages(long_pdf, workers=1)
+        )
+
+
+    def test_daemon_process_serial(self, long_pdf, monkeypatch):
+        class DaemonProcess:
+            daemon = True
+
+        def fail(*args, **kwargs):
+            raise AssertionError("daemonic processes are not allowed to have children")
+
+        monkeypatch.setattr(parsing, "PDF_PARALLEL_MIN_PAGES", 2)
+        monkeypatch.setattr(parsing.multiprocessing, "current_process", DaemonProcess)
+        monkeypatch.setattr(parsing, "ProcessPoolExecutor", fail)
+        assert len(list(iter_pdf_pages(long_pdf, workers=2))) == 12
+
+
+class TestParserBackends:
+    def test_default_backends(self):
+        assert get_parser_backend("pdf") is iter_pdf_pages
+        for doc_ext in ACCEPTED_EXTENSIONS:
+            assert callable(get_parser_backend(doc_ext))
+
+    def test_wrong_backend(self):
+        with pytest.raises(ValueError):
+            get_parser_backend("pdf", "pdftotext")
+        with pytest.raises(ValueError):
+            iter_doc_chunks(os.path.join(TEST_DIR, "newtest.pdf"), backend="odfpy")
+
+    @pytest.mark.parametrize("backend", ["pypdf2", "pdfminer", "pdfminer-layout"])
+    def test_pdf_backends(self, backend):
+        file_path = "newtest.pdf"
+        abspath = archive_test_file(file_path)
+        full_text = parse_doc(abspath, backend=backend)
+        assert not os.path.exists(abspath)
+        assert "C. civ." in full_text
+        assert "L. 385-2" in full_text
+
+
+ODT_CONTENT = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:text>
+<text:h text:outline-level="1">Titre</text:h>
+<text:p>Selon l'<text:span>article</text:span> 1240<text:note text:id="ftn1" text:note-class="footnote"><text:note-citation>1</text:note-citation><text:note-body><text:p>Art. 1241 C. civ.</text:p></text:note-body></text:note> du<text:s text:c="3"/>Code civil<text:tab/>et<text:line-break/>fin.</text:p>
+<text:list><text:list-item><text:p>Art. L. 121-14 C. conso.</text:p></text:list-item></text:list>
+</office:text></office:body>
+</office:document-content>
+"""
+
+
+class TestOdtStream:
+    @pytest.mark.parametrize("file_path", ["newtest.odt", "testnew.odt"])
+    def test_same_as_odfpy(self, file_path):
+        abspath = os.path.join(TEST_DIR, file_path)
+        assert list(iter_odt_stream_paragraphs(abspath)) == list(iter_odt_paragraphs(abspath))
+
+    def test_paragraph_content(self, tmp_path):
+        file_path = str(tmp_path / "notes.odt")
+        with zipfile.ZipFile(file_path, "w") as archive:
+            archive.writestr("content.xml", ODT_CONTENT)
+        assert list(iter_odt_stream_paragraphs(file_path)) == [
+            "Titre",
+            "Art. 1241 C. civ.",
+            "Selon l'article 1240 du   Code civil\tet\nfin.",
+            "Art. L. 121-14 C. conso.",
+        ]
+
+
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+DOCX_MEMBERS = {
+    "word/document.xml": f"""<w:document {W_NS}><w:body>
+<w:p><w:r><w:t>Selon l'article 1240</w:t></w:r><w:r><w:footnoteReference w:id="1"/></w:r><w:r><w:t xml:space="preserve"> du Code civil.</w:t></w:r></w:p>
+<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Art. L. 121-14</w:t><w:tab/><w:t>C. conso.</w:t></w:r></w:p></w:tc></w:tr></w:tbl>
+<w:p><w:r><w:instrText>HYPERLINK "x"</w:instrText><w:t>Fin</w:t><w:br/><w:t>du texte</w:t></w:r></w:p>
+</w:body></w:document>""",
+    "word/footnotes.xml": f"""<w:footnotes {W_NS}>
+<w:footnote w:type="separator" w:id="0"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>
+<w:footnote w:id="1"><w:p><w:r><w:t>Art. 1241 C. civ.</w:t></w:r></w:p></w:footnote>
+</w:footnotes>""",
+    "word/comments.xml": f"""<w:comments {W_NS}><w:comment w:id="0"><w:p><w:r><w:t>Voir art. 1242 C. civ.</w:t></w:r></w:p></w:comment></w:comments>""",
+    "word/header1.xml": f"""<w:hdr {W_NS}><w:p><w:r><w:t>Mémoire</w:t></w:r></w:p></w:hdr>""",
+}
+
+
+class TestDocParts:
+    def test_docx_parts(self, tmp_path):
+        file_path = str(tmp_path / "notes.docx")
+        with zipfile.ZipFile(file_path, "w") as archive:
+            for name, content in DOCX_MEMBERS.items():
+                archive.writestr(name, content)
+        assert list(iter_doc_parts(file_path)) == [
+            ("body", "Selon l'article 1240 du Code civil."),
+            ("table", "Art. L. 121-14 C. conso."),
+            ("body", "Fin du texte"),
+            ("footnote", ""),
+            ("footnote", "Art. 1241 C. civ."),
+            ("comment", "Voir art. 1242 C. civ."),
+            ("header", "Mémoire"),
+        ]
+        assert not os.path.exists(file_path)
+
+    def test_docx_textbox_once(self, tmp_path):
+        textbox = "<w:txbxContent><w:p><w:r><w:t>Art. 1240 C. civ.</w:t></w:r></w:p></w:txbxContent>"
+        document = (
+            f'<w:document {W_NS} xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" '
+            'xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape" '
+            'xmlns:v="urn:schemas-microsoft-com:vml"><w:body>'
+            "<w:p><w:r><mc:AlternateContent>"
+            f"<mc:Choice Requires=\"wps\"><w:drawing><wps:txbx>{textbox}</wps:txbx></w:drawing></mc:Choice>"
+            f"<mc:Fallback><w:pict><v:shape><v:textbox>{textbox}</v:textbox></v:shape></w:pict></mc:Fallback>"
+            "</mc:AlternateContent></w:r><w:r><w:t>Body</w:t></w:r></w:p>"
+            "</w:body></w:document>"
+        )
+        file_path = str(tmp_path / "textbox.docx")
+        with zipfile.ZipFile(file_path, "w") as archive:
+            archive.writestr("word/document.xml", document)
+        assert list(iter_doc_parts(file_path)) == [
+            ("body", "Art. 1240 C. civ."),
+            ("body", "Body"),
+        ]
+
+    def test_odt_parts(self, tmp_path):
+        file_path = str(tmp_path / "notes.odt")
+        with zipfile.ZipFile(file_path, "w") as archive:
+            archive.writestr("content.xml", ODT_CONTENT)
+        assert [origin for origin, _ in iter_doc_parts(file_path)] == [
+            "body",
+            "footnote",
+            "body",
+            "body",
+        ]
+
+    def test_docx_body_same_as_python_docx(self):
+        abspath = os.path.join(TEST_DIR, "newtest.docx")
+        parts = list(iter_doc_parts(abspath, remove=False))
+        assert [p for _, p in parts] == [
+            parsing.WHITESPACE_REGEX.sub(" ", p) for p in iter_docx_paragraphs(abspath)
+        ]
+
+    def test_parse_doc_all_parts(self):
+        file_path = "HDR_NETTER_V1_07.odt"
+        abspath = archive_test_file(file_path)
+        origins = {origin for origin, _ in iter_doc_parts(abspath, remove=False)}
+        assert {"body", "footnote", "table", "comment", "header", "footer"} <= origins
+        body = parse_doc(abspath, all_parts=False).split()
+        abspath = archive_test_file(file_path)
+        full_text = parse_doc(abspath, all_parts=True)
+        assert len(full_text.split()) > len(body)
+
+
+class TestParseContent:
+    @pytest.mark.parametrize("file_path", ["newtest.pdf", "newtest.odt", "newtest.docx", "newtest.doc"])
+    def test_bytes_and_file(self, file_path):
+        abspath = os.path.join(TEST_DIR, file_path)
+        with open(abspath, "rb") as f:
+            content = f.read()
+        expected = parse_doc(archive_test_file(file_path))
+        assert parse_doc(content, filename=file_path) == expected
+        assert parse_doc(memoryview(content), filename=file_path) == expected
+        upload = io.BytesIO(content)
+        upload.read(10)
+        assert parse_doc(upload, filename=file_path) == expected
+        # le fichier du client n'est ni fermé ni supprimé
+        assert not upload.closed
+        assert os.path.exists(abspath)
+
+    def test_open_file_name(self):
+        with open(os.path.join(TEST_DIR, "testnew.odt"), "rb") as f:
+            assert "Code civil" in parse_doc(f)
+
+    def test_content_without_name(self):
+        with pytest.raises(ValueError):
+            parse_doc(b"%PDF-1.4")
+        with pytest.raises(ValueError):
+            parse_doc(b"%PDF-1.4", filename="document.rtf")
+
+    def test_dotted_filename(self):
+        abspath = os.path.join(TEST_DIR, "newtest.pdf")
+        with open(abspath, "rb") as f:
+            assert "C. civ." in parse_doc(f.read(), filename="mémoire.v2.pdf")
+
+
+class TestNormalize:
+    @pytest.mark.parametrize(
+        "blocks",
+        [
+            [],
+            [""],
+            ["Art. 1240", "C. civ."],
+            ["Art. 1240 ", " C. civ."],
+            ["Art.\t1240\n", "", "\xa0", "C.\r\nciv. "],
+            ["  ", "Art. 1240", "\x0c"],
+            ["article", "\x0c", "L. 121-14"],
+            ["fin \x0c"],
+        ],
+    )
+    def test_same_as_joined_text(self, blocks):
+        output = io.StringIO()
+        block_starts = write_normalized(blocks, output)
+        assert output.getvalue() == WHITESPACE_REGEX.sub(" ", " ".join(blocks))
+        assert len(block_starts) == len(blocks)
+        assert block_starts == sorted(block_starts)
+
+    def test_block_starts(self):
+        blocks = [" Art. 1240\n", "\tC. civ.", "", "et L. 121-14 C. conso."]
+        output = []
+        block_starts = write_normalized(blocks, output)
+        text = "".join(output)
+        assert text == " Art. 1240 C. civ. et L. 121-14 C. conso."
+        assert [text[start:start + 2] for start in block_starts] == ["Ar", "C.", " e", "et"]
+
+    def test_parse_doc_empty_and_indented_blocks(self, monkeypatch):
+        blocks = ["Article 1240 du Code civil", "", "  indented", "", "Art. 1103 C. civ."]
+        monkeypatch.setattr(parsing, "iter_doc_blocks", lambda *args, **kwargs: iter(blocks))
+        full_text, block_starts = parse_doc(b"", with_blocks=True, filename="blocks.docx")
+        assert full_text == "Article 1240 du Code civil indented Art. 1103 C. civ."
+        assert block_starts == [0, 26, 27, 35, 36]
+        assert full_text[block_starts[2]:].startswith("indented")
+        assert full_text[block_starts[4]:].startswith("Art. 1103")
+        results = get_matching_result_item(full_text, block_starts=block_starts)
+        assert [(art_num, block) for _, _, art_num, _, _, block in results] == [
+            ("1240", 0),
+            ("1103", 4),
+        ]
+
+    @pytest.mark.parametrize("file_path", ["newtest.pdf", "newtest.odt", "newtest.docx"])
+    def test_parse_doc_blocks(self, file_path):
+        full_text, block_starts = parse_doc(archive_test_file(file_path), with_blocks=True)
+        with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+            blocks = list(iter_doc_chunks(f, filename=file_path))
+        assert len(block_starts) == len(blocks)
+        for start, block in zip(block_starts, blocks):
+            assert full_text[start:].startswith(block.strip())
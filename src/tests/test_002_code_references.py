@@ -6,6 +6,7 @@ from code_references import get_code_full_name_from_short_code
 from code_references import get_short_code_from_full_name
 from code_references import get_long_and_short_code
 from code_references import get_selected_codes_regex
+from code_references import get_selected_codes_pattern
 
 
 class TestCodeFormats:
@@ -72,3 +73,17 @@ class TestFilterRegexCode:
         assert result == expected, result
 
 
+
+
+class TestCompiledRegexCode:
+    def test_pattern_is_cached(self):
+        assert get_selected_codes_pattern(None) is get_selected_codes_pattern(None)
+        assert get_selected_codes_pattern(["CJA", "CCIV"]) is get_selected_codes_pattern(
+            ["CCIV", "CJA"]
+        )
+
+    def test_pattern_matches_selection(self):
+        pattern = get_selected_codes_pattern(["CCIV", "CJA"])
+        assert pattern.match("code civil").groupdict()["CCIV"] is not None
+        assert pattern.match("Code du travail") is None
+        assert get_selected_codes_pattern(["CJA"]).pattern == CODE_REGEX["CJA"]
@@ -10,6 +10,10 @@ from matching import (
     get_matching_result_item,
     get_code_refs,
     normalize_references,
+    get_unique_references,
+    scan_code_refs,
+    get_block_index,
+    iter_code_refs,
 )
 from .test_001_parsing import restore_test_file, archive_test_file
 
@@ -73,6 +77,19 @@ class TestNormalize:
         assert results == expected, (results, expected)
 
 
+class TestUniqueReferences:
+    def test_unique_references(self):
+        text = "article 1240 du Code civil, article 1103 du Code civil et article 1240 du Code civil"
+        references = list(get_code_refs(text, None, "article_code"))
+        assert len(references) == 3, references
+        unique_references, occurrences = get_unique_references(references)
+        assert unique_references == [
+            ["CCIV", "Code civil", "1240"],
+            ["CCIV", "Code civil", "1103"],
+        ], unique_references
+        assert occurrences == {("CCIV", "1240"): 2, ("CCIV", "1103"): 1}, occurrences
+
+
 class TestTextGetRef:
     @pytest.mark.parametrize(
         "input_expected",
@@ -195,6 +212,200 @@ class TestTextGetRef:
         assert results == expected, results
 
 
+SCAN_EXPECTED = {
+    "CASSUR": ["L385-2", "R343-4", "A421-13"],
+    "CCIV": ["1120", "2288", "1240-1", "1140", "1", "349", "39999", "3-12", "12-4-6", "14", "15", "27"],
+    "CCOM": ["L611-2", "L132-1", "R811-3"],
+    "CCONSO": ["L121-14", "R742-52"],
+    "CENV": ["L124-1"],
+    "CESEDA": ["L753-1", "12"],
+    "CGCT": ["L1424-71", "L1"],
+    "CJA": ["L121-2"],
+    "CPEN": ["131-4", "225-7-1"],
+    "CPI": ["L112-1", "L331-4"],
+    "CPP": ["694-4-1", "R57-6-1"],
+    "CPRCIV": ["1038", "1289-2"],
+    "CSI": ["L622-7", "R314-7"],
+    "CSP": ["L1110-1"],
+    "CSS": ["L173-8"],
+    "CTRAV": ["L1111-1", "R4512-15"],
+}
+
+
+class TestScanEngine:
+    @pytest.mark.parametrize(
+        "input_expected",
+        [
+            (
+                "Comme il est mentionné dans l'article 238-4 alinéa 2 du code de la consommation .",
+                "article_code",
+                [["CCONSO", "Code de la consommation", "238-4-2"]],
+            ),
+            (
+                "Art. L. 112-3 al. 2 CPI.",
+                "article_code",
+                [["CPI", "Code de la propriété intellectuelle", "L112-3-2"]],
+            ),
+            (
+                "\n-\n  cjaaa article L.278 ",
+                "code_article",
+                [["CJA", "Code de justice administrative", "L278"]],
+            ),
+            (
+                "C. assur. Art. L. 385-2, R.343-4 et A421-13",
+                "code_article",
+                [
+                    ["CASSUR", "Code des assurances", "L385-2"],
+                    ["CASSUR", "Code des assurances", "R343-4"],
+                    ["CASSUR", "Code des assurances", "A421-13"],
+                ],
+            ),
+            (
+                "CSI Art. L22-7 et R314-7  Code de l'environnement Art. L124-1, 228. CJA Art. L214-4, 495",
+                "code_article",
+                [
+                    ["CSI", "Code de la sécurité intérieure", "L22-7"],
+                    ["CSI", "Code de la sécurité intérieure", "R314-7"],
+                    ["CENV", "Code de l'environnement", "L124-1"],
+                    ["CENV", "Code de l'environnement", "228"],
+                    ["CJA", "Code de justice administrative", "L214-4"],
+                    ["CJA", "Code de justice administrative", "495"],
+                ],
+            ),
+            (
+                "Comme on peut le voir dans les articles L22-7 et R314-7 du CSI, l'article L124-1  du   Code de l'environnement  et art. L214-4 du CJA ",
+                "article_code",
+                [
+                    ["CSI", "Code de la sécurité intérieure", "L22-7"],
+                    ["CSI", "Code de la sécurité intérieure", "R314-7"],
+                    ["CENV", "Code de l'environnement", "L124-1"],
+                    ["CJA", "Code de justice administrative", "L214-4"],
+                ],
+            ),
+            (
+                "La loi de 1905 et le Code civil ne disent rien de plus.",
+                "article_code",
+                [],
+            ),
+        ],
+    )
+    def test_scan_text(self, input_expected):
+        input, regex_fmt, expected = input_expected
+        results = list(get_code_refs(input, None, regex_fmt, engine="scan"))
+        assert results == expected, results
+
+    def test_scan_offsets(self):
+        text = "Voir l'article 1240 du Code civil."
+        start = text.index("1240")
+        assert list(scan_code_refs(text)) == [("CCIV", "1240", start, start + 4)]
+
+    def test_scan_unselected_code(self):
+        text = "Art. 1038 CPC et art. 1240 C. civ."
+        assert list(scan_code_refs(text, ["CCIV"])) == [("CCIV", "1240", 22, 26)]
+
+    def test_wrong_engine(self):
+        with pytest.raises(ValueError):
+            list(get_code_refs("Art. 1240 C. civ.", engine="regex"))
+
+    @pytest.mark.parametrize(
+        "input_expected",
+        [
+            ("newtest.odt", "article_code"),
+            ("newtest.docx", "article_code"),
+            ("newtest.pdf", "article_code"),
+            ("testnew.odt", "code_article"),
+            ("testnew.docx", "code_article"),
+        ],
+    )
+    def test_scan_documents(self, input_expected):
+        file_path, regex_fmt = input_expected
+        abspath = os.path.join(os.path.dirname(os.path.realpath(__file__)), file_path)
+        archive_test_file(file_path)
+        full_text = parse_doc(abspath)
+        restore_test_file(file_path)
+        results_dict = get_matching_results_dict(full_text, None, regex_fmt, "scan")
+        assert results_dict == SCAN_EXPECTED, sorted(results_dict.items())
+
+
+class TestSpans:
+    @pytest.mark.parametrize("engine", ["split", "scan"])
+    @pytest.mark.parametrize(
+        "input_expected",
+        [
+            (
+                "C. assur. Art. L. 385-2, R.343-4 et A421-13 CSI Art. L22-7",
+                "code_article",
+                ["L. 385-2", "R.343-4", "A421-13", "L22-7"],
+            ),
+            (
+                "l'article 238-4 alinéa 2 du code de la consommation et Art. L. 112-3 al. 2 CPI.",
+                "article_code",
+                ["238-4 alinéa 2", "L. 112-3 al. 2"],
+            ),
+        ],
+    )
+    def test_spans(self, engine, input_expected):
+        input, regex_fmt, expected = input_expected
+        results = list(get_code_refs(input, None, regex_fmt, engine, with_spans=True))
+        assert [input[start:end] for _, _, _, start, end in results] == expected
+
+    def test_spans_opt_in(self):
+        results = list(get_matching_result_item("Art. 1240 C. civ."))
+        assert results == [["CCIV", "Code civil", "1240"]]
+
+    def test_block_index(self):
+        assert [get_block_index([0, 10, 25], offset) for offset in (0, 9, 10, 30)] == [0, 0, 1, 2]
+
+    @pytest.mark.parametrize("engine", ["split", "scan"])
+    def test_document_blocks(self, engine):
+        file_path = "newtest.odt"
+        abspath = os.path.join(os.path.dirname(os.path.realpath(__file__)), file_path)
+        archive_test_file(file_path)
+        full_text, block_starts = parse_doc(abspath, with_blocks=True)
+        restore_test_file(file_path)
+        results = list(
+            get_matching_result_item(full_text, None, "article_code", engine, block_starts=block_starts)
+        )
+        assert len(results) > 0
+        for code, _, art_num, start, end, block in results:
+            assert block_starts[block] <= start < end
+            assert art_num[-1] == full_text[end - 1]
+
+
+class TestIterCodeRefs:
+    TEXT = (
+        "Comme on peut le voir dans les articles L22-7 et R314-7 du CSI, "
+        "l'article L124-1  du   Code de l'environnement et art. L214-4 du CJA. "
+        "Voir aussi l'article 1240 du Code civil et les articles L. 132-1, L. 611-2 du Code de commerce."
+    )
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 10, 1000])
+    def test_straddling_chunks(self, chunk_size):
+        words = self.TEXT.split(" ")
+        chunks = [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+        # les morceaux sont séparés par un espace
+        text = " ".join(chunks)
+        assert text == self.TEXT
+        expected = list(get_code_refs(text, None, "article_code", "scan", with_spans=True))
+        results = list(
+            iter_code_refs(chunks, None, "article_code", "scan", with_spans=True, overlap=50)
+        )
+        assert len(expected) == 7
+        assert sorted(results, key=lambda r: r[3]) == expected
+
+    def test_blocks(self):
+        chunks = ["Art. 1240 C. civ.", "Rien ici.", "Voir l'article L. 132-1 du Code de commerce."]
+        results = list(iter_code_refs(chunks, engine="scan", with_blocks=True))
+        assert [(r[2], r[5]) for r in results] == [("1240", 0), ("L132-1", 2)]
+        assert list(iter_code_refs(chunks, engine="scan")) == [
+            ["CCIV", "Code civil", "1240"],
+            ["CCOM", "Code de commerce", "L132-1"],
+        ]
+
+    def test_empty(self):
+        assert list(iter_code_refs([])) == []
+
+
 class TestTextMatchingIterator:
     @pytest.mark.parametrize(
         "input_expected",
@@ -3,15 +3,24 @@ import os
 from pathlib import Path
 import datetime
 import time
+import threading
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import BaseAdapter
 from dotenv import load_dotenv
 import pytest
 
 from .context import code_references, check_validity, request_api
+from article_cache import MemoryCache, NoCache, make_key, set_cache
 from request_api import (
     get_legifrance_auth,
+    clear_legifrance_auth,
+    get_session,
+    set_transport,
     get_article_uid,
     get_article_content,
     get_article,
+    get_articles,
 )
 from check_validity import get_validity_status, time_delta
 
@@ -37,6 +46,285 @@ class TestOAuthLegiFranceAPI:
             ), str(exc_info.value)
 
 
+class TestTokenCache:
+    def test_token_is_requested_once(self, monkeypatch):
+        calls = []
+
+        def fake_token(client_id, client_secret):
+            calls.append(client_id)
+            return {"access_token": f"token{len(calls)}", "expires_in": 3600}
+
+        monkeypatch.setattr(request_api, "request_legifrance_token", fake_token)
+        clear_legifrance_auth()
+        for _ in range(5):
+            headers = get_legifrance_auth("id", "secret")
+        assert headers == {"Authorization": "Bearer token1"}, headers
+        assert len(calls) == 1, calls
+        clear_legifrance_auth()
+
+    def test_token_is_refreshed_before_expiry(self, monkeypatch):
+        calls = []
+
+        def fake_token(client_id, client_secret):
+            calls.append(client_id)
+            # shorter than the refresh margin: always considered expired
+            return {"access_token": f"token{len(calls)}", "expires_in": 30}
+
+        monkeypatch.setattr(request_api, "request_legifrance_token", fake_token)
+        clear_legifrance_auth()
+        get_legifrance_auth("id", "secret")
+        headers = get_legifrance_auth("id", "secret")
+        assert headers == {"Authorization": "Bearer token2"}, headers
+        headers = get_legifrance_auth("id", "secret", force_refresh=True)
+        assert headers == {"Authorization": "Bearer token3"}, headers
+        clear_legifrance_auth()
+
+    def test_token_single_flight(self, monkeypatch):
+        calls = []
+
+        def fake_token(client_id, client_secret):
+            calls.append(client_id)
+            time.sleep(0.05)
+            return {"access_token": "token", "expires_in": 3600}
+
+        monkeypatch.setattr(request_api, "request_legifrance_token", fake_token)
+        clear_legifrance_auth()
+        threads = [
+            threading.Thread(target=get_legifrance_auth, args=("id", "secret"))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1, calls
+        clear_legifrance_auth()
+
+
+STUB_ARTICLE = {
+    "id": "LEGIARTI000032227262",
+    "num": "L121-14",
+    "texte": "Le paiement résultant d'une obligation législative ou réglementaire n'exige pas d'engagement exprès et préalable.",
+    "etat": "VIGUEUR",
+    "dateDebut": 1467331200000,
+    "dateFin": 32472144000000,
+    "articleVersions": [{"id": "LEGIARTI000032227262"}],
+}
+
+
+STUB_ARTICLES = {
+    STUB_ARTICLE["num"]: STUB_ARTICLE,
+    "1240": dict(STUB_ARTICLE, id="LEGIARTI000032041571", num="1240"),
+    "1103": dict(STUB_ARTICLE, id="LEGIARTI000032040794", num="1103"),
+}
+
+
+class StubLegifranceHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.paths.append(self.path)
+        if self.path.endswith("/token"):
+            self.server.tokens += 1
+            body = {"access_token": f"stub{self.server.tokens}", "expires_in": 3600}
+        elif self.headers.get("Authorization") in self.server.revoked:
+            self.send_response(401)
+            self.end_headers()
+            return
+        elif self.path.endswith("/search"):
+            criteres = json.loads(raw)["recherche"]["champs"][0]["criteres"]
+            found = [
+                STUB_ARTICLES[c["valeur"]]
+                for c in criteres
+                if c["valeur"] in STUB_ARTICLES
+            ]
+            if self.server.fail_batch and len(criteres) > 1:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = {
+                "totalResultNumber": len(found),
+                "results": [
+                    {"sections": [{"extracts": [{"id": a["id"], "num": a["num"]}]}]}
+                    for a in found
+                ],
+            }
+        else:
+            article_id = json.loads(raw)["id"]
+            body = {
+                "article": [
+                    a for a in STUB_ARTICLES.values() if a["id"] == article_id
+                ][0]
+            }
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLegifranceHandler)
+    server.paths = []
+    server.fail_batch = False
+    server.tokens = 0
+    server.revoked = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    root = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(request_api, "TOKEN_URL", root + "/oauth/token")
+    monkeypatch.setattr(request_api, "API_ROOT_URL", root)
+    clear_legifrance_auth()
+    set_transport(None)
+    set_cache(NoCache())
+    yield server
+    server.shutdown()
+    server.server_close()
+    clear_legifrance_auth()
+    set_cache(None)
+
+
+class StubAdapter(BaseAdapter):
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        response = requests.models.Response()
+        response.status_code = 401
+        response.reason = "Unauthorized"
+        response.request = request
+        response._content = b"{}"
+        return response
+
+    def close(self):
+        pass
+
+
+class TestHttpSession:
+    def test_session_is_shared(self):
+        assert get_session() is get_session()
+
+    def test_get_article_stub_server(self, stub_server):
+        article = get_article("CCONSO", "L121-14", "id", "secret")
+        assert article["id"] == STUB_ARTICLE["id"], article
+        assert article["date_debut"] == "01/07/2016", article["date_debut"]
+        assert article["status_code"] == 204, article
+        # one token, one search, one getArticle
+        assert len(stub_server.paths) == 3, stub_server.paths
+        get_article("CCONSO", "L121-14", "id", "secret")
+        assert len(stub_server.paths) == 5, stub_server.paths
+
+    def test_get_article_cached(self, stub_server):
+        cache = MemoryCache()
+        set_cache(cache)
+        get_article("CCONSO", "L121-14", "id", "secret")
+        article = get_article("CCONSO", "L121-14", "id", "secret")
+        assert article["id"] == STUB_ARTICLE["id"], article
+        # the second call is answered by the cache
+        assert len(stub_server.paths) == 3, stub_server.paths
+        assert cache.hits == 2 and cache.misses == 2, cache.stats()
+
+    def test_custom_transport(self):
+        adapter = StubAdapter()
+        set_transport(adapter)
+        try:
+            with pytest.raises(Exception) as exc_info:
+                get_article_content("LEGIARTI000032227262", {})
+            assert "401" in str(exc_info.value)
+            assert len(adapter.urls) == 1, adapter.urls
+        finally:
+            set_transport(None)
+
+
+class TestBatchArticles:
+    def test_get_articles_batch(self, stub_server):
+        references = [
+            ("CCIV", "1240"),
+            ("CCIV", "1103"),
+            ("CCIV", "1240"),
+            ("CCONSO", "L121-14"),
+            ("CCIV", "9999"),
+        ]
+        articles, stats = get_articles(references, "id", "secret")
+        assert list(articles) == [
+            ("CCIV", "1240"),
+            ("CCIV", "1103"),
+            ("CCONSO", "L121-14"),
+            ("CCIV", "9999"),
+        ], list(articles)
+        assert articles[("CCIV", "1103")]["id"] == "LEGIARTI000032040794"
+        assert articles[("CCONSO", "L121-14")]["status_code"] == 204
+        assert articles[("CCIV", "9999")]["status_code"] == 404
+        # 2 combined searches + 1 fallback search + 3 contents
+        assert stats["http_calls"] == 6, (stats, stub_server.paths)
+        assert stats["estimated_saved_calls"] == 1, stats
+        assert stats["references"] == 4, stats
+
+    def test_get_articles_batch_saves_calls(self, stub_server):
+        references = [("CCIV", "1240"), ("CCIV", "1103")]
+        articles, stats = get_articles(references, "id", "secret")
+        # 1 combined search + 2 contents instead of 2 searches + 2 contents
+        assert stats["http_calls"] == 3, stats
+        assert stats["estimated_saved_calls"] == 1, stats
+
+    def test_get_articles_calls_not_shared(self, stub_server):
+        results = []
+
+        def run():
+            results.append(get_articles([("CCIV", "1240"), ("CCIV", "1103")], "id", "secret")[1])
+
+        # une autre résolution du processus en même temps
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [stats["http_calls"] for stats in results] == [3] * 4, results
+        assert [stats["estimated_saved_calls"] for stats in results] == [1] * 4, results
+
+    def test_revoked_token_is_refreshed(self, stub_server):
+        assert get_article("CCIV", "1240", "id", "secret")["status_code"] == 204
+        # jeton révoqué avant son expiration: renouvelé une fois, la requête est renvoyée
+        stub_server.revoked.add("Bearer stub1")
+        results = []
+
+        def run():
+            results.append(get_article("CCIV", "1103", "id", "secret")["status_code"])
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [204] * 4, results
+        assert stub_server.tokens == 2, stub_server.paths
+        assert get_legifrance_auth("id", "secret") == {"Authorization": "Bearer stub2"}
+        assert get_article("CCIV", "1240", "id", "secret")["status_code"] == 204
+        assert stub_server.tokens == 2, stub_server.paths
+
+    def test_get_articles_cached_not_found(self, stub_server):
+        cache = MemoryCache(max_size=16, ttl=60)
+        cache.set(make_key("uid", "Code civil", "9999", time.strftime("%Y-%m-%d")), None)
+        set_cache(cache)
+        articles, stats = get_articles([("CCIV", "1240"), ("CCIV", "9999")], "id", "secret")
+        # article introuvable déjà connu: ni recherche groupée ni requête
+        assert articles[("CCIV", "9999")]["status_code"] == 404
+        assert stats["http_calls"] == 2, (stats, stub_server.paths)
+
+    def test_get_articles_batch_failure(self, stub_server):
+        stub_server.fail_batch = True
+        references = [("CCIV", "1240"), ("CCIV", "1103")]
+        articles, stats = get_articles(references, "id", "secret")
+        assert articles[("CCIV", "1240")]["id"] == "LEGIARTI000032041571"
+        assert articles[("CCIV", "1103")]["id"] == "LEGIARTI000032040794"
+
+
 class TestLoadDotEnv:
     def test_dotenv_file(self):
         curr_dir = os.path.dirname(os.path.dirname(os.getcwd()))
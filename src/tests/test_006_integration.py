@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 
+import io
+import json
 import os
+import threading
+import time
+import pytest
 from dotenv import load_dotenv
-from .context import parsing, matching, request_api, codeislow, code_references
+from .context import parsing, matching, request_api, codeislow, code_references, app
+import jobs
 from parsing import parse_doc
 from matching import get_matching_result_item
 from request_api import get_article
-from codeislow import main
+from codeislow import main, resolve_articles, resolve_references
 from code_references import CODE_REFERENCE
 from .test_001_parsing import restore_test_file, archive_test_file
 
@@ -119,3 +125,338 @@ class TestMainProcess:
                 ], article
                 assert "url" in article, article
                 assert "texte" in article, article
+
+
+class TestResolveArticles:
+    def test_resolve_articles_in_order(self, monkeypatch):
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def fake_get_article(code, article_nb, *args, **kwargs):
+            with lock:
+                in_flight.append(article_nb)
+                max_in_flight.append(len(in_flight))
+            # the first references are the slowest
+            time.sleep(0.05 / (int(article_nb) + 1))
+            with lock:
+                in_flight.remove(article_nb)
+            return {"code": code, "article": article_nb}
+
+        monkeypatch.setattr(codeislow, "get_article", fake_get_article)
+        references = [
+            ["CCIV", "Code civil", str(i)] for i in range(10)
+        ]
+        results = list(
+            resolve_articles(references, "id", "secret", max_workers=3)
+        )
+        assert [ref for ref, _ in results] == references
+        assert [article["article"] for _, article in results] == [
+            str(i) for i in range(10)
+        ]
+        assert max(max_in_flight) <= 3, max_in_flight
+
+    def test_resolve_articles_timeout(self, monkeypatch):
+        def fake_get_article(code, article_nb, *args, **kwargs):
+            if article_nb == "1":
+                time.sleep(0.5)
+            return {"code": code, "article": article_nb, "status_code": 204}
+
+        monkeypatch.setattr(codeislow, "get_article", fake_get_article)
+        references = [["CCIV", "Code civil", str(i)] for i in range(3)]
+        results = [
+            article
+            for _, article in resolve_articles(
+                references, "id", "secret", max_workers=2, timeout=0.1
+            )
+        ]
+        assert [a["status_code"] for a in results] == [204, 408, 204], results
+        assert results[1]["article"] == "1"
+
+    def test_resolve_articles_timeout_from_start(self, monkeypatch):
+        def fake_get_article(code, article_nb, *args, **kwargs):
+            time.sleep(0.5 if article_nb == "0" else 0.06)
+            return {"code": code, "article": article_nb, "status_code": 204}
+
+        monkeypatch.setattr(codeislow, "get_article", fake_get_article)
+        references = [["CCIV", "Code civil", str(i)] for i in range(4)]
+        # un seul thread, occupé par la requête abandonnée: les suivantes attendent
+        # sans dépasser le délai
+        results = [
+            article
+            for _, article in resolve_articles(
+                references, "id", "secret", max_workers=1, timeout=0.2
+            )
+        ]
+        assert [a["status_code"] for a in results] == [408, 204, 204, 204], results
+
+    def test_resolve_references_dedup(self, monkeypatch):
+        calls = []
+
+        def fake_get_article(code, article_nb, *args, **kwargs):
+            calls.append(article_nb)
+            return {"code": code, "article": article_nb}
+
+        monkeypatch.setattr(codeislow, "get_article", fake_get_article)
+        references = [
+            ["CCIV", "Code civil", "1240"],
+            ["CCIV", "Code civil", "1103"],
+            ["CCIV", "Code civil", "1240"],
+            ["CTRAV", "Code du travail", "1240"],
+        ]
+        results = list(resolve_references(references, "id", "secret"))
+        assert sorted(calls) == ["1103", "1240", "1240"], calls
+        assert [ref for ref, _ in results] == references
+        assert [a["occurrences"] for _, a in results] == [2, 1, 2, 1], results
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"), max_queued=2)
+    jobs.set_job_queue(queue)
+    # pas de processus de vérification pendant les tests
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 0)
+    yield queue
+    jobs.set_job_queue(None)
+
+
+def call_app(environ):
+    status_headers = {}
+
+    def start_response(status, headers, exc_info=None):
+        status_headers["status"] = int(status.split()[0])
+        status_headers["headers"] = dict(headers)
+
+    body = b"".join(app.app(environ, start_response)).decode()
+    return status_headers["status"], status_headers["headers"], body
+
+
+def get_app(path, query="", **headers):
+    return call_app(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "wsgi.input": io.BytesIO(),
+            "wsgi.url_scheme": "http",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            **headers,
+        }
+    )
+
+
+class TestUpload:
+    def post_upload(
+        self, filename, content, accept="application/json", incremental=False, cookie=None, codes=()
+    ):
+        boundary = "codeislow"
+        fields = {"user_past": "3", "user_future": "3"}
+        if incremental:
+            fields["incremental"] = "on"
+        # une case à cocher par code sélectionné
+        fields.update((code, "on") for code in codes)
+        body = (
+            "".join(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                for name, value in fields.items()
+            )
+            + f'--{boundary}\r\nContent-Disposition: form-data; name="upload"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": "/upload/",
+            "CONTENT_TYPE": f"multipart/form-data; boundary={boundary}",
+            "CONTENT_LENGTH": str(len(body)),
+            "HTTP_ACCEPT": accept,
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.url_scheme": "http",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+        }
+        if cookie:
+            environ["HTTP_COOKIE"] = cookie
+        return call_app(environ)
+
+    def test_upload_enqueues_job(self, job_queue, monkeypatch, tmp_path):
+        monkeypatch.chdir(tmp_path)
+        with open(os.path.join(os.path.dirname(__file__), "newtest.docx"), "rb") as f:
+            content = f.read()
+        status, headers, body = self.post_upload("newtest.docx", content)
+        assert status == 202
+        job_id = json.loads(body)["id"]
+        assert headers["Location"].endswith(f"/jobs/{job_id}")
+        job = job_queue.claim()
+        assert job["id"] == job_id
+        assert job["document"] == content
+        assert job["filename"] == "newtest.docx"
+        assert job["options"]["past"] == job["options"]["future"] == 3
+        # le document n'est pas écrit sur le disque
+        assert not any(name.endswith(".docx") for name in os.listdir(tmp_path))
+
+    def test_upload_from_browser(self, job_queue):
+        status, headers, _ = self.post_upload("newtest.odt", b"PK", accept="text/html,*/*")
+        assert status == 303
+        assert "/results/" in headers["Location"]
+
+    def test_upload_queue_full(self, job_queue):
+        for _ in range(2):
+            assert self.post_upload("newtest.odt", b"PK")[0] == 202
+        status, headers, body = self.post_upload("newtest.odt", b"PK")
+        assert status == 503
+        assert headers["Retry-After"] == "30"
+        assert "error" in json.loads(body)
+
+    def test_incremental_scoped_by_browser(self, job_queue):
+        _, headers, _ = self.post_upload("memoire.docx", b"PK", incremental=True)
+        cookie = headers["Set-Cookie"].split(";")[0]
+        self.post_upload("memoire.docx", b"PK", incremental=True, cookie=cookie)
+        first, second = job_queue.claim(), job_queue.claim()
+        assert first["options"]["document_id"] == second["options"]["document_id"]
+        # un autre navigateur, même nom de fichier: pas de version précédente partagée
+        self.post_upload("memoire.docx", b"PK", incremental=True)
+        assert job_queue.claim()["options"]["document_id"] != first["options"]["document_id"]
+
+    def test_upload_selected_codes(self, job_queue):
+        self.post_upload("newtest.docx", b"PK", codes=["CCIV", "CPEN"])
+        self.post_upload("newtest.docx", b"PK")
+        assert job_queue.claim()["options"]["selected_codes"] == ["CCIV", "CPEN"]
+        assert job_queue.claim()["options"]["selected_codes"] is None
+
+    def test_upload_wrong_extension(self, job_queue):
+        status, _, body = self.post_upload("document.rtf", b"{}")
+        assert status == 400
+        assert body == "Le format du fichier est incorrect"
+
+
+class TestJobRoutes:
+    ARTICLE = {
+        "url": "https://www.legifrance.gouv.fr/codes/article_lc/LEGIARTI000032041571",
+        "code": "Code civil",
+        "article": "1240",
+        "occurrences": 2,
+        "color": "secondary",
+        "status": "Pas de modification",
+        "texte": "Tout fait quelconque de l'homme",
+        "date_debut": "01/10/2016",
+        "date_fin": "01/01/2999",
+    }
+
+    def start_job(self, job_queue):
+        job_id = job_queue.submit(b"", "arret.docx")
+        job_queue.claim()
+        job_queue.start(job_id, 3, 2)
+        job_queue.add_result(
+            job_id, {"reference": ["CCIV", "Code civil", "1240"], "article": self.ARTICLE}
+        )
+        return job_id
+
+    def test_unknown_job(self, job_queue):
+        assert get_app("/jobs/unknown")[0] == 404
+        assert get_app("/jobs/unknown/events")[0] == 404
+        assert get_app("/results/unknown/")[0] == 404
+
+    def test_job_progress(self, job_queue):
+        job_id = self.start_job(job_queue)
+        status, headers, body = get_app(f"/jobs/{job_id}")
+        job = json.loads(body)
+        assert (job["status"], job["progress"], job["total"]) == ("running", 1, 2)
+        assert job["results"][0]["article"]["article"] == "1240"
+        status, headers, body = get_app("/results/" + job_id + "/")
+        assert "Code civil (CCIV) - 1240" in body
+        assert "1/2 article(s)" in body
+        # la page reçoit les évènements suivant le dernier résultat affiché
+        assert f'data-events="/jobs/{job_id}/events?last_event_id=2"' in body
+        job_queue.finish(job_id)
+        status, headers, body = get_app(f"/jobs/{job_id}", "start=1")
+        job = json.loads(body)
+        assert job["status"] == "done"
+        assert job["results"] == []
+        assert "data-events" not in get_app("/results/" + job_id + "/")[2]
+
+    def test_results_page_snapshot(self, job_queue, tmp_path):
+        job_id = self.start_job(job_queue)
+        writer = jobs.JobQueue(str(tmp_path / "jobs.db"))
+        conn = job_queue._connect()
+
+        class Connection:
+            def execute(self, statement, *args):
+                # un résultat enregistré par le processus de vérification pendant la lecture
+                if "event = 'article'" in statement:
+                    article = dict(TestJobRoutes.ARTICLE, article="1103")
+                    writer.add_result(
+                        job_id, {"reference": ["CCIV", "Code civil", "1103"], "article": article}
+                    )
+                return conn.execute(statement, *args)
+
+        job_queue._local.conn = Connection()
+        body = get_app("/results/" + job_id + "/")[2]
+        job_queue._local.conn = conn
+        # ni affiché ni sauté: reçu par le flux d'évènements
+        assert "Code civil (CCIV) - 1103" not in body
+        assert f'data-events="/jobs/{job_id}/events?last_event_id=2"' in body
+        assert [e["id"] for e in job_queue.events(job_id, 2)] == [3]
+
+    def test_event_stream(self, job_queue):
+        job_id = self.start_job(job_queue)
+        job_queue.finish(job_id)
+        status, headers, body = get_app(f"/jobs/{job_id}/events")
+        assert status == 200
+        assert headers["Content-Type"].startswith("text/event-stream")
+        messages = body.split("\n\n")
+        assert messages[0] == "retry: 2000"
+        events = [dict(line.split(": ", 1) for line in m.split("\n")) for m in messages[1:] if m]
+        assert [(e["id"], e["event"]) for e in events] == [
+            ("0", "started"),
+            ("1", "references"),
+            ("2", "article"),
+            ("3", "finished"),
+        ]
+        assert json.loads(events[1]["data"])["references"] == 3
+        article = json.loads(events[2]["data"])
+        assert (article["position"], article["total"]) == (0, 2)
+        assert "Code civil (CCIV) - 1240" in article["html"]
+        assert json.loads(events[3]["data"])["status"] == "done"
+
+    def test_event_stream_resume(self, job_queue):
+        job_id = self.start_job(job_queue)
+        job_queue.finish(job_id)
+        body = get_app(f"/jobs/{job_id}/events", "last_event_id=1")[2]
+        assert "id: 1\n" not in body
+        assert "id: 2\nevent: article" in body
+        # l'en-tête envoyé par le navigateur à la reconnexion l'emporte
+        body = get_app(f"/jobs/{job_id}/events", "last_event_id=0", HTTP_LAST_EVENT_ID="2")[2]
+        assert "event: article" not in body
+        assert "id: 3\nevent: finished" in body
+        # reconnexion après la fin de l'analyse: le flux se termine
+        assert get_app(f"/jobs/{job_id}/events", "last_event_id=3")[2] == "retry: 2000\n\n"
+        assert get_app(f"/jobs/{job_id}/events", "last_event_id=x")[0] == 400
+
+    def test_event_stream_follows_job(self, job_queue):
+        job_id = job_queue.submit(b"", "arret.docx")
+        stream = jobs.iter_event_stream(job_id, queue=job_queue, poll_interval=0.01, keepalive=0)
+        assert next(stream) == "retry: 2000\n\n"
+        # analyse en attente: la connexion est maintenue
+        assert next(stream) == ": keep-alive\n\n"
+        job_queue.claim()
+        assert next(stream).startswith("id: 0\nevent: started")
+        job_queue.start(job_id, 0, 0)
+        job_queue.finish(job_id)
+        assert next(stream).startswith("id: 1\nevent: references")
+        finished = next(stream)
+        assert finished.startswith("id: 2\nevent: finished")
+        assert list(stream) == []
+
+    def test_event_stream_bounded(self, job_queue):
+        job_id = self.start_job(job_queue)
+        start = time.monotonic()
+        messages = list(
+            jobs.iter_event_stream(job_id, queue=job_queue, poll_interval=0.01, max_duration=0.1)
+        )
+        # analyse en cours: le flux se termine et le navigateur se reconnecte
+        assert time.monotonic() - start < 5
+        assert [m.split("\n")[0] for m in messages] == ["retry: 2000", "id: 0", "id: 1", "id: 2"]
+        job_queue.finish(job_id)
+        body = get_app(f"/jobs/{job_id}/events", HTTP_LAST_EVENT_ID="2")[2]
+        assert "id: 3\nevent: finished" in body
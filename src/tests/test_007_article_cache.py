@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import time
+import pytest
+
+from .context import code_references
+from article_cache import MemoryCache, SQLiteCache, MISSING, make_key, main
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache(max_size=3, ttl=60)
+    return SQLiteCache(os.path.join(tmp_path, "cache.db"), max_size=3, ttl=60)
+
+
+class TestArticleCache:
+    def test_get_set(self, cache):
+        key = make_key("uid", "Code civil", "1240", "2022-11-24")
+        assert cache.get(key) is MISSING
+        cache.set(key, "LEGIARTI000032041571")
+        assert cache.get(key) == "LEGIARTI000032041571"
+        cache.set(make_key("uid", "Code civil", "9999", "2022-11-24"), None)
+        assert cache.get(make_key("uid", "Code civil", "9999", "2022-11-24")) is None
+        assert cache.hits == 2 and cache.misses == 1, cache.stats()
+
+    def test_lru_eviction(self, cache):
+        for i in range(3):
+            cache.set(str(i), {"num": i})
+            # distinct access times for sqlite
+            time.sleep(0.01)
+        # "0" becomes the most recently used
+        assert cache.get("0") == {"num": 0}
+        time.sleep(0.01)
+        cache.set("3", {"num": 3})
+        assert cache.get("1") is MISSING
+        assert cache.get("0") == {"num": 0}
+        assert cache.stats()["size"] == 3, cache.stats()
+
+    def test_ttl(self, cache):
+        cache.ttl = -1
+        cache.set("key", "value")
+        assert cache.get("key") is MISSING
+        cache.purge(expired_only=True)
+        assert cache.stats()["size"] == 0, cache.stats()
+
+    def test_purge(self, cache):
+        cache.set("key", "value")
+        cache.purge()
+        assert cache.get("key") is MISSING
+
+    def test_sqlite_shared(self, tmp_path):
+        db_path = os.path.join(tmp_path, "cache.db")
+        SQLiteCache(db_path).set("key", {"texte": "Tout fait quelconque de l'homme"})
+        assert SQLiteCache(db_path).get("key") == {
+            "texte": "Tout fait quelconque de l'homme"
+        }
+
+
+class TestCacheCli:
+    def test_stats(self, capsys):
+        main(["stats"])
+        out = capsys.readouterr().out
+        assert '"backend"' in out, out
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import io
+import os
+import sqlite3
+import tarfile
+import pytest
+
+from .context import request_api
+from legi_index import build_index, get_article_versions, get_article_content, open_index
+from request_api import get_article
+
+ARTICLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<ARTICLE>
+<META>
+<META_COMMUN><ID>{id}</ID><NATURE>Article</NATURE></META_COMMUN>
+<META_SPEC><META_ARTICLE><NUM>{num}</NUM><ETAT>{etat}</ETAT>
+<DATE_DEBUT>{debut}</DATE_DEBUT><DATE_FIN>{fin}</DATE_FIN></META_ARTICLE></META_SPEC>
+</META>
+<CONTEXTE><TEXTE cid="LEGITEXT"><TITRE_TXT c_titre_court="{code}">{code}</TITRE_TXT></TEXTE></CONTEXTE>
+<BLOC_TEXTUEL><CONTENU><p>{texte}</p><br/></CONTENU></BLOC_TEXTUEL>
+</ARTICLE>
+"""
+
+FIXTURE_ARTICLES = [
+    ("LEGIARTI000032227262", "L121-14", "VIGUEUR", "2016-07-01", "2999-01-01", "Code de la consommation", "Le paiement résultant d'une obligation législative ou réglementaire n'exige pas d'engagement exprès et préalable."),
+    ("LEGIARTI000006069398", "L. 121-14", "MODIFIE", "1993-07-27", "2016-07-01", "Code de la consommation", "Ancienne version."),
+    ("LEGIARTI000032041571", "1240", "VIGUEUR", "2016-10-01", "2999-01-01", "Code civil", "Tout fait quelconque de l'homme, qui cause à autrui un dommage, oblige celui par la faute duquel il est arrivé à le réparer."),
+    ("LEGIARTI000043540586", "L622-7", "ABROGE_DIFF", "2021-05-27", "2022-11-26", "Code de la sécurité intérieure", "Texte abrogé."),
+    ("LEGIARTI000099999999", "12", "VIGUEUR", "2000-01-01", "2999-01-01", "Code rural", "Code non supporté."),
+]
+
+
+@pytest.fixture
+def legi_dump(tmp_path):
+    archive_path = os.path.join(tmp_path, "legi.tar.gz")
+    with tarfile.open(archive_path, "w:gz") as tar:
+        for article_id, num, etat, debut, fin, code, texte in FIXTURE_ARTICLES:
+            xml = ARTICLE_XML.format(
+                id=article_id, num=num, etat=etat, debut=debut, fin=fin, code=code, texte=texte
+            ).encode("utf-8")
+            info = tarfile.TarInfo(f"legi/global/code_et_TNC_en_vigueur/article/{article_id}.xml")
+            info.size = len(xml)
+            tar.addfile(info, io.BytesIO(xml))
+        readme = b"not an article"
+        info = tarfile.TarInfo("legi/README.txt")
+        info.size = len(readme)
+        tar.addfile(info, io.BytesIO(readme))
+    return archive_path
+
+
+@pytest.fixture
+def legi_db(legi_dump, tmp_path):
+    db_path = os.path.join(tmp_path, "legi.db")
+    assert build_index(legi_dump, db_path) == 4
+    return db_path
+
+
+class TestLegiIndex:
+    def test_versions(self, legi_db):
+        versions = get_article_versions("CCONSO", "L121-14", legi_db)
+        assert [v[0] for v in versions] == [
+            "LEGIARTI000006069398",
+            "LEGIARTI000032227262",
+        ], versions
+
+    def test_article_content(self, legi_db):
+        content = get_article_content("CCONSO", "L121-14", legi_db)
+        assert content["id"] == "LEGIARTI000032227262", content
+        assert content["dateDebut"] == 1467331200000, content["dateDebut"]
+        assert content["dateFin"] == 32472144000000, content["dateFin"]
+        assert content["nb_versions"] == 2, content
+
+    def test_article_not_found(self, legi_db):
+        assert get_article_content("CCIV", "9999", legi_db) is None
+
+    def test_missing_index(self, tmp_path):
+        db_path = str(tmp_path / "missing.db")
+        with pytest.raises(FileNotFoundError):
+            get_article_versions("CCIV", "1240", db_path)
+        assert not os.path.exists(db_path)
+
+    def test_read_only_connection_reused(self, legi_db):
+        conn = open_index(legi_db)
+        assert open_index(legi_db) is conn
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM article")
+
+
+class TestOfflineBackend:
+    def test_get_article_offline(self, legi_db, monkeypatch):
+        monkeypatch.setenv("API_BACKEND", "offline")
+        monkeypatch.setenv("LEGI_INDEX_PATH", legi_db)
+        article = get_article("CCONSO", "L121-14", None, None)
+        assert article["id"] == "LEGIARTI000032227262", article
+        assert article["date_debut"] == "01/07/2016", article["date_debut"]
+        assert article["date_fin"] == "01/01/2999", article["date_fin"]
+        assert article["status_code"] == 204, article
+        assert article["texte"].startswith("Le paiement"), article["texte"]
+
+    def test_get_article_offline_fallback(self, legi_db, monkeypatch):
+        monkeypatch.setenv("API_BACKEND", "offline")
+        monkeypatch.setenv("LEGI_INDEX_PATH", legi_db)
+        article = get_article("Code civil", "1240-2", None, None)
+        assert article["id"] == "LEGIARTI000032041571", article
+        article = get_article("CSI", "L622-7", None, None)
+        assert article["status_code"] == 404, article
+
+    def test_wrong_backend(self, monkeypatch):
+        monkeypatch.setenv("API_BACKEND", "ftp")
+        with pytest.raises(ValueError):
+            get_article("CCIV", "1240", None, None)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import pytest
+
+from .context import parsing
+from parsing import parse_doc
+from matching import get_matching_results_dict
+from word_doc import CompoundFile, iter_doc_paragraphs, is_ole_file
+from .test_001_parsing import TEST_DIR, archive_test_file
+
+DOCUMENTS_DIR = os.path.join(TEST_DIR, "documents")
+
+
+class TestCompoundFile:
+    def test_streams(self):
+        with open(os.path.join(DOCUMENTS_DIR, "newtest.doc"), "rb") as f:
+            ole = CompoundFile(f.read())
+        assert ole.open_stream("WordDocument")[:2] == b"\xec\xa5"
+        with pytest.raises(KeyError):
+            ole.open_stream("Data")
+
+    def test_not_ole(self):
+        file_path = os.path.join(DOCUMENTS_DIR, "newtest.docx")
+        assert not is_ole_file(file_path)
+        with pytest.raises(ValueError):
+            list(iter_doc_paragraphs(file_path))
+
+
+    def test_circular_mini_chain(self):
+        with open(os.path.join(DOCUMENTS_DIR, "newtest.doc"), "rb") as f:
+            ole = CompoundFile(f.read())
+        ole.mini_fat = (1, 0)
+        with pytest.raises(ValueError):
+            ole._read_mini_chain(0, 1 << 20)
+
+    @pytest.mark.parametrize("size", [100, 600, 2000, 5000])
+    def test_truncated(self, size):
+        with open(os.path.join(DOCUMENTS_DIR, "newtest.doc"), "rb") as f:
+            data = f.read()[:size]
+        with pytest.raises(ValueError):
+            list(iter_doc_paragraphs(data))
+
+
+class TestWordDoc:
+    @pytest.mark.parametrize(
+        "input_expected",
+        [
+            (
+                "newtest.doc",
+                "C’est la solution posée par l’article 1120 du Code civil. Voir aussi, dans le même sens, art. 2288 C. civ.",
+                "Art. L.124-1 du Code de l'environnement.",
+            ),
+            (
+                "testnew.doc",
+                "C’est la solution posée dans le Code civil article 1120. Voir aussi, dans le même sens, C. civ.  art. 2288 ",
+                "Code de l'environnement  Art. L.124-1",
+            ),
+        ],
+    )
+    def test_paragraphs(self, input_expected):
+        file_path, first, last = input_expected
+        paragraphs = [
+            p for p in iter_doc_paragraphs(os.path.join(DOCUMENTS_DIR, file_path)) if p != ""
+        ]
+        assert paragraphs[0] == first
+        assert paragraphs[-1] == last
+
+    @pytest.mark.parametrize(
+        "input_expected", [("newtest", "article_code"), ("testnew", "code_article")]
+    )
+    def test_same_references_as_docx(self, input_expected):
+        doc_name, pattern_format = input_expected
+        results = []
+        for doc_ext in ["doc", "docx"]:
+            abspath = archive_test_file(f"{doc_name}.{doc_ext}")
+            results.append(
+                get_matching_results_dict(parse_doc(abspath), None, pattern_format, "scan")
+            )
+        assert results[0] == results[1]
+        assert sum(len(refs) for refs in results[0].values()) == 40
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import io
+import os
+import docx
+import pytest
+
+from .context import parsing
+import document_cache
+import matching
+from article_cache import MemoryCache, SQLiteCache
+from document_cache import (
+    get_document_id,
+    get_document_references,
+    get_incremental_references,
+    hash_document,
+    set_document_cache,
+)
+from .test_001_parsing import TEST_DIR, archive_test_file
+
+
+@pytest.fixture
+def cache():
+    cache = MemoryCache(max_size=64, ttl=60)
+    set_document_cache(cache)
+    yield cache
+    set_document_cache(None)
+
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    calls = []
+
+    def counting_parse_doc(file_path, filename=None):
+        calls.append(filename)
+        return parsing.parse_doc(file_path, filename=filename)
+
+    monkeypatch.setattr(document_cache, "parse_doc", counting_parse_doc)
+    return calls
+
+
+def read_test_file(file_path):
+    with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+        return f.read()
+
+
+class TestHashDocument:
+    def test_same_digest_for_path_bytes_and_file(self):
+        abspath = os.path.join(TEST_DIR, "newtest.pdf")
+        content = read_test_file("newtest.pdf")
+        with open(abspath, "rb") as f:
+            assert hash_document(abspath) == hash_document(content) == hash_document(f)
+        assert hash_document(content) != hash_document(read_test_file("testnew.pdf"))
+
+
+class TestDocumentReferences:
+    def test_reupload_skips_parsing(self, cache, parse_calls):
+        content = read_test_file("newtest.docx")
+        first = get_document_references(content, None, "article_code", "newtest.docx")
+        second = get_document_references(content, None, "article_code", "thesis.docx")
+        assert first == second
+        assert len(first) > 0
+        assert parse_calls == ["newtest.docx"]
+
+    def test_options_reuse_text(self, cache, parse_calls):
+        content = read_test_file("newtest.docx")
+        all_codes = get_document_references(content, None, "article_code", "newtest.docx")
+        civil = get_document_references(content, ["CCIV"], "article_code", "newtest.docx")
+        assert {ref[0] for ref in civil} == {"CCIV"}
+        assert len(civil) < len(all_codes)
+        # même texte: une seule analyse du document
+        assert len(parse_calls) == 1
+        assert cache.stats()["size"] == 3
+
+    def test_parser_config_in_key(self, cache, parse_calls, monkeypatch):
+        content = read_test_file("newtest.docx")
+        get_document_references(content, None, "article_code", "newtest.docx")
+        monkeypatch.setattr(parsing, "PARSE_ALL_PARTS", True)
+        get_document_references(content, None, "article_code", "newtest.docx")
+        get_document_references(content, None, "article_code", "newtest.docx")
+        assert len(parse_calls) == 2
+        content = read_test_file("newtest.pdf")
+        get_document_references(content, None, "article_code", "newtest.pdf")
+        monkeypatch.setitem(parsing.PARSER_CONFIG, "pdf", "pdfminer")
+        get_document_references(content, None, "article_code", "newtest.pdf")
+        assert len(parse_calls) == 4
+
+    def test_engine_in_key(self, cache, parse_calls, monkeypatch):
+        content = read_test_file("newtest.docx")
+        default = get_document_references(content, None, "article_code", "newtest.docx")
+        # le moteur par défaut et le même moteur donné explicitement: une seule entrée
+        assert default == get_document_references(
+            content, None, "article_code", "newtest.docx", matching.MATCHING_ENGINE
+        )
+        assert cache.stats()["size"] == 2
+        # un autre moteur par défaut ne reprend pas les références du précédent
+        monkeypatch.setattr(matching, "MATCHING_ENGINE", "scan")
+        get_document_references(content, None, "article_code", "newtest.docx")
+        assert cache.stats()["size"] == 3
+        assert len(parse_calls) == 1
+
+    def test_path_removed(self, cache, parse_calls):
+        for _ in range(2):
+            abspath = archive_test_file("newtest.odt")
+            assert len(get_document_references(abspath)) > 0
+            assert not os.path.exists(abspath)
+        assert len(parse_calls) == 1
+
+    def test_size_bounded(self, parse_calls):
+        set_document_cache(MemoryCache(max_size=2, ttl=60))
+        try:
+            for file_path in ["newtest.docx", "testnew.docx", "newtest.docx"]:
+                get_document_references(read_test_file(file_path), None, "article_code", file_path)
+        finally:
+            set_document_cache(None)
+        assert parse_calls == ["newtest.docx", "testnew.docx", "newtest.docx"]
+
+    def test_sqlite_cache(self, tmp_path, parse_calls):
+        set_document_cache(SQLiteCache(str(tmp_path / "documents.db"), max_size=10, ttl=60))
+        try:
+            content = read_test_file("testnew.odt")
+            first = get_document_references(content, None, "code_article", "testnew.odt")
+            second = get_document_references(content, None, "code_article", "testnew.odt")
+        finally:
+            set_document_cache(None)
+        assert first == second
+        assert len(parse_calls) == 1
+
+
+STREAMED_DOCUMENTS = [
+    "newtest.pdf",
+    "newtest2.pdf",
+    "testnew.pdf",
+    "testnew_highlighted.pdf",
+    "newtest.odt",
+    "testnew.odt",
+    "testnew_highlighted.odt",
+    "HDR_NETTER_V1_07.odt",
+    "newtest.docx",
+    "testnew.docx",
+    "newtest.doc",
+    "testnew.doc",
+]
+
+
+class TestStreamedReferences:
+    @pytest.mark.parametrize("pattern_format", ["article_code", "code_article"])
+    @pytest.mark.parametrize("file_path", STREAMED_DOCUMENTS)
+    def test_same_as_whole_document(self, cache, parse_calls, file_path, pattern_format):
+        content = read_test_file(file_path)
+        full_text = parsing.parse_doc(content, filename=file_path)
+        expected = list(matching.get_code_refs(full_text, None, pattern_format, "scan"))
+        streamed = get_document_references(
+            content, None, pattern_format, file_path, stream=True
+        )
+        assert streamed == expected
+        assert parse_calls == []
+
+    def test_stream_forces_scan(self, cache, parse_calls, monkeypatch):
+        monkeypatch.setattr(matching, "MATCHING_ENGINE", "split")
+        content = read_test_file("newtest.docx")
+        streamed = get_document_references(
+            content, None, "article_code", "newtest.docx", "split", stream=True
+        )
+        # même entrée que le moteur scan sur le texte entier
+        assert streamed == get_document_references(
+            content, None, "article_code", "newtest.docx", "scan"
+        )
+        assert cache.stats()["size"] == 1
+        assert parse_calls == []
+
+    def test_timer(self, cache):
+        stages = {}
+        get_document_references(
+            read_test_file("newtest.pdf"),
+            None,
+            "article_code",
+            "newtest.pdf",
+            timer=stages.__setitem__,
+            stream=True,
+        )
+        assert set(stages) == {"parse", "match"}
+        assert all(seconds >= 0 for seconds in stages.values())
+
+
+def make_docx(paragraphs):
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    content = io.BytesIO()
+    document.save(content)
+    return content.getvalue()
+
+
+VERSION_1 = [
+    "Vu l'article 1240 du Code civil,",
+    "Vu l'article L121-14 du Code de la consommation,",
+    "Sans référence.",
+]
+VERSION_2 = [
+    "Vu l'article 1240 du Code civil,",
+    "Vu l'article L1111-1 du Code du travail,",
+    "Sans référence.",
+    "Vu l'article 1240 du Code civil,",
+]
+
+
+@pytest.fixture
+def match_calls(monkeypatch):
+    calls = []
+    get_code_refs = document_cache.get_code_refs
+
+    def counting_get_code_refs(paragraph, *args):
+        calls.append(paragraph)
+        return get_code_refs(paragraph, *args)
+
+    monkeypatch.setattr(document_cache, "get_code_refs", counting_get_code_refs)
+    return calls
+
+
+class TestIncrementalReferences:
+    def test_first_version(self, cache, match_calls):
+        references, changes = get_incremental_references(make_docx(VERSION_1), filename="arret.docx", document_id="arret")
+        assert [(ref[0], ref[2]) for ref in references] == [("CCIV", "1240"), ("CCONSO", "L121-14")]
+        assert changes["previous"] is False
+        assert changes["paragraphs"] == changes["changed"] == 3
+        assert changes["added"] == [["CCIV", "1240"], ["CCONSO", "L121-14"]]
+        assert changes["removed"] == []
+
+    def test_new_version_only_changed_paragraphs(self, cache, match_calls):
+        get_incremental_references(make_docx(VERSION_1), filename="arret.docx", document_id="arret")
+        match_calls.clear()
+        references, changes = get_incremental_references(make_docx(VERSION_2), filename="arret.docx", document_id="arret")
+        assert match_calls == [VERSION_2[1]]
+        assert [(ref[0], ref[2]) for ref in references] == [
+            ("CCIV", "1240"),
+            ("CTRAV", "L1111-1"),
+            ("CCIV", "1240"),
+        ]
+        assert changes["previous"] is True
+        assert (changes["paragraphs"], changes["changed"]) == (4, 1)
+        assert changes["added"] == [["CTRAV", "L1111-1"]]
+        assert changes["removed"] == [["CCONSO", "L121-14"]]
+
+    def test_documents_are_separate(self, cache, match_calls):
+        get_incremental_references(make_docx(VERSION_1), filename="arret.docx", document_id="arret")
+        _, changes = get_incremental_references(
+            make_docx(VERSION_1), filename="avis.docx", document_id="avis"
+        )
+        assert changes["previous"] is False
+        _, changes = get_incremental_references(
+            make_docx(VERSION_1), filename="avis.docx", document_id="arret"
+        )
+        assert changes["previous"] is True
+        assert changes["changed"] == 0
+
+    def test_owners_are_separate(self, cache, match_calls):
+        alice = get_document_id("alice-token", "memoire.docx")
+        bob = get_document_id("bob-token", "memoire.docx")
+        assert alice != bob
+        assert get_document_id("alice-token", "/tmp/memoire.docx") == alice
+        get_incremental_references(make_docx(VERSION_1), filename="memoire.docx", document_id=alice)
+        _, changes = get_incremental_references(
+            make_docx(VERSION_2), filename="memoire.docx", document_id=bob
+        )
+        assert changes["previous"] is False
+        assert changes["removed"] == []
+
+    def test_document_id_required(self, cache):
+        with pytest.raises(ValueError):
+            get_incremental_references(make_docx(VERSION_1), filename="memoire.docx")
+        with pytest.raises(ValueError):
+            get_document_id("", "memoire.docx")
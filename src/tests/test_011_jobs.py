@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import os
+import sqlite3
+import time
+import pytest
+
+from .context import parsing
+import jobs
+from document_cache import set_document_cache
+from article_cache import MemoryCache
+from jobs import JobQueue, QueueFullError, run_job, start_workers, stop_workers
+from .test_001_parsing import TEST_DIR
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), max_queued=3, timeout=60)
+
+
+@pytest.fixture
+def fake_resolve(monkeypatch):
+    def fake_resolve_unique_articles(references, client_id, client_secret, past=3, future=3):
+        seen = set()
+        for reference in references:
+            if (reference[0], reference[2]) in seen:
+                continue
+            seen.add((reference[0], reference[2]))
+            yield reference, {"article": reference[2], "status": "Pas de modification"}
+
+    monkeypatch.setattr(jobs, "resolve_unique_articles", fake_resolve_unique_articles)
+    set_document_cache(MemoryCache(max_size=16, ttl=60))
+    yield
+    set_document_cache(None)
+
+
+def read_test_file(file_path):
+    with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+        return f.read()
+
+
+class TestJobQueue:
+    def test_fifo(self, queue):
+        first = queue.submit(b"1", "a.pdf", {"past": 1})
+        second = queue.submit(b"2", "b.pdf")
+        job = queue.claim()
+        assert (job["id"], job["document"], job["options"]) == (first, b"1", {"past": 1})
+        assert queue.claim()["id"] == second
+        assert queue.claim() is None
+        assert queue.stats() == {"queued": 0, "running": 2, "done": 0, "failed": 0}
+
+    def test_bounded(self, queue):
+        for _ in range(3):
+            queue.submit(b"", "a.pdf")
+        with pytest.raises(QueueFullError):
+            queue.submit(b"", "a.pdf")
+        # une analyse en cours libère une place dans la file
+        queue.claim()
+        queue.submit(b"", "a.pdf")
+
+    def test_stale_job_requeued(self, queue):
+        job_id = queue.submit(b"", "a.pdf")
+        queue.claim()
+        queue.add_result(job_id, {"reference": ["CCIV", "Code civil", "1240"]})
+        assert queue.claim() is None
+        queue.timeout = -1
+        assert queue.claim()["id"] == job_id
+        job = queue.get(job_id)
+        assert (job["status"], job["progress"], job["results"]) == ("running", 0, [])
+        # les numéros des évènements ne sont pas réutilisés (Last-Event-ID des clients)
+        assert [(e["id"], e["event"]) for e in queue.events(job_id)] == [(2, "started")]
+
+    def test_max_attempts(self, queue):
+        job_id = queue.submit(b"", "a.pdf")
+        queue.timeout = -1
+        # le document arrête son processus à chaque exécution
+        assert [queue.claim()["attempt"] for _ in range(3)] == [1, 2, 3]
+        assert queue.claim() is None
+        job = queue.get(job_id)
+        assert (job["status"], job["error"]) == ("failed", "Analyse interrompue 3 fois")
+        assert queue.events(job_id)[-1]["event"] == "finished"
+
+    def test_superseded_writes_ignored(self, queue):
+        job_id = queue.submit(b"", "a.pdf")
+        first = queue.claim()
+        queue.timeout = -1
+        second = queue.claim()
+        assert (first["attempt"], second["attempt"]) == (1, 2)
+        # le premier processus, lent mais toujours en vie, n'écrit plus dans l'analyse
+        result = {"reference": ["CCIV", "Code civil", "1240"]}
+        assert queue.start(job_id, 1, 1, attempt=1) is False
+        assert queue.add_result(job_id, result, attempt=1) is False
+        assert queue.finish(job_id, attempt=1) is False
+        assert queue.start(job_id, 1, 1, attempt=2) is True
+        assert queue.add_result(job_id, result, attempt=2) is True
+        job = queue.get(job_id)
+        assert (job["status"], job["progress"], job["total"]) == ("running", 1, 1)
+        assert queue.finish(job_id, attempt=2) is True
+        assert queue.add_result(job_id, result, attempt=2) is False
+        assert [e["event"] for e in queue.events(job_id)] == [
+            "started",
+            "references",
+            "article",
+            "finished",
+        ]
+
+    def test_previous_schema(self, tmp_path):
+        db_path = str(tmp_path / "old.db")
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                "CREATE TABLE job ("
+                "id TEXT PRIMARY KEY, status TEXT, filename TEXT, options TEXT, "
+                "document BLOB, progress INTEGER, total INTEGER, changes TEXT, "
+                "error TEXT, created_at REAL, updated_at REAL, nb_events INTEGER)"
+            )
+        queue = JobQueue(db_path)
+        queue.submit(b"", "a.pdf")
+        assert queue.claim()["attempt"] == 1
+
+    def test_purge(self, queue):
+        job_id = queue.submit(b"", "a.pdf")
+        queue.claim()
+        queue.finish(job_id, error="boom")
+        queue.purge(ttl=60)
+        assert queue.get(job_id)["error"] == "boom"
+        queue.purge(ttl=-1)
+        assert queue.get(job_id) is None
+
+
+class TestRunJob:
+    def test_results(self, queue, fake_resolve):
+        job_id = queue.submit(read_test_file("newtest.docx"), "newtest.docx", {"past": 3})
+        run_job(queue, queue.claim())
+        job = queue.get(job_id)
+        assert job["status"] == "done", job["error"]
+        assert job["progress"] == job["total"] == len(job["results"]) > 0
+        assert job["results"][0]["reference"][0] == "CCIV"
+
+    def test_failed(self, queue, fake_resolve):
+        job_id = queue.submit(b"not a pdf", "document.pdf")
+        run_job(queue, queue.claim())
+        job = queue.get(job_id)
+        assert job["status"] == "failed"
+        assert job["error"]
+
+    def test_incremental(self, queue, fake_resolve):
+        content = read_test_file("newtest.docx")
+        for _ in range(2):
+            job_id = queue.submit(
+                content, "newtest.docx", {"incremental": True, "document_id": "newtest"}
+            )
+            run_job(queue, queue.claim())
+        changes = queue.get(job_id)["changes"]
+        assert changes["previous"] is True
+        assert changes["changed"] == 0
+
+
+class TestWorkers:
+    def test_worker_process(self, queue, fake_resolve):
+        job_id = queue.submit(read_test_file("newtest.odt"), "newtest.odt")
+        workers = start_workers(1, queue.db_path)
+        try:
+            deadline = time.time() + 60
+            while queue.get(job_id)["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(0.1)
+        finally:
+            stop_workers(workers)
+        job = queue.get(job_id)
+        assert job["status"] == "done", job["error"]
+        assert job["total"] > 0
+        assert not any(process.is_alive() for process, _ in workers)
+
+    @pytest.mark.skipif(jobs.fcntl is None, reason="verrou fcntl")
+    def test_workers_started_once(self, queue, monkeypatch):
+        class Process:
+            def is_alive(self):
+                return True
+
+        started = []
+
+        def fake_start_workers(nb_workers, db_path):
+            started.append(nb_workers)
+            return [(Process(), None) for _ in range(nb_workers)]
+
+        monkeypatch.setattr(jobs, "JOB_WORKERS", 2)
+        monkeypatch.setattr(jobs, "_WORKERS", [])
+        monkeypatch.setattr(jobs, "_WORKERS_OWNER", None)
+        monkeypatch.setattr(jobs, "start_workers", fake_start_workers)
+        # un autre processus du serveur web a lancé les processus de vérification
+        with open(queue.db_path + ".workers", "a") as other:
+            jobs.fcntl.flock(other, jobs.fcntl.LOCK_EX | jobs.fcntl.LOCK_NB)
+            assert jobs.ensure_workers(queue.db_path) == []
+        assert started == []
+        # verrou libéré (processus arrêté): ce processus les lance, une seule fois
+        assert len(jobs.ensure_workers(queue.db_path)) == 2
+        assert len(jobs.ensure_workers(queue.db_path)) == 2
+        assert started == [2]
+        jobs._WORKERS_OWNER[0].close()
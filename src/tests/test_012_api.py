@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import io
+import json
+import os
+import threading
+import pytest
+
+from .context import app
+import api
+import jobs
+from article_cache import MemoryCache
+from document_cache import set_document_cache
+from request_api import new_article
+from .test_001_parsing import TEST_DIR
+from .test_006_integration import call_app, get_app, job_queue
+
+TEXT = "Vu l'article 1240 du Code civil et l'article L121-14 du Code de la consommation, art. 1240 C. civ."
+
+
+@pytest.fixture(autouse=True)
+def fake_resolve(monkeypatch):
+    def fake_resolve_unique_articles(references, client_id, client_secret, past=3, future=3):
+        occurrences = {}
+        for reference in references:
+            key = (reference[0], reference[2])
+            occurrences[key] = occurrences.get(key, 0) + 1
+        for reference in references:
+            key = (reference[0], reference[2])
+            if key not in occurrences:
+                continue
+            article = new_article(reference[0], reference[2])
+            article.update(
+                {
+                    "status_code": 204,
+                    "status": "Pas de modification",
+                    "id": "LEGIARTI000032041571",
+                    "url": "https://www.legifrance.gouv.fr/codes/article_lc/LEGIARTI000032041571",
+                    "texte": "Tout fait quelconque",
+                    "date_debut": "01/10/2016",
+                    "date_fin": "01/01/2999",
+                    "occurrences": occurrences.pop(key),
+                }
+            )
+            yield reference, article
+
+    monkeypatch.setattr(jobs, "resolve_unique_articles", fake_resolve_unique_articles)
+    set_document_cache(MemoryCache(max_size=16, ttl=60))
+    yield
+    set_document_cache(None)
+
+
+def post(body, content_type, query="", accept="application/json"):
+    return call_app(
+        {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": "/api/references",
+            "QUERY_STRING": query,
+            "CONTENT_TYPE": content_type,
+            "CONTENT_LENGTH": str(len(body)),
+            "HTTP_ACCEPT": accept,
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.url_scheme": "http",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+        }
+    )
+
+
+def post_json(payload, query="", accept="application/json"):
+    return post(json.dumps(payload).encode(), "application/json", query, accept)
+
+
+def run_jobs(queue):
+    job = queue.claim()
+    while job is not None:
+        jobs.run_job(queue, job)
+        job = queue.claim()
+
+
+def get_results(queue, status, body):
+    """Exécuter l'analyse déposée puis lire ses résultats"""
+    assert status == 202
+    job_id = json.loads(body)["id"]
+    run_jobs(queue)
+    status, headers, body = get_app(api.get_job_url(job_id))
+    assert status == 200
+    return json.loads(body)
+
+
+@pytest.fixture
+def worker(job_queue):
+    stop = threading.Event()
+    thread = threading.Thread(target=jobs.work, args=(job_queue.db_path, stop, 0.01))
+    thread.start()
+    yield
+    stop.set()
+    thread.join()
+
+
+def read_test_file(file_path):
+    with open(os.path.join(TEST_DIR, file_path), "rb") as f:
+        return f.read()
+
+
+class TestTextReferences:
+    def test_schema(self, job_queue):
+        status, headers, body = post_json({"text": TEXT})
+        assert status == 202
+        assert headers["Content-Type"] == "application/json"
+        job = json.loads(body)
+        assert (job["status"], headers["Location"]) == ("queued", api.get_job_url(job["id"]))
+        response = get_results(job_queue, status, body)
+        assert (response["status"], response["progress"], response["total"]) == ("done", 2, 2)
+        assert response["references"] == 3
+        assert [(r["code"], r["article"], r["occurrences"]) for r in response["results"]] == [
+            ("CCIV", "1240", 2),
+            ("CCONSO", "L121-14", 1),
+        ]
+        result = response["results"][0]
+        assert tuple(result) == api.RESULT_FIELDS
+        assert result["code_name"] == "Code civil"
+        assert (result["start_date"], result["end_date"]) == ("2016-10-01", "2999-01-01")
+        assert result["text"] == "Tout fait quelconque"
+
+    def test_options(self, job_queue):
+        status, _, body = post_json({"text": TEXT, "codes": ["CCONSO"]})
+        response = get_results(job_queue, status, body)
+        assert [r["code"] for r in response["results"]] == ["CCONSO"]
+        post_json({"text": TEXT}, "codes=CCIV,CCONSO&past=1")
+        job = job_queue.claim()
+        assert job["options"]["selected_codes"] == ["CCIV", "CCONSO"]
+        assert job["options"]["past"] == 1
+        jobs.run_job(job_queue, job)
+        assert job_queue.get(job["id"])["total"] == 2
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            {"text": TEXT, "codes": ["CXYZ"]},
+            {"text": TEXT, "pattern_format": "article"},
+            {"text": TEXT, "past": "trois"},
+            {"text": TEXT, "codes": 5},
+            {"text": TEXT, "codes": ["CCIV", 5]},
+            {"text": 5},
+            {"text": ["article 1240 du Code civil"]},
+            {"codes": ["CCIV"]},
+            ["not", "an", "object"],
+        ],
+    )
+    def test_bad_request(self, job_queue, payload):
+        status, _, body = post_json(payload)
+        assert status == 400
+        assert json.loads(body)["error"]
+        assert job_queue.claim() is None
+
+    def test_form_text(self, job_queue):
+        body = f"text={TEXT}".encode()
+        status, _, body = post(body, "application/x-www-form-urlencoded")
+        assert get_results(job_queue, status, body)["references"] == 3
+
+    def test_queue_full(self, job_queue):
+        for _ in range(2):
+            assert post_json({"text": TEXT})[0] == 202
+        status, headers, _ = post_json({"text": TEXT})
+        assert status == 503
+        assert headers["Retry-After"] == "30"
+
+    def test_unknown_job(self, job_queue):
+        assert get_app(api.get_job_url("unknown"))[0] == 404
+
+
+class TestDocumentReferences:
+    def test_multipart(self, job_queue):
+        boundary = "codeislow"
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="codes"\r\n\r\nCCIV\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="upload"; filename="newtest.docx"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + read_test_file("newtest.docx") + f"\r\n--{boundary}--\r\n".encode()
+        status, _, body = post(body, f"multipart/form-data; boundary={boundary}")
+        response = get_results(job_queue, status, body)
+        assert response["references"] > 0
+        assert {r["code"] for r in response["results"]} == {"CCIV"}
+
+    def test_raw_body(self, job_queue):
+        content = read_test_file("newtest.pdf")
+        status, _, body = post(content, "application/pdf", "filename=newtest.pdf")
+        assert get_results(job_queue, status, body)["references"] > 0
+        status, _, body = post(content, "application/pdf")
+        assert status == 400
+        status, _, body = post(content, "application/octet-stream", "filename=newtest.rtf")
+        assert status == 400
+
+    @pytest.mark.parametrize(
+        "filename, content",
+        [
+            ("arret.pdf", b"not a pdf"),
+            ("arret.docx", b"PK not a zip"),
+            ("arret.odt", read_test_file("newtest.docx")),
+            ("arret.doc", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(24)),
+        ],
+    )
+    def test_unreadable_document(self, job_queue, filename, content):
+        status, _, body = post(content, "application/octet-stream", f"filename={filename}")
+        assert status == 400
+        assert json.loads(body)["error"].startswith("Document illisible")
+        assert job_queue.claim() is None
+
+
+class TestNdjson:
+    def test_stream(self, job_queue, worker):
+        status, headers, body = post_json({"text": TEXT}, accept="application/x-ndjson")
+        assert status == 200
+        assert headers["Content-Type"] == "application/x-ndjson"
+        assert headers["Location"].startswith("/api/references/")
+        lines = body.splitlines()
+        assert [json.loads(line)["article"] for line in lines] == ["1240", "L121-14"]
+        assert post_json({"text": TEXT}, "format=ndjson")[2] == body
+
+    def test_error_line(self, job_queue, worker, monkeypatch):
+        def failing_resolve(references, *args):
+            yield references[0], {
+                **new_article(references[0][0], references[0][2]),
+                "occurrences": 1,
+            }
+            raise Exception("Error 500: Internal Server Error")
+
+        monkeypatch.setattr(jobs, "resolve_unique_articles", failing_resolve)
+        lines = post_json({"text": TEXT}, "format=ndjson")[2].splitlines()
+        assert json.loads(lines[0])["article"] == "1240"
+        assert json.loads(lines[-1]) == {"error": "Error 500: Internal Server Error"}
+
+    def test_bounded_stream(self, job_queue, monkeypatch):
+        monkeypatch.setattr(jobs, "JOB_STREAM_DURATION", 0.1)
+        # pas de processus de vérification: l'analyse reste en attente
+        body = post_json({"text": TEXT}, "format=ndjson")[2]
+        line = json.loads(body)
+        assert line["status"] == "queued"
+        path, query = line["next"].split("?")
+        assert path == api.get_job_url(line["id"])
+        run_jobs(job_queue)
+        lines = get_app(path, query)[2].splitlines()
+        assert [json.loads(line)["article"] for line in lines] == ["1240", "L121-14"]
+        # reprise après le premier résultat
+        query = query.replace("last_event_id=-1", "last_event_id=2")
+        lines = get_app(path, query)[2].splitlines()
+        assert [json.loads(line)["article"] for line in lines] == ["L121-14"]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import io
+import os
+import shutil
+import zipfile
+import pytest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from .context import parsing
+import batch
+from article_cache import MemoryCache
+from document_cache import set_document_cache
+from request_api import new_article
+from .test_001_parsing import TEST_DIR
+
+DOCUMENTS = ["newtest.docx", "newtest.odt", "contrats/newtest.pdf"]
+
+
+@pytest.fixture(autouse=True)
+def fake_articles(monkeypatch):
+    calls = []
+
+    def fake_get_articles(references, client_id, client_secret, past_year_nb=3, future_year_nb=3):
+        references = list(references)
+        calls.append(references)
+        articles = {}
+        for code, article_number in references:
+            article = new_article(code, article_number)
+            article.update({"status_code": 204, "status": "Pas de modification"})
+            articles[(code, article_number)] = article
+        stats = {"references": len(references), "http_calls": 0, "estimated_saved_calls": 0}
+        return articles, stats
+
+    monkeypatch.setattr(batch, "get_articles", fake_get_articles)
+    set_document_cache(MemoryCache(max_size=16, ttl=60))
+    yield calls
+    set_document_cache(None)
+
+
+def make_zip():
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w") as archive:
+        for name in DOCUMENTS:
+            archive.write(os.path.join(TEST_DIR, os.path.basename(name)), name)
+        archive.writestr("__MACOSX/._newtest.docx", b"")
+        archive.writestr("notes.txt", b"Article 1240 du Code civil")
+        archive.writestr("casse.pdf", b"not a pdf")
+    return content.getvalue()
+
+
+class TestRunBatch:
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_zip(self, fake_articles, workers):
+        report = batch.run_batch(make_zip(), workers=workers)
+        names = [document["name"] for document in report["documents"]]
+        assert names == sorted(DOCUMENTS + ["casse.pdf"])
+        documents = {document["name"]: document for document in report["documents"]}
+        assert documents["casse.pdf"]["error"]
+        assert documents["newtest.docx"]["references"] > 0
+        # une seule résolution pour tout le corpus, sans doublons
+        assert len(fake_articles) == 1
+        assert len(fake_articles[0]) == len(set(fake_articles[0]))
+        stats = report["stats"]
+        assert (stats["documents"], stats["failed"]) == (4, 1)
+        assert stats["unique_references"] == len(report["articles"]) == len(fake_articles[0])
+        assert stats["references"] == sum(doc["references"] for doc in report["documents"])
+        assert stats["documents_per_minute"] > 0
+        for article in report["articles"]:
+            key = (article["code"], article["article"])
+            citing = [
+                doc
+                for doc in report["documents"]
+                if key in {(r["code"], r["article"]) for r in doc["results"]}
+            ]
+            assert article["documents"] == [doc["name"] for doc in citing]
+            assert article["occurrences"] == sum(
+                r["occurrences"]
+                for doc in citing
+                for r in doc["results"]
+                if (r["code"], r["article"]) == key
+            )
+
+    def test_directory(self, tmp_path):
+        for name in DOCUMENTS:
+            os.makedirs(os.path.dirname(tmp_path / name), exist_ok=True)
+            shutil.copy(os.path.join(TEST_DIR, os.path.basename(name)), tmp_path / name)
+        (tmp_path / ".~lock.newtest.odt#").write_bytes(b"")
+        report = batch.run_batch(str(tmp_path), selected_codes=["CCIV"], workers=1)
+        assert [document["name"] for document in report["documents"]] == sorted(DOCUMENTS)
+        assert {article["code"] for article in report["articles"]} == {"CCIV"}
+        # les documents du répertoire ne sont pas supprimés
+        assert all(os.path.exists(tmp_path / name) for name in DOCUMENTS)
+
+    def test_not_a_zip(self):
+        with pytest.raises(ValueError):
+            batch.run_batch(b"not a zip", workers=1)
+
+
+class TestExtractedReferences:
+    def documents(self):
+        return [(name, os.path.join(TEST_DIR, os.path.basename(name))) for name in DOCUMENTS] + [
+            ("casse.pdf", b"not a pdf"),
+            ("vide.odt", None),
+        ]
+
+    def test_broken_pool(self, monkeypatch):
+        class BrokenExecutor:
+            # 1re analyse terminée, 2e interrompue, le pool s'arrête à la 3e
+            def __init__(self, max_workers):
+                self.submitted = 0
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def submit(self, fn, *args):
+                self.submitted += 1
+                future = Future()
+                if self.submitted == 1:
+                    future.set_result(fn(*args))
+                elif self.submitted == 2:
+                    future.set_exception(BrokenProcessPool("process terminated"))
+                else:
+                    raise BrokenProcessPool("process terminated")
+                return future
+
+        monkeypatch.setattr(batch, "ProcessPoolExecutor", BrokenExecutor)
+        extracted = list(batch.iter_extracted_references(self.documents(), workers=2))
+        # chaque document est analysé une seule fois, les documents en attente sont relancés
+        assert sorted(name for name, _, _ in extracted) == sorted(
+            name for name, _ in self.documents()
+        )
+        errors = {name for name, _, error in extracted if error}
+        assert errors == {"casse.pdf", "vide.odt"}
+
+    def test_daemon_process_serial(self, monkeypatch):
+        class DaemonProcess:
+            daemon = True
+
+        def fail(*args, **kwargs):
+            raise AssertionError("daemonic processes are not allowed to have children")
+
+        monkeypatch.setattr(batch.multiprocessing, "current_process", DaemonProcess)
+        monkeypatch.setattr(batch, "ProcessPoolExecutor", fail)
+        extracted = list(batch.iter_extracted_references(self.documents(), workers=2))
+        assert [name for name, _, _ in extracted] == [name for name, _ in self.documents()]
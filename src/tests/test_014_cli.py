@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import csv
+import io
+import json
+import os
+import shutil
+import pytest
+
+from .context import codeislow
+import request_api
+from request_api import new_article, set_article_content
+from .test_001_parsing import TEST_DIR
+
+
+@pytest.fixture(autouse=True)
+def fake_get_article(monkeypatch):
+    def fake(
+        code,
+        article_number,
+        client_id,
+        client_secret,
+        past_year_nb=3,
+        future_year_nb=3,
+        timer=None,
+    ):
+        article = new_article(code, article_number)
+        content = {
+            "texte": "Tout fait quelconque",
+            "url": "https://www.legifrance.gouv.fr/codes/article_lc/LEGIARTI000032041571",
+            "dateDebut": 1475323200000,
+            "dateFin": 32472144000000,
+        }
+        return set_article_content(article, content, past_year_nb, future_year_nb, timer)
+
+    monkeypatch.setattr(codeislow, "get_article", fake)
+
+
+@pytest.fixture
+def documents(tmp_path):
+    for name in ("newtest.docx", "newtest.odt"):
+        shutil.copy(os.path.join(TEST_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+def run(*argv):
+    output = io.StringIO()
+    exit_code = codeislow.cli([str(arg) for arg in argv], output)
+    return exit_code, output.getvalue()
+
+
+class TestCli:
+    def test_ndjson(self, documents):
+        exit_code, output = run(documents / "*.docx", "--codes", "CCIV", "--format", "ndjson")
+        assert exit_code == 0
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert rows
+        assert {row["code"] for row in rows} == {"CCIV"}
+        assert {row["file"] for row in rows} == {str(documents / "newtest.docx")}
+        assert rows[0]["start_date"] == "2016-10-01"
+        # les documents ne sont pas supprimés
+        assert os.path.exists(documents / "newtest.docx")
+
+    def test_json_and_csv(self, documents):
+        exit_code, output = run(documents / "newtest.*", "--format", "json")
+        rows = json.loads(output)
+        assert {row["file"] for row in rows} == {
+            str(documents / "newtest.docx"),
+            str(documents / "newtest.odt"),
+        }
+        exit_code, output = run(documents / "newtest.*")
+        csv_rows = list(csv.DictReader(io.StringIO(output)))
+        assert [(r["file"], r["code"], r["article"]) for r in csv_rows] == [
+            (r["file"], r["code"], r["article"]) for r in rows
+        ]
+
+    def test_errors(self, documents, tmp_path):
+        (documents / "broken.pdf").write_bytes(b"not a pdf")
+        exit_code, output = run(
+            documents / "broken.pdf", tmp_path / "missing.docx", "--format", "ndjson"
+        )
+        assert exit_code == 1
+        rows = [json.loads(line) for line in output.splitlines()]
+        assert [row["file"] for row in rows] == [
+            str(documents / "broken.pdf"),
+            str(tmp_path / "missing.docx"),
+        ]
+        assert all(row["error"] for row in rows)
+
+    def test_output_and_profile(self, documents, capsys):
+        get_validity_status = request_api.get_validity_status
+        output_path = documents / "results.csv"
+        exit_code, output = run(documents / "newtest.odt", "-o", output_path, "--profile")
+        assert exit_code == 0
+        assert output == ""
+        with open(output_path, encoding="utf-8") as f:
+            assert len(list(csv.DictReader(f))) > 0
+        stages = {line.split()[0]: line.split() for line in capsys.readouterr().err.splitlines()}
+        assert set(stages) == set(codeislow.Profile.STAGES) | {"total"}
+        assert int(stages["validate"][3]) > 0
+        # le profil est passé au pipeline, request_api n'est pas modifié
+        assert request_api.get_validity_status is get_validity_status
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# filename: word_doc.py
+"""
+Module de lecture des documents Word 97-2003 (.doc)
+
+Les fichiers .doc sont des conteneurs OLE2 (Compound File Binary, [MS-CFB])
+dont le flux WordDocument contient le texte ([MS-DOC]).
+Le texte est lu directement dans ces flux, sans suite bureautique:
+
+- CompoundFile: lecture des flux d'un conteneur OLE2
+- iter_doc_pieces: les morceaux de texte du document dans l'ordre (table des pièces)
+- iter_doc_paragraphs: le texte de chaque paragraphe du corps du document
+"""
+
+import struct
+
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+# Valeurs spéciales de la table d'allocation (FAT)
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+# Signature du FIB (File Information Block) en tête du flux WordDocument
+WORD_SIGNATURE = 0xA5EC
+
+# Caractères de contrôle du texte Word
+PARAGRAPH_MARKS = ("\r", "\x07", "\x0c")  # fin de paragraphe, de cellule, saut de page
+FIELD_BEGIN, FIELD_SEPARATOR, FIELD_END = "\x13", "\x14", "\x15"
+REPLACEMENTS = {
+    "\x0b": " ",  # saut de ligne
+    "\x1e": "-",  # trait d'union insécable
+    "\x1f": "",  # trait d'union conditionnel
+    "\x01": "",  # image
+    "\x08": "",  # objet dessiné
+    "\x02": "",  # appel de note
+    "\x05": "",  # commentaire
+}
+
+
+def is_ole_file(file_path):
+    """Le fichier est-il un conteneur OLE2 ?"""
+    with open(file_path, "rb") as f:
+        return f.read(len(OLE_SIGNATURE)) == OLE_SIGNATURE
+
+
+class CompoundFile:
+    """
+    Conteneur OLE2 (Compound File Binary) en lecture seule
+
+    Arguments
+    ---------
+    data: bytes
+        le contenu du fichier
+    Raises
+    ------
+    ValueError:
+        le fichier n'est pas un conteneur OLE2, il est tronqué ou ses chaînes sont circulaires
+    """
+
+    def __init__(self, data):
+        if data[:8] != OLE_SIGNATURE:
+            raise ValueError("Fichier .doc incorrect: ce n'est pas un document Word 97-2003")
+        try:
+            self._read_header(data)
+        except (struct.error, IndexError):
+            raise ValueError("Fichier .doc incorrect: document tronqué")
+
+    def _read_header(self, data):
+        self.data = data
+        self.sector_size = 1 << struct.unpack_from("<H", data, 0x1E)[0]
+        self.mini_sector_size = 1 << struct.unpack_from("<H", data, 0x20)[0]
+        (
+            self.first_dir_sector,
+            _,
+            self.mini_stream_cutoff,
+            first_mini_fat,
+            nb_mini_fat,
+            first_difat,
+            nb_difat,
+        ) = struct.unpack_from("<7I", data, 0x30)
+        self.fat = self._read_fat(first_difat, nb_difat)
+        self.entries = self._read_directory()
+        root = self.entries[0]
+        self.mini_stream = self._read_chain(root["start"], root["size"])
+        mini_fat = self._read_chain(first_mini_fat) if nb_mini_fat else b""
+        self.mini_fat = struct.unpack(f"<{len(mini_fat) // 4}I", mini_fat)
+
+    def _sector(self, sector):
+        offset = (sector + 1) * self.sector_size
+        return self.data[offset : offset + self.sector_size]
+
+    def _read_fat(self, first_difat, nb_difat):
+        # les secteurs de la FAT: 109 dans l'en-tête, puis la chaîne DIFAT
+        fat_sectors = list(struct.unpack_from("<109I", self.data, 0x4C))
+        sector = first_difat
+        per_sector = self.sector_size // 4
+        seen = set()
+        for _ in range(nb_difat):
+            if sector in (END_OF_CHAIN, FREE_SECTOR):
+                break
+            if sector in seen:
+                raise ValueError("Fichier .doc incorrect: chaîne de secteurs circulaire")
+            seen.add(sector)
+            difat = struct.unpack(f"<{per_sector}I", self._sector(sector))
+            fat_sectors.extend(difat[:-1])
+            sector = difat[-1]
+        fat = []
+        for sector in fat_sectors:
+            if sector == FREE_SECTOR:
+                continue
+            fat.extend(struct.unpack(f"<{per_sector}I", self._sector(sector)))
+        return fat
+
+    def _read_chain(self, sector, size=None):
+        chunks = []
+        seen = set()
+        while sector not in (END_OF_CHAIN, FREE_SECTOR) and sector < len(self.fat):
+            if sector in seen:
+                raise ValueError("Fichier .doc incorrect: chaîne de secteurs circulaire")
+            seen.add(sector)
+            chunks.append(self._sector(sector))
+            sector = self.fat[sector]
+        data = b"".join(chunks)
+        return data if size is None else data[:size]
+
+    def _read_mini_chain(self, sector, size):
+        chunks = []
+        seen = set()
+        while sector not in (END_OF_CHAIN, FREE_SECTOR) and sector < len(self.mini_fat):
+            if sector in seen:
+                raise ValueError("Fichier .doc incorrect: chaîne de secteurs circulaire")
+            seen.add(sector)
+            offset = sector * self.mini_sector_size
+            chunks.append(self.mini_stream[offset : offset + self.mini_sector_size])
+            sector = self.mini_fat[sector]
+        return b"".join(chunks)[:size]
+
+    def _read_directory(self):
+        directory = self._read_chain(self.first_dir_sector)
+        entries = []
+        for offset in range(0, len(directory) - 127, 128):
+            name_size, entry_type = struct.unpack_from("<HB", directory, offset + 64)
+            start, size = struct.unpack_from("<II", directory, offset + 116)
+            entries.append(
+                {
+                    "name": directory[offset : offset + max(name_size - 2, 0)].decode(
+                        "utf-16-le", "replace"
+                    ),
+                    "type": entry_type,
+                    "start": start,
+                    "size": size,
+                }
+            )
+        return entries
+
+    def open_stream(self, name):
+        """
+        Lire un flux du conteneur
+
+        Arguments
+        ---------
+        name: str
+            le nom du flux eg. WordDocument
+        Returns
+        -------
+        data: bytes
+            le contenu du flux
+        Raises
+        ------
+        KeyError:
+            le flux n'existe pas
+        """
+        for entry in self.entries:
+            # type 2: flux
+            if entry["type"] == 2 and entry["name"] == name:
+                if entry["size"] < self.mini_stream_cutoff:
+                    return self._read_mini_chain(entry["start"], entry["size"])
+                return self._read_chain(entry["start"], entry["size"])
+        raise KeyError(name)
+
+
+def iter_doc_pieces(data):
+    """
+    Les morceaux de texte du corps d'un document Word 97-2003
+
+    Le texte est décrit par la table des pièces (Clx) du flux 0Table ou 1Table:
+    chaque pièce est stockée en cp1252 (compressée) ou en UTF-16.
+
+    Arguments
+    ---------
+    data: bytes
+        le contenu du fichier .doc
+    Yields
+    ------
+    piece: str
+        le texte de chaque pièce, limité au corps du document (sans notes ni en-têtes)
+    Raises
+    ------
+    ValueError:
+        le document n'est pas un document Word 97-2003, il est chiffré ou tronqué
+    """
+    try:
+        yield from _iter_doc_pieces(data)
+    except (struct.error, IndexError):
+        raise ValueError("Fichier .doc incorrect: document tronqué")
+
+
+def _iter_doc_pieces(data):
+    ole = CompoundFile(data)
+    try:
+        word = ole.open_stream("WordDocument")
+    except KeyError:
+        raise ValueError("Fichier .doc incorrect: flux WordDocument absent")
+    ident, _, _, _, _, flags = struct.unpack_from("<6H", word, 0)
+    if ident != WORD_SIGNATURE:
+        raise ValueError("Fichier .doc incorrect: ce n'est pas un document Word 97-2003")
+    if flags & 0x0100:
+        raise ValueError("Fichier .doc chiffré: impossible d'en lire le texte")
+    table = ole.open_stream("1Table" if flags & 0x0200 else "0Table")
+    # FIB: FibBase (32 octets), fibRgW, fibRgLw puis fibRgFcLcb
+    offset = 32
+    csw = struct.unpack_from("<H", word, offset)[0]
+    offset += 2 + csw * 2
+    cslw = struct.unpack_from("<H", word, offset)[0]
+    # ccpText: nombre de caractères du corps du document
+    text_length = struct.unpack_from("<i", word, offset + 2 + 3 * 4)[0]
+    offset += 2 + cslw * 4 + 2
+    # fcClx/lcbClx: 34e couple de fibRgFcLcb97
+    fc_clx, lcb_clx = struct.unpack_from("<II", word, offset + 33 * 8)
+    clx = table[fc_clx : fc_clx + lcb_clx]
+    # ignorer les Prc (0x01) jusqu'à la Pcdt (0x02)
+    position = 0
+    while position < len(clx) and clx[position] == 0x01:
+        position += 3 + struct.unpack_from("<h", clx, position + 1)[0]
+    if position >= len(clx) or clx[position] != 0x02:
+        raise ValueError("Fichier .doc incorrect: table des pièces absente")
+    lcb = struct.unpack_from("<I", clx, position + 1)[0]
+    plc = clx[position + 5 : position + 5 + lcb]
+    nb_pieces = (lcb - 4) // 12
+    cps = struct.unpack_from(f"<{nb_pieces + 1}I", plc, 0)
+    remaining = text_length
+    for i in range(nb_pieces):
+        if remaining <= 0:
+            break
+        fc = struct.unpack_from("<I", plc, (nb_pieces + 1) * 4 + i * 8 + 2)[0]
+        length = min(cps[i + 1] - cps[i], remaining)
+        remaining -= length
+        if fc & 0x40000000:
+            start = (fc & 0x3FFFFFFF) // 2
+            yield word[start : start + length].decode("cp1252", "replace")
+        else:
+            yield word[fc : fc + 2 * length].decode("utf-16-le", "replace")
+
+
+def iter_doc_paragraphs(file_path):
+    """
+    Extraire le texte d'un document Word 97-2003 paragraphe par paragraphe
+
+    Les codes des champs (HYPERLINK...) sont ignorés, seul leur résultat est conservé.
+
+    Arguments
+    ---------
+    file_path: str or bytes
+        absolute filepath of the document or its content
+    Yields
+    ------
+    paragraph: str
+        the text of each paragraph
+    """
+    if isinstance(file_path, (bytes, bytearray, memoryview)):
+        data = bytes(file_path)
+    else:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    paragraph = []
+    # pour chaque champ ouvert: True tant qu'on est dans son code
+    fields = []
+    for piece in iter_doc_pieces(data):
+        for char in piece:
+            if char == FIELD_BEGIN:
+                fields.append(True)
+            elif char == FIELD_SEPARATOR:
+                if fields:
+                    fields[-1] = False
+            elif char == FIELD_END:
+                if fields:
+                    fields.pop()
+            elif fields and fields[-1]:
+                continue
+            elif char in PARAGRAPH_MARKS:
+                yield "".join(paragraph)
+                paragraph = []
+            else:
+                paragraph.append(REPLACEMENTS.get(char, char))
+    if paragraph:
+        yield "".join(paragraph)